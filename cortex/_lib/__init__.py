@@ -8,7 +8,7 @@ import logging
 import os
 import pprint
 
-from . import config, exp, log_utils, models
+from . import config, data, exp, log_utils, models, optimizer, scheduler
 from .parsing import default_args, parse_args, update_args
 from .viz import init as viz_init
 
@@ -49,6 +49,40 @@ def find_autoreload(out_path, global_out_path, name):
         return None
 
 
+def _load_states(model, d):
+    '''Loads the states saved with a checkpoint, other than the networks.
+
+    '''
+    # Older checkpoints have no data state.
+    if 'data' in d:
+        data.DATA_HANDLER.load_state_dict(d['data'])
+    # Spares finding the training nets by running the routines.
+    model._training_nets.update(d.get('training_nets', {}))
+    # Older checkpoints have no optimizer or scheduler states.
+    optimizer.load_state_dict(d.get('optimizers', {}))
+    scheduler.load_state_dict(d.get('schedulers', {}))
+
+
+def run_bench_data(args):
+    '''Benchmarks data loading with the data arguments of the command line.
+
+    Args:
+        args: Parsed arguments of the `bench-data` command.
+
+    Returns:
+        dict: The fastest loader settings.
+
+    '''
+    exp.setup_device(args.device)
+
+    data_args = copy.deepcopy(default_args['data'])
+    for k, v in vars(args).items():
+        if v is not None and k.startswith('data.'):
+            data_args[k[len('data.'):]] = v
+
+    return data.bench_data(n_batches=args.n_batches, **data_args)
+
+
 def setup_experiment(args, model=None, testmode=False):
     '''Sets up the experiment
 
@@ -117,6 +151,7 @@ def setup_experiment(args, model=None, testmode=False):
             exp.OUT_DIRS.update(**d['out_dirs'])
 
         reload_nets = d['nets']
+        _load_states(model, d)
     else:
         if args.load_networks:
             d = exp.reload_model(args.load_networks)
@@ -2,7 +2,9 @@
 
 import logging
 
+from cortex._lib.config import CONFIG
 from .data_handler import DataHandler
+from . import bench, shared_cache as _shared_cache
 
 __author__ = 'R Devon Hjelm'
 __author_email__ = 'erroneus@gmail.com'
@@ -15,7 +17,10 @@ _PLUGINS = {}
 
 def setup(source: str=None, batch_size=64, n_workers: int=4,
           skip_last_batch: bool=False, inputs=dict(),
-          copy_to_local: bool=False, data_args={}, shuffle: bool=True):
+          copy_to_local: bool=False, data_args={}, shuffle: bool=True,
+          seed: int=None, multi_source: str='shortest',
+          shared_cache: bool=False, prefetch: int=2,
+          pin_memory: bool=False, tuned_loader: bool=False):
     """
     Dataset entrypoint.
 
@@ -30,6 +35,16 @@ def setup(source: str=None, batch_size=64, n_workers: int=4,
         copy_to_local: Copy the data to a local path.
         data_args: Arguments for dataset plugin.
         shuffle: Shuffle the dataset.
+        seed: Seed of the data order. Random if not set.
+        multi_source: How batches are drawn from several sources.
+            {shortest, cycle, proportional}
+        shared_cache: Share decoded datasets between the processes of the
+            host. The cache directory can be set in data_paths as
+            `shared_cache`.
+        prefetch: Number of batches loaded in advance by each worker.
+        pin_memory: Load batches in page-locked memory.
+        tuned_loader: Use the n_workers, prefetch and pin_memory found
+            fastest by `cortex bench-data` on this host, if any.
 
     """
     global DATA_HANDLER
@@ -40,26 +55,73 @@ def setup(source: str=None, batch_size=64, n_workers: int=4,
         sources = source
 
     DATA_HANDLER.set_batch_size(batch_size, skip_last_batch=skip_last_batch)
+    DATA_HANDLER.set_seed(seed)
+    DATA_HANDLER.set_multi_source(multi_source)
     DATA_HANDLER.set_inputs(**inputs)
 
+    if shared_cache:
+        _shared_cache.set_cache(CONFIG.data_paths.get('shared_cache') or
+                                _shared_cache.default_root())
+
     if sources:
         for source in sources:
             # TODO: Hardcoded for testing purpose.
             if not isinstance(source, str):
                 source = 'CIFAR10'
-            plugin = _PLUGINS.get(source, None)
-            if plugin is None:
-                raise KeyError('Dataset plugin for `{}` not found.'
-                               ' Available: {}'
-                               .format(source, tuple(_PLUGINS.keys())))
+            plugin = get_plugin(source)
 
             plugin.handle(source, copy_to_local=copy_to_local, **data_args)
-            DATA_HANDLER.add_dataset(source, plugin, n_workers=n_workers,
-                                     shuffle=shuffle)
+            loader_args = dict(n_workers=n_workers, prefetch=prefetch,
+                               pin_memory=pin_memory)
+            if tuned_loader:
+                tuned = bench.get_tuned(source, DATA_HANDLER.batch_size)
+                if tuned is None:
+                    logger.warning('No `cortex bench-data` result found for'
+                                   ' {}'.format(source))
+                else:
+                    logger.info('Using loader settings for {}: {}'
+                                .format(source, tuned))
+                    loader_args.update(**tuned)
+            DATA_HANDLER.add_dataset(source, plugin, shuffle=shuffle,
+                                     **loader_args)
     else:
         raise ValueError('No source provided. Use `--d.source`')
 
 
+def get_plugin(source):
+    plugin = _PLUGINS.get(source, None)
+    if plugin is None:
+        raise KeyError('Dataset plugin for `{}` not found.'
+                       ' Available: {}'
+                       .format(source, tuple(_PLUGINS.keys())))
+    return plugin
+
+
+def bench_data(source: str=None, batch_size=64, copy_to_local: bool=False,
+               data_args={}, shuffle: bool=True, n_batches: int=50,
+               **kwargs):
+    """Benchmarks the loading of a source without a model.
+
+    Sweeps `n_workers`, `prefetch` and `pin_memory` and caches the fastest
+    setting for this host, to be used with `--d.tuned_loader`.
+
+    Args:
+        source: Dataset source.
+        batch_size: Batch size or dict of batch sizes.
+        copy_to_local: Copy the data to a local path.
+        data_args: Arguments for dataset plugin.
+        shuffle: Shuffle the dataset.
+        n_batches: Number of batches timed for each setting.
+
+    """
+    if not source:
+        raise ValueError('No source provided. Use `--d.source`')
+    plugin = get_plugin(source)
+    plugin.handle(source, copy_to_local=copy_to_local, **data_args)
+    return bench.run(source, plugin, batch_size=batch_size,
+                     n_batches=n_batches, shuffle=shuffle)
+
+
 def register(plugin):
     global _PLUGINS
     plugin = plugin()
@@ -81,3 +143,5 @@ class DatasetPluginBase:
         self._input_names = None
         self._scale = None
         self._dataloader_class = None
+        self._in_memory = False
+        self._batch_transforms = []
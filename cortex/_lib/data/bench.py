@@ -0,0 +1,214 @@
+'''Benchmarking of data loading.
+
+Times iteration over a :class:`DataHandler` without a model and sweeps the
+loader settings to find the fastest on this host. Results are cached per
+host, dataset and batch size, to be used with `--d.tuned_loader`.
+
+'''
+
+import gc
+import itertools
+import json
+import logging
+import os
+from os import path
+import socket
+import time
+
+import torch
+
+from .data_handler import DataHandler
+from .tensor_loader import TensorLoader
+from .. import exp
+
+__author__ = 'R Devon Hjelm'
+__author_email__ = 'erroneus@gmail.com'
+
+logger = logging.getLogger('cortex.data')
+
+CACHE_PATH = path.join(path.expanduser('~'), '.cortex_data_bench.json')
+_loader_args = ('n_workers', 'prefetch', 'pin_memory')
+
+
+def _cache_key(source, batch_size):
+    if isinstance(batch_size, dict):
+        batch_size = batch_size.get('train')
+    return '{}/{}/{}'.format(socket.gethostname(), source, batch_size)
+
+
+def load_cache(cache_path=None):
+    cache_path = cache_path or CACHE_PATH
+    if not path.isfile(cache_path):
+        return {}
+    with open(cache_path) as f:
+        return json.load(f)
+
+
+def save_result(source, batch_size, result, cache_path=None):
+    cache_path = cache_path or CACHE_PATH
+    cache = load_cache(cache_path)
+    cache[_cache_key(source, batch_size)] = result
+    with open(cache_path + '.tmp', 'w') as f:
+        json.dump(cache, f, indent=1)
+    os.replace(cache_path + '.tmp', cache_path)
+
+
+def get_tuned(source, batch_size, cache_path=None):
+    '''Gets the fastest loader settings found for a source on this host.
+
+    Returns:
+        dict: n_workers, prefetch and pin_memory, or None if not
+            benchmarked.
+
+    '''
+    result = load_cache(cache_path).get(_cache_key(source, batch_size))
+    if result is None:
+        return None
+    return dict((k, result['best'][k]) for k in _loader_args)
+
+
+def decode_time(dataset, n_samples=32):
+    '''Average time to get one sample of a dataset in this process.
+
+    '''
+    index = torch.randperm(len(dataset))[:n_samples].tolist()
+    start = time.time()
+    for i in index:
+        dataset[i]
+    return (time.time() - start) / max(len(index), 1)
+
+
+def time_handler(handler, n_batches=50, mode='train'):
+    '''Times iteration over the batches of a data handler.
+
+    The first batch, which includes starting the workers, is timed
+    separately from the rest.
+
+    Returns:
+        dict: `startup` time and `batches_per_sec` and `samples_per_sec`
+            after the first batch.
+
+    '''
+    start = time.time()
+    handler.reset(mode, make_pbar=False)
+    handler.next()
+    startup = time.time() - start
+
+    n_seen = 0
+    n_samples = 0
+    start = time.time()
+    for _ in range(n_batches):
+        try:
+            batch = handler.next()
+        except StopIteration:
+            break
+        n_seen += 1
+        n_samples += len(next(_flatten(batch)))
+    if exp.DEVICE != 'cpu' and torch.cuda.is_available():
+        torch.cuda.synchronize()
+    elapsed = max(time.time() - start, 1e-6)
+
+    return dict(startup=startup, batches_per_sec=n_seen / elapsed,
+                samples_per_sec=n_samples / elapsed)
+
+
+def _flatten(batch):
+    for v in batch.values():
+        if isinstance(v, dict):
+            yield from _flatten(v)
+        else:
+            yield v
+
+
+def default_grid():
+    n_cpus = os.cpu_count() or 1
+    n_workers = sorted(set(n for n in (0, 1, 2, 4, 8, 16, n_cpus)
+                           if n <= n_cpus))
+    pin_memory = (False, True) if torch.cuda.is_available() else (False,)
+    return dict(n_workers=n_workers, prefetch=(2, 4, 8),
+                pin_memory=pin_memory)
+
+
+def sweep(source, plugin, batch_size=64, n_batches=50, grid=None,
+          shuffle=True):
+    '''Times the loading of a source over a grid of loader settings.
+
+    Args:
+        source: Name of the source.
+        plugin: Dataset plugin that has handled the source.
+        batch_size: Batch size or dict of batch sizes.
+        n_batches: Number of batches timed for each setting.
+        grid: Dict of the values of `n_workers`, `prefetch` and
+            `pin_memory` to try. Defaults to :func:`default_grid`.
+        shuffle: Shuffle the dataset.
+
+    Returns:
+        list: Settings with their timings, fastest first.
+
+    '''
+    grid = grid or default_grid()
+    dataset = plugin._datasets['train']
+    decode = decode_time(dataset)
+    logger.info('Decoding one sample of {} takes {:.2f} ms'
+                .format(source, decode * 1000))
+
+    results = []
+    seen = set()
+    for n_workers, prefetch, pin_memory in itertools.product(
+            *(grid[k] for k in _loader_args)):
+        if n_workers == 0:
+            # Prefetching only applies to workers.
+            prefetch = grid['prefetch'][0]
+        config = dict(n_workers=n_workers, prefetch=prefetch,
+                      pin_memory=pin_memory)
+
+        handler = DataHandler()
+        handler.set_batch_size(batch_size)
+        handler.set_seed(0)
+        handler.add_dataset(source, plugin, shuffle=shuffle, **config)
+        if isinstance(handler.loaders[source]['train'], TensorLoader):
+            # Served from memory, the loader settings don't apply.
+            config = dict(n_workers=0, prefetch=grid['prefetch'][0],
+                          pin_memory=False)
+        key = tuple(config[k] for k in _loader_args)
+        if key in seen:
+            continue
+        seen.add(key)
+
+        timing = time_handler(handler, n_batches=n_batches)
+        # Fraction of the workers' time spent decoding samples.
+        timing['worker_utilization'] = min(
+            1., decode * timing['samples_per_sec'] / max(n_workers, 1))
+        config.update(**timing)
+        results.append(config)
+        logger.info('n_workers={n_workers} prefetch={prefetch} '
+                    'pin_memory={pin_memory}: {batches_per_sec:.1f} batches/s'
+                    ' ({samples_per_sec:.0f} samples/s, worker utilization '
+                    '{worker_utilization:.0%}, startup {startup:.2f}s)'
+                    .format(**config))
+
+        # Shuts down the persistent workers before the next setting.
+        del handler
+        gc.collect()
+
+    return sorted(results, key=lambda r: -r['samples_per_sec'])
+
+
+def run(source, plugin, batch_size=64, n_batches=50, grid=None, shuffle=True,
+        cache_path=None):
+    '''Benchmarks a source and caches the fastest loader settings.
+
+    Returns:
+        dict: The fastest settings.
+
+    '''
+    results = sweep(source, plugin, batch_size=batch_size,
+                    n_batches=n_batches, grid=grid, shuffle=shuffle)
+    best = results[0]
+    save_result(source, batch_size,
+                dict(best=best, results=results, time=time.time()),
+                cache_path=cache_path)
+    logger.info('Fastest for {}: n_workers={n_workers} prefetch={prefetch} '
+                'pin_memory={pin_memory}. Use `--d.tuned_loader` to apply.'
+                .format(source, **best))
+    return best
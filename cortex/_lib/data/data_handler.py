@@ -1,29 +1,139 @@
 """Data module"""
 
+import random
 import signal
 
 import torch
 from progressbar import Bar, ProgressBar, Percentage, Timer, ETA
+from torch.utils.data.dataloader import default_collate
 
-from .noise import get_noise_var
+from .noise import NoiseSampler
+from .sampler import ResumableSampler
+from .tensor_loader import get_tensors, materialize, TensorLoader
 from .. import exp
 
 __author__ = 'R Devon Hjelm'
 __author_email__ = 'erroneus@gmail.com'
 
 
+_multi_source_policies = ('shortest', 'cycle', 'proportional')
+
+
 class DataHandler:
     def __init__(self):
         self.dims = {}
         self.input_names = {}
         self.noise = {}
         self.loaders = {}
+        self.batch_transforms = {}
         self.batch = None
         self.noise = {}
         self.iterator = {}
         self.pbar = None
         self.u = 0
         self.inputs = dict()
+        self.samplers = {}
+        self.seed = None
+        self.mode = None
+        self.epoch = None
+        self._completed = 0
+        self._resumable = False
+        self._resume = None
+        self._checkpoint = None
+        self._last_checkpoint = None
+        self.multi_source = 'shortest'
+        self._iterators = {}
+        self._n_drawn = {}
+        self._completed_positions = {}
+        self._epoch_sources = []
+        self._schedule = None
+        self._viz_data = {}
+        self.memory_format = None
+
+    def set_memory_format(self, memory_format=None):
+        '''Sets the memory format of the image batches.
+
+        Args:
+            memory_format: A `torch.memory_format` for 4D batches, e.g.
+                `torch.channels_last`. None to leave them as loaded.
+
+        '''
+        self.memory_format = memory_format
+
+    def set_multi_source(self, policy='shortest'):
+        '''Sets how batches are drawn when there are several sources.
+
+        Args:
+            policy: One of
+
+                * `shortest`: one batch from each source, the epoch ends with
+                  the shortest source.
+                * `cycle`: one batch from each source, the epoch ends with
+                  the longest source and shorter sources are cycled.
+                * `proportional`: one batch from a single source, picked at
+                  random in proportion to the number of batches of each
+                  source. The epoch ends when every source has been drawn
+                  its number of batches.
+
+            Sources that do not end the epoch keep their iterators across
+            epochs, so their batches are used rather than discarded.
+
+        '''
+        if policy not in _multi_source_policies:
+            raise ValueError('Unknown multi-source policy `{}`. Available: {}'
+                             .format(policy, _multi_source_policies))
+        self.multi_source = policy
+
+    def set_seed(self, seed=None):
+        '''Sets the seed of the data order.
+
+        If None, keeps the seed of a reloaded state or draws a new one.
+
+        '''
+        if seed is not None:
+            self.seed = int(seed)
+        elif self.seed is None:
+            self.seed = random.randint(0, 2 ** 31 - 1)
+
+    def set_checkpoint(self, every, fn, mode='train'):
+        '''Calls `fn` every `every` batches of an epoch in `mode`.
+
+        `fn` is called before fetching a batch, once all previous batches of
+        the epoch have been processed.
+
+        '''
+        if every:
+            self._checkpoint = (every, fn, mode)
+        else:
+            self._checkpoint = None
+
+    def state_dict(self):
+        '''State needed to resume the data order mid-epoch.
+
+        '''
+        if self._resumable:
+            return dict(seed=self.seed, mode=self.mode, epoch=self.epoch,
+                        u=self._completed,
+                        sources=dict(self._completed_positions))
+        return dict(seed=self.seed, mode=None, epoch=self.epoch, u=0)
+
+    def load_state_dict(self, state):
+        '''Loads a state. The position is restored on the next `reset`
+        with the same mode and epoch.
+
+        Only positions within a training epoch are restored.
+
+        '''
+        self.seed = state['seed']
+        if state.get('mode') != 'train':
+            # Older checkpoints saved the position of completed epochs.
+            state = dict(state, mode=None, u=0)
+        self._resume = state
+
+        for samplers in self.samplers.values():
+            for sampler in samplers.values():
+                if sampler is not None:
+                    sampler.seed = self.seed
 
     def set_batch_size(self, batch_size, skip_last_batch=False):
         self.batch_size = batch_size
@@ -33,14 +143,18 @@ class DataHandler:
         self.inputs.update(**kwargs)
 
     def add_dataset(self, source, dataset_entrypoint,
-                    n_workers=4, shuffle=True, DataLoader=None):
-        DataLoader = (DataLoader or dataset_entrypoint._dataloader_class or
-                      torch.utils.data.DataLoader)
+                    n_workers=4, shuffle=True, DataLoader=None, prefetch=2,
+                    pin_memory=False):
+        custom_loader = DataLoader or dataset_entrypoint._dataloader_class
+        DataLoader = custom_loader or torch.utils.data.DataLoader
 
         if len(dataset_entrypoint._datasets) == 0:
             raise ValueError('No datasets found in entrypoint')
 
+        self.set_seed()
+
         loaders = {}
+        samplers = {}
         for k, dataset in dataset_entrypoint._datasets.items():
             N = len(dataset)
             dataset_entrypoint._dims['N_' + k] = N
@@ -57,69 +171,171 @@ class DataHandler:
                 self.batch_size = {k: self.batch_size_}
                 batch_size = self.batch_size_
 
-            loaders[k] = DataLoader(dataset, batch_size=batch_size,
-                                    shuffle=shuffle, num_workers=n_workers,
-                                    worker_init_fn=lambda x:
-                                    signal.signal(signal.SIGINT,
-                                                  signal.SIG_IGN))
+            # Tensor-resident datasets are served directly from the device,
+            # bypassing worker processes.
+            tensors = None
+            if custom_loader is None:
+                tensors = get_tensors(dataset)
+                if tensors is None and dataset_entrypoint._in_memory:
+                    tensors = materialize(dataset, n_workers=n_workers)
+
+            if tensors is not None:
+                sampler = ResumableSampler(tensors[0], seed=self.seed,
+                                           shuffle=shuffle)
+                loaders[k] = TensorLoader(tensors, batch_size=batch_size,
+                                          device=exp.DEVICE, sampler=sampler)
+            elif custom_loader is None:
+                # Workers persist across epochs and mode switches; each new
+                # pass only resets the sampler.
+                sampler = ResumableSampler(dataset, seed=self.seed,
+                                           shuffle=shuffle)
+                loaders[k] = DataLoader(dataset, batch_size=batch_size,
+                                        sampler=sampler, num_workers=n_workers,
+                                        persistent_workers=n_workers > 0,
+                                        prefetch_factor=(prefetch if n_workers
+                                                         else None),
+                                        pin_memory=pin_memory,
+                                        worker_init_fn=lambda x:
+                                        signal.signal(signal.SIGINT,
+                                                      signal.SIG_IGN))
+            else:
+                sampler = None
+                loaders[k] = DataLoader(dataset, batch_size=batch_size,
+                                        shuffle=shuffle, num_workers=n_workers,
+                                        worker_init_fn=lambda x:
+                                        signal.signal(signal.SIGINT,
+                                                      signal.SIG_IGN))
+            samplers[k] = sampler
 
         self.dims[source] = dataset_entrypoint._dims
         self.input_names[source] = dataset_entrypoint._input_names
+        self.batch_transforms[source] = list(
+            dataset_entrypoint._batch_transforms)
         self.loaders[source] = loaders
+        self.samplers[source] = samplers
 
     def add_noise(self, key, dist=None, size=None, **kwargs):
         if size is None:
             raise ValueError
 
-        dim = size
+        self.noise[key] = NoiseSampler(dist, size, **kwargs)
+        self.dims[key] = size
 
-        if not isinstance(size, tuple):
-            size = (size,)
+    def __iter__(self):
+        return self
 
-        train_size = (self.batch_size['train'],) + size
-        test_size = (self.batch_size['test'],) + size
+    def positions(self):
+        '''Position of each source in its sampler epoch.
 
-        var = get_noise_var(dist, train_size, **kwargs)
-        var_t = get_noise_var(dist, test_size, **kwargs)
+        Sources are drawn different numbers of samples, and can be on
+        different sampler epochs, when they are cycled or carried over.
 
-        self.noise[key] = dict(train=var, test=var_t)
-        self.dims[key] = dim
+        Returns:
+            dict: The sampler `epoch` and number of samples drawn in it
+                (`start`) of each source with a resumable sampler.
 
-    def __iter__(self):
-        return self
+        '''
+        positions = {}
+        for source in self.loaders.keys():
+            sampler = self.samplers[source].get(self.mode)
+            if sampler is not None:
+                positions[source] = dict(epoch=sampler.epoch,
+                                         start=self.n_drawn.get(source, 0))
+        return positions
 
     def __next__(self):
-        output = {}
-        sources = self.loaders.keys()
+        self._completed = self.u
+        self._completed_positions = self.positions()
+        self.maybe_checkpoint()
 
-        batch_size = self.batch_size[self.mode]
-        for source in sources:
-            data = next(self.iterators[source])
-            if data[0].size()[0] < batch_size:
-                if self.skip_last_batch:
+        sources = list(self.loaders.keys())
+
+        try:
+            if self._schedule is not None:
+                if self.u >= len(self._schedule):
                     raise StopIteration
-                batch_size = data[0].size()[0]
-            data = dict((k, v) for k, v in zip(self.input_names[source], data))
-            if len(sources) > 1:
-                output[source] = data
+                batch_sources = [sources[self._schedule[self.u]]]
             else:
-                output.update(**data)
+                batch_sources = sources
 
-        for k, n_vars in self.noise.items():
-            n_var = n_vars[self.mode]
-            n_var = n_var.sample()
-            n_var = n_var.to(exp.DEVICE)
+            data = [(source, self.next_from(source))
+                    for source in batch_sources]
+        except StopIteration:
+            # A completed epoch has no position to resume.
+            self._completed = 0
+            self._resumable = False
+            raise
 
-            if n_var.size()[0] != batch_size:
-                n_var = n_var[0:batch_size]
-            output[k] = n_var
-
-        self.batch = output
+        self.batch = self.make_batch(data)
         self.u += 1
         self.update_pbar()
 
         return self.batch
 
+    def make_batch(self, data):
+        '''Makes a batch from the data of each source and noise.
+
+        Args:
+            data: List of (source, list of tensors) pairs.
+
+        '''
+        output = {}
+        if data:
+            # Noise follows the size of the data, whatever the batch size.
+            batch_size = min(data_[0].size()[0] for _, data_ in data)
+        else:
+            batch_size = self.batch_size[self.mode]
+        for source, data_ in data:
+            if self.memory_format is not None:
+                data_ = [v.contiguous(memory_format=self.memory_format)
+                         if v.dim() == 4 else v for v in data_]
+            data_ = dict((k, v) for k, v in
+                         zip(self.input_names[source], data_))
+            if len(self.loaders) > 1:
+                output[source] = data_
+            else:
+                output.update(**data_)
+
+        for k, sampler in self.noise.items():
+            output[k] = sampler.sample(batch_size, device=exp.DEVICE)
+
+        return output
+
+    def set_viz_batch(self, mode='test'):
+        '''Sets the batch to a fixed batch for visualization.
+
+        The batch is drawn once from the first samples of each dataset,
+        without going through the loaders, so their iterators and workers
+        are left untouched. Noise is drawn anew.
+
+        '''
+        self.mode = mode
+        self._resumable = False
+        if mode not in self._viz_data:
+            self._viz_data[mode] = [(source, self.first_batch(source))
+                                    for source in self.loaders.keys()]
+        self.batch = self.make_batch(self._viz_data[mode])
+        return self.batch
+
+    def first_batch(self, source):
+        '''Collates the first samples of a source in the current mode.
+
+        '''
+        loader = self.loaders[source][self.mode]
+        batch_size = self.batch_size[self.mode]
+        if isinstance(loader, TensorLoader):
+            inputs = [t[:batch_size] for t in loader.tensors]
+        else:
+            dataset = loader.dataset
+            collate_fn = getattr(loader, 'collate_fn', default_collate)
+            inputs = collate_fn([dataset[i] for i in
+                                 range(min(batch_size, len(dataset)))])
+
+        inputs = [inp.to(exp.DEVICE) for inp in inputs]
+        for i, transform in self.get_batch_transforms(source):
+            inputs[i] = transform(inputs[i])
+        return inputs
+
     def next(self):
         return self.__next__()
 
@@ -181,39 +397,174 @@ class DataHandler:
         names = ['{}'.format(i) for i in range(self.dims[source]['labels'])]
         return names
 
+    def get_batch_transforms(self, source):
+        '''Gets the batch transforms of a source for the current mode.
+
+        Returns:
+            list: Pairs of input position and transform.
+
+        '''
+        transforms = []
+        input_names = self.input_names[source]
+        for mode, name, transform in self.batch_transforms.get(source, []):
+            if mode is not None and mode != self.mode:
+                continue
+            if name not in input_names:
+                raise KeyError('Batch transform input `{}` not found. '
+                               'Available: {}'.format(name, input_names))
+            transforms.append((input_names.index(name), transform))
+        return transforms
+
     def make_iterator(self, source):
         loader = self.loaders[source][self.mode]
+        transforms = self.get_batch_transforms(source)
 
         def iterator():
             for inputs in loader:
-                inputs = [inp.to(exp.DEVICE) for inp in inputs]
-                inputs_ = []
-                for i, inp in enumerate(inputs):
-                    inputs_.append(inp)
-                yield inputs_
+                inputs = [inp.to(exp.DEVICE, non_blocking=True)
+                          for inp in inputs]
+                for i, transform in transforms:
+                    inputs[i] = transform(inputs[i])
+                yield inputs
         return iterator()
 
+    def next_from(self, source):
+        '''Gets the next batch of a source.
+
+        Sources that end the epoch raise `StopIteration` when exhausted.
+        Others are restarted with the next pass over their data.
+
+        '''
+        batch_size = self.batch_size[self.mode]
+        ends_epoch = source in self._epoch_sources
+
+        for restarted in (False, True):
+            if restarted:
+                sampler = self.samplers[source].get(self.mode)
+                if sampler is not None:
+                    sampler.set_epoch(sampler.epoch + 1)
+                self.n_drawn[source] = 0
+                self.iterators[source] = self.make_iterator(source)
+
+            try:
+                data = next(self.iterators[source])
+            except StopIteration:
+                if ends_epoch:
+                    raise
+                continue
+
+            if data[0].size()[0] < batch_size and self.skip_last_batch:
+                if ends_epoch:
+                    raise StopIteration
+                continue
+
+            self.n_drawn[source] += data[0].size()[0]
+            return data
+
+        raise StopIteration
+
+    def get_epoch_sources(self):
+        '''Sources whose exhaustion ends the epoch.
+
+        '''
+        lengths = dict((source, len(loaders[self.mode]))
+                       for source, loaders in self.loaders.items())
+        if len(lengths) == 0:
+            return []
+        elif self.multi_source == 'proportional' and len(lengths) > 1:
+            return []
+        elif self.multi_source == 'cycle':
+            length = max(lengths.values())
+        else:
+            length = min(lengths.values())
+        return [source for source, l_ in lengths.items() if l_ == length][:1]
+
+    def make_schedule(self):
+        '''Order in which sources are drawn for the `proportional` policy.
+
+        '''
+        schedule = []
+        for i, loaders in enumerate(self.loaders.values()):
+            schedule += [i] * len(loaders[self.mode])
+
+        generator = torch.Generator()
+        generator.manual_seed((self.seed or 0) * 100003 + (self.epoch or 0))
+        order = torch.randperm(len(schedule), generator=generator)
+        return [schedule[i] for i in order.tolist()]
+
+    def maybe_checkpoint(self):
+        if self._checkpoint is None:
+            return
+
+        every, fn, mode = self._checkpoint
+        if (mode == self.mode and self.u > 0 and self.u % every == 0 and
+                self._last_checkpoint != (self.epoch, self.u)):
+            self._last_checkpoint = (self.epoch, self.u)
+            fn()
+
     def update_pbar(self):
         if self.pbar:
             self.pbar.update(self.u)
 
-    def reset(self, mode, make_pbar=True, string=''):
+    def reset(self, mode, make_pbar=True, string='', epoch=None):
         self.mode = mode
         self.u = 0
 
+        if epoch is not None:
+            self.epoch = epoch
+
+        resume = self._resume
+        positions = {}
+        if resume and resume['mode'] in (mode, None):
+            if resume['mode'] == mode and resume['epoch'] == self.epoch:
+                self.u = resume['u']
+                # Older checkpoints have no positions of the sources.
+                positions = resume.get('sources', {})
+                self._last_checkpoint = (self.epoch, self.u)
+            self._resume = None
+        self._completed = self.u
+        self._resumable = mode == 'train'
+
+        self._epoch_sources = self.get_epoch_sources()
+        if self.multi_source == 'proportional' and len(self.loaders) > 1:
+            self._schedule = self.make_schedule()
+        else:
+            self._schedule = None
+
+        # Iterators of sources that do not end the epoch carry over.
+        self.iterators = self._iterators.setdefault(mode, {})
+        self.n_drawn = self._n_drawn.setdefault(mode, {})
+        for source in self.loaders.keys():
+            if (source in self.iterators and
+                    source not in self._epoch_sources):
+                continue
+
+            position = positions.get(
+                source, dict(epoch=self.epoch,
+                             start=self.u * self.batch_size[mode]))
+            sampler = self.samplers[source].get(mode)
+            if sampler is not None:
+                if position['epoch'] is not None:
+                    sampler.set_epoch(position['epoch'])
+                sampler.set_start(position['start'])
+            self.n_drawn[source] = position['start']
+            self.iterators[source] = self.make_iterator(source)
+        self._completed_positions = self.positions()
+
         if make_pbar:
             widgets = [string, Timer(), ' | ',
                        Percentage(), ' | ', ETA(), Bar()]
-            if len([len(loader[self.mode]) for loader
-                    in self.loaders.values()]) == 0:
+            lengths = [len(loader[self.mode])
+                       for loader in self.loaders.values()]
+            if len(lengths) == 0:
                 maxval = 1000
+            elif self._schedule is not None:
+                maxval = len(self._schedule)
+            elif self.multi_source == 'cycle':
+                maxval = max(lengths)
             else:
-                maxval = min(len(loader[self.mode])
-                             for loader in self.loaders.values())
+                maxval = min(lengths)
             self.pbar = ProgressBar(widgets=widgets, maxval=maxval).start()
+            self.update_pbar()
         else:
             self.pbar = None
-
-        sources = self.loaders.keys()
-        self.iterators = dict((source, self.make_iterator(source))
-                              for source in sources)
@@ -0,0 +1,338 @@
+'''Staging of datasets to a local path.
+
+Files are copied by a pool of threads, each to a temporary name moved into
+place once complete. A copy is only reused once its completion marker, which
+holds the manifest of the copied files, has been written: an interrupted copy
+is resumed, skipping the files already copied whole. With checksums, the hash
+of each file is computed while it is copied, and the hashes of a copy in
+progress are saved next to it so that a resumed copy can check the files it
+skips without reading their source.
+
+Directories can also be packed into a single file with an index, read back
+with :class:`PackedFiles`, so that staging and reading a dataset of many
+small files touches one file instead of millions.
+
+'''
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
+import logging
+import os
+from os import path
+import shutil
+import time
+
+import numpy as np
+
+__author__ = 'R Devon Hjelm'
+__author_email__ = 'erroneus@gmail.com'
+
+logger = logging.getLogger('cortex.data')
+
+
+def marker_path(to_path):
+    '''Path of the completion marker of a copy.
+
+    Kept next to the copy so that it is not mistaken for data.
+
+    '''
+    return path.join(path.dirname(to_path),
+                     '.{}.complete'.format(path.basename(to_path)))
+
+
+def _partial_path(to_path):
+    return path.join(path.dirname(to_path),
+                     '.{}.partial'.format(path.basename(to_path)))
+
+
+def file_hash(file_path, block_size=1 << 20):
+    md5 = hashlib.md5()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            md5.update(block)
+    return md5.hexdigest()
+
+
+def build_manifest(from_path):
+    '''Lists the files under a path with their size and modification time.
+
+    Args:
+        from_path: A file or directory.
+
+    Returns:
+        dict: `[size, mtime]` of each file, keyed by its path relative to
+            `from_path`.
+
+    '''
+    if path.isfile(from_path):
+        files = ['']
+    else:
+        files = []
+        for root, _, names in os.walk(from_path):
+            rel_root = path.relpath(root, from_path)
+            for name in names:
+                files.append(path.normpath(path.join(rel_root, name)))
+
+    manifest = {}
+    for rel_path in sorted(files):
+        src = path.join(from_path, rel_path) if rel_path else from_path
+        stat = os.stat(src)
+        manifest[rel_path] = [stat.st_size, int(stat.st_mtime)]
+    return manifest
+
+
+def is_complete(to_path):
+    return path.isfile(marker_path(to_path)) and path.exists(to_path)
+
+
+def _read_marker(marker):
+    if not path.isfile(marker):
+        return {}
+    try:
+        with open(marker) as f:
+            return json.load(f)
+    except ValueError:
+        return {}
+
+
+def _write_marker(to_path, manifest, marker=None):
+    marker = marker or marker_path(to_path)
+    with open(marker + '.tmp', 'w') as f:
+        json.dump(manifest, f)
+    os.replace(marker + '.tmp', marker)
+
+
+class _Progress:
+    def __init__(self, n_files, n_bytes, every=5.):
+        self.n_files = n_files
+        self.n_bytes = n_bytes
+        self.files = 0
+        self.bytes = 0
+        self.every = every
+        self.start = self.last = time.time()
+
+    def update(self, size):
+        self.files += 1
+        self.bytes += size
+        now = time.time()
+        if now - self.last > self.every or self.files == self.n_files:
+            self.last = now
+            rate = self.bytes / max(now - self.start, 1e-6) / 2 ** 20
+            logger.info('Copied {}/{} files ({:.1f}/{:.1f} GB, {:.1f} MB/s)'
+                        .format(self.files, self.n_files,
+                                self.bytes / 2 ** 30, self.n_bytes / 2 ** 30,
+                                rate))
+
+
+def _copy_hashed(src, dst, block_size=1 << 20):
+    '''Copies a file, hashing the blocks as they are written.
+
+    Returns:
+        str: The md5 hash of `src`.
+
+    '''
+    md5 = hashlib.md5()
+    with open(src, 'rb') as f_in, open(dst, 'wb') as f_out:
+        for block in iter(lambda: f_in.read(block_size), b''):
+            md5.update(block)
+            f_out.write(block)
+    shutil.copystat(src, dst)
+    return md5.hexdigest()
+
+
+def copy_files(from_path, to_path, n_threads=8, checksum=False,
+               save_every=30.):
+    '''Copies a file or directory, resuming an interrupted copy.
+
+    Args:
+        from_path: The file or directory to copy.
+        to_path: The destination.
+        n_threads: Number of files copied concurrently.
+        checksum: Verify copied files with their md5 hash, computed as they
+            are copied, in addition to their size and modification time.
+        save_every: Seconds between saves of the hashes of a copy in
+            progress.
+
+    Returns:
+        str: `to_path`.
+
+    '''
+    if is_complete(to_path):
+        return to_path
+
+    manifest = build_manifest(from_path)
+    n_bytes = sum(entry[0] for entry in manifest.values())
+    logger.info('Copying {} files ({:.1f} GB) from {} to {}'
+                .format(len(manifest), n_bytes / 2 ** 30, from_path, to_path))
+    progress = _Progress(len(manifest), n_bytes)
+
+    # Hashes of a previous copy, checked against the files it copied.
+    hashes = {}
+    if checksum:
+        for marker in (marker_path(to_path), _partial_path(to_path)):
+            hashes.update(_read_marker(marker))
+
+    def copy(rel_path):
+        src = path.join(from_path, rel_path) if rel_path else from_path
+        dst = path.join(to_path, rel_path) if rel_path else to_path
+        size, mtime = manifest[rel_path]
+
+        if path.isfile(dst):
+            stat = os.stat(dst)
+            if stat.st_size == size and int(stat.st_mtime) == mtime:
+                if not checksum:
+                    return size, None
+                entry = hashes.get(rel_path)
+                if (entry is not None and len(entry) == 3 and
+                        entry[:2] == [size, mtime] and
+                        file_hash(dst) == entry[2]):
+                    return size, entry[2]
+
+        os.makedirs(path.dirname(dst) or '.', exist_ok=True)
+        tmp = dst + '.part'
+        if not checksum:
+            shutil.copy2(src, tmp)
+            os.replace(tmp, dst)
+            return size, None
+
+        md5 = _copy_hashed(src, tmp)
+        if file_hash(tmp) != md5:
+            raise IOError('Checksum mismatch copying {} to {}'
+                          .format(src, dst))
+        os.replace(tmp, dst)
+        return size, md5
+
+    copied = {}
+    last_save = time.time()
+    try:
+        with ThreadPoolExecutor(max_workers=n_threads) as executor:
+            rel_paths = list(manifest.keys())
+            for rel_path, (size, md5) in zip(
+                    rel_paths, executor.map(copy, rel_paths)):
+                progress.update(size)
+                if checksum:
+                    copied[rel_path] = manifest[rel_path] + [md5]
+                    if time.time() - last_save > save_every:
+                        _write_marker(to_path, copied,
+                                      marker=_partial_path(to_path))
+                        last_save = time.time()
+    except BaseException:
+        if copied:
+            _write_marker(to_path, copied, marker=_partial_path(to_path))
+        raise
+
+    _write_marker(to_path, copied if checksum else manifest)
+    if path.isfile(_partial_path(to_path)):
+        os.remove(_partial_path(to_path))
+    logger.info('Finished copying.')
+    return to_path
+
+
+def _bounded_map(executor, fn, items, window):
+    '''Maps `fn` over `items` with at most `window` calls in flight.
+
+    Unlike `executor.map`, which submits every call at once, results are not
+    buffered beyond the window.
+
+    Yields:
+        The results, in the order of `items`.
+
+    '''
+    futures = deque()
+    for item in items:
+        if len(futures) >= window:
+            yield futures.popleft().result()
+        futures.append(executor.submit(fn, item))
+    while futures:
+        yield futures.popleft().result()
+
+
+def pack_files(from_path, pack_path, n_threads=8):
+    '''Packs the files of a directory into a single file.
+
+    The files are concatenated into `pack_path`, with the offset and size of
+    each in an index stored at `pack_path + '.index'`. The pack is written
+    under a temporary name and moved into place once complete.
+
+    Args:
+        from_path: The directory to pack.
+        pack_path: The packed file.
+        n_threads: Number of files read concurrently. At most twice as many
+            files are held in memory.
+
+    Returns:
+        str: `pack_path`.
+
+    '''
+    if is_complete(pack_path):
+        return pack_path
+
+    manifest = build_manifest(from_path)
+    n_bytes = sum(entry[0] for entry in manifest.values())
+    logger.info('Packing {} files ({:.1f} GB) from {} to {}'
+                .format(len(manifest), n_bytes / 2 ** 30, from_path,
+                        pack_path))
+    progress = _Progress(len(manifest), n_bytes)
+
+    def read(rel_path):
+        with open(path.join(from_path, rel_path), 'rb') as f:
+            return f.read()
+
+    index = {}
+    offset = 0
+    os.makedirs(path.dirname(pack_path) or '.', exist_ok=True)
+    tmp = pack_path + '.part'
+    with open(tmp, 'wb') as f_out, \
+            ThreadPoolExecutor(max_workers=n_threads) as executor:
+        rel_paths = list(manifest.keys())
+        results = _bounded_map(executor, read, rel_paths, 2 * n_threads)
+        for rel_path, data in zip(rel_paths, results):
+            f_out.write(data)
+            index[rel_path] = [offset, len(data)]
+            offset += len(data)
+            progress.update(len(data))
+
+    with open(pack_path + '.index', 'w') as f:
+        json.dump(index, f)
+    os.replace(tmp, pack_path)
+    _write_marker(pack_path, manifest)
+    logger.info('Finished packing.')
+    return pack_path
+
+
+class PackedFiles:
+    '''Read access to the files of a pack written by :func:`pack_files`.
+
+    The pack is memory-mapped, so it is shared by loader workers.
+
+    Args:
+        pack_path: The packed file.
+
+    '''
+
+    def __init__(self, pack_path):
+        self.pack_path = pack_path
+        with open(pack_path + '.index') as f:
+            self.index = json.load(f)
+        self._data = None
+
+    @property
+    def data(self):
+        # Mapped lazily so that datasets holding a pack pickle cheaply.
+        if self._data is None:
+            self._data = np.memmap(self.pack_path, dtype=np.uint8, mode='r')
+        return self._data
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_data'] = None
+        return state
+
+    def names(self):
+        return sorted(self.index.keys())
+
+    def read(self, name):
+        offset, size = self.index[name]
+        return self.data[offset:offset + size].tobytes()
@@ -34,38 +34,158 @@ _dist_dict = dict(
 )
 
 
-def get_noise_var(dist, size, **kwargs):
-
-    def expand(*args):
-        expanded = tuple()
-        for arg in args:
-            zeros = torch.zeros(size)
-            if isinstance(arg, list):
-                arg_tensor = torch.tensor(arg)
-                expanded += (zeros + arg_tensor,)
-            else:
-                expanded += (zeros + arg,)
-        return expanded
+# Default parameters of each distribution. Parameters are broadcast to the
+# size of the noise, except those in `_unexpanded`.
+_dist_params = dict(
+    bernoulli=dict(probs=0.5),
+    beta=dict(concentration1=1., concentration0=1.),
+    binomial=dict(total_count=1., probs=0.5),
+    categorical=dict(probs=[0.5, 0.5]),
+    cauchy=dict(loc=0., scale=1.),
+    chi2=dict(df=1.),
+    dirichlet=dict(concentration=1.),
+    exponential=dict(rate=1.),
+    fishersnedecor=dict(df1=1., df2=1.),
+    gamma=dict(concentration=1., rate=1.),
+    geometric=dict(probs=0.5),
+    gumbel=dict(loc=0., scale=1.),
+    laplace=dict(loc=0., scale=1.),
+    log_normal=dict(loc=0., scale=1.),
+    multinomial=dict(total_count=1, probs=1.),
+    multivariate_normal=dict(loc=0., covariance_matrix=None),
+    normal=dict(loc=0., scale=1.),
+    one_hot_categorical=dict(probs=1.),
+    pareto=dict(scale=1., alpha=1.),
+    poisson=dict(rate=1.),
+    relaxed_bernoulli=dict(temperature=1., probs=0.5),
+    relaxed_categorical=dict(temperature=1., probs=1.),
+    studentT=dict(df=1., loc=0., scale=1.),
+    uniform=dict(low=0., high=1.)
+)
+_unexpanded = ('temperature', 'covariance_matrix', 'scale_tril',
+               'precision_matrix')
+
+# Distributions drawn in place with the sampling methods of tensors, with
+# their parameters.
+_in_place = dict(
+    bernoulli=(lambda x, probs: x.bernoulli_(probs)),
+    cauchy=(lambda x, loc, scale: x.cauchy_(loc, scale)),
+    exponential=(lambda x, rate: x.exponential_(rate)),
+    # Tensors count trials, the distribution counts failures.
+    geometric=(lambda x, probs: x.geometric_(probs).sub_(1)),
+    log_normal=(lambda x, loc, scale: x.log_normal_(loc, scale)),
+    normal=(lambda x, loc, scale: x.normal_(loc, scale)),
+    uniform=(lambda x, low, high: x.uniform_(low, high))
+)
+
+
+def get_noise_var(dist, size, device=None, **kwargs):
+    '''Makes a distribution of noise of a given size.
+
+    Args:
+        dist: Name of the distribution, a key of `_dist_dict`.
+        size: Size of the samples. For distributions over categories
+            (dirichlet, multinomial, one_hot_categorical,
+            relaxed_categorical) and multivariate_normal, the last dimension
+            is the event. For categorical, `probs` gives the categories.
+        device: Device of the parameters of the distribution.
+        **kwargs: Parameters of the distribution. Lists are broadcast along
+            the last dimension.
+
+    Returns:
+        torch.distributions.Distribution
+
+    '''
+
+    def expand(arg, size=size):
+        zeros = torch.zeros(size, device=device)
+        if isinstance(arg, list):
+            arg = torch.tensor(arg, device=device)
+        return zeros + arg
 
     Dist = _dist_dict.get(dist)
     if Dist is None:
-        raise NotImplementedError(dist)
-
-    if dist == 'dirichlet':
-        conc = kwargs.pop('concentration', 1.)
-        conc = expand(conc)
-        var = Dist(conc, **kwargs)
-    elif dist in ('cachy', 'gumbel', 'laplace', 'log_normal', 'normal'):
-        loc = kwargs.pop('loc', 0.)
-        scale = kwargs.pop('scale', 1.)
-        loc, scale = expand(loc, scale)
-        var = Dist(loc, scale, **kwargs)
-    elif dist == 'uniform':
-        low = kwargs.pop('low', 0.)
-        high = kwargs.pop('high', 1.)
-        low, high = expand(low, high)
-        var = Dist(low, high, **kwargs)
-    else:
         raise NotImplementedError('`{}` distribution not found'.format(dist))
 
-    return var
+    params = dict(_dist_params[dist])
+    if 'logits' in kwargs:
+        params.pop('probs', None)
+    if set(kwargs) & set(('scale_tril', 'precision_matrix')):
+        params.pop('covariance_matrix', None)
+    params.update(**kwargs)
+
+    for k, v in params.items():
+        if dist == 'categorical' and k in ('probs', 'logits'):
+            v = torch.tensor(v, device=device)
+            params[k] = expand(v, size=tuple(size) + v.size())
+        elif k == 'covariance_matrix' and v is None:
+            params[k] = torch.eye(size[-1], device=device)
+        elif k in _unexpanded or (dist == 'multinomial' and
+                                  k == 'total_count'):
+            if isinstance(v, list):
+                v = torch.tensor(v, device=device)
+            params[k] = v
+        else:
+            params[k] = expand(v)
+
+    return Dist(**params)
+
+
+class NoiseSampler:
+    '''Draws batches of noise.
+
+    Each draw returns a new tensor, so samples kept across draws are not
+    overwritten. Where possible, samples are drawn in place into it with the
+    sampling methods of tensors. Otherwise they are sampled from a
+    distribution built once per device.
+
+    Args:
+        dist: Name of the distribution, a key of `_dist_dict`.
+        size: Size of a sample.
+        **kwargs: Parameters of the distribution. See :func:`get_noise_var`.
+
+    '''
+
+    def __init__(self, dist, size, **kwargs):
+        if not isinstance(size, tuple):
+            size = (size,)
+        self.dist = dist
+        self.size = size
+        self.kwargs = kwargs
+
+        # Also checks the distribution and its parameters.
+        self._var = get_noise_var(dist, size, **kwargs)
+        self._var_device = torch.device('cpu')
+
+        params = dict(_dist_params[dist])
+        params.update(**kwargs)
+        if (dist in _in_place and set(params) == set(_dist_params[dist]) and
+                all(isinstance(v, (int, float)) for v in params.values())):
+            self._fill = _in_place[dist]
+            self._params = [params[k] for k in _dist_params[dist]]
+        else:
+            self._fill = None
+
+    def _get_var(self, device):
+        device = torch.device(device)
+        if self._var_device != device:
+            self._var = get_noise_var(self.dist, self.size, device=device,
+                                      **self.kwargs)
+            self._var_device = device
+        return self._var
+
+    def sample(self, batch_size, device='cpu'):
+        '''Draws a batch of noise.
+
+        Args:
+            batch_size: Number of samples.
+            device: Device of the samples.
+
+        Returns:
+            torch.Tensor: Samples of size `(batch_size,) + size`.
+
+        '''
+        if self._fill is not None:
+            out = torch.empty((batch_size,) + self.size, device=device)
+            return self._fill(out, *self._params)
+        return self._get_var(device).sample((batch_size,)).float()
@@ -0,0 +1,63 @@
+'''Deterministic, resumable sampler.
+
+'''
+
+import torch
+from torch.utils.data import Sampler
+
+__author__ = 'R Devon Hjelm'
+__author_email__ = 'erroneus@gmail.com'
+
+
+class ResumableSampler(Sampler):
+    '''Samples in an order determined by a seed and the epoch.
+
+    The permutation of an epoch is reproducible from `(seed, epoch)`, so the
+    position in an epoch is all that needs to be checkpointed to resume with
+    the identical data order.
+
+    Args:
+        data_source: Dataset to sample from.
+        seed: Base seed of the permutations.
+        shuffle: If False, samples in order.
+
+    '''
+
+    def __init__(self, data_source, seed=0, shuffle=True):
+        self.data_source = data_source
+        self.seed = seed
+        self.shuffle = shuffle
+        self.epoch = 0
+        self.start = 0
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def set_start(self, start):
+        '''Sets the number of samples of the epoch to skip on the next pass.
+
+        '''
+        self.start = start
+
+    def indices(self):
+        '''Indices left to sample in the current epoch.
+
+        The start position applies to a single pass and is reset afterwards.
+
+        '''
+        N = len(self.data_source)
+        if self.shuffle:
+            generator = torch.Generator()
+            generator.manual_seed(self.seed * 100003 + self.epoch)
+            index = torch.randperm(N, generator=generator)
+        else:
+            index = torch.arange(N)
+
+        start, self.start = self.start, 0
+        return index[start:]
+
+    def __iter__(self):
+        return iter(self.indices().tolist())
+
+    def __len__(self):
+        return len(self.data_source)
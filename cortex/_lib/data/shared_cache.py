@@ -0,0 +1,191 @@
+'''Host-level cache of arrays shared between processes.
+
+Arrays are published once as `.npy` files under a cache directory (by
+default in `/dev/shm`, so they live in shared memory) and attached read-only
+with `mmap`, so every process and loader worker on the host reads the same
+pages. Each entry keeps one reference file per attached process and is
+removed when the last one detaches.
+
+'''
+
+import atexit
+import fcntl
+import json
+import logging
+import os
+from os import path
+import re
+import shutil
+import tempfile
+
+import numpy as np
+
+__author__ = 'R Devon Hjelm'
+__author_email__ = 'erroneus@gmail.com'
+
+logger = logging.getLogger('cortex.data')
+
+CACHE = None
+
+
+def default_root():
+    if path.isdir('/dev/shm'):
+        return '/dev/shm/cortex'
+    return path.join(tempfile.gettempdir(), 'cortex_shared')
+
+
+def set_cache(root=None):
+    '''Sets the host-level cache used by dataset plugins.
+
+    Args:
+        root: Directory of the cache. If None, the cache is disabled.
+
+    '''
+    global CACHE
+    if CACHE is not None:
+        if root == CACHE.root:
+            return
+        CACHE.release_all()
+    CACHE = SharedArrayCache(root) if root else None
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class _Lock:
+    '''Exclusive lock on an entry held by a lock file next to it.
+
+    '''
+
+    def __init__(self, entry):
+        self.lock_path = entry + '.lock'
+
+    def __enter__(self):
+        self.f = open(self.lock_path, 'a')
+        fcntl.flock(self.f, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *args):
+        fcntl.flock(self.f, fcntl.LOCK_UN)
+        self.f.close()
+
+
+class SharedArrayCache:
+    '''Arrays shared read-only between the processes of a host.
+
+    Args:
+        root: Directory of the cache.
+
+    '''
+    _complete = 'COMPLETE'
+    _manifest = 'manifest.json'
+
+    def __init__(self, root):
+        self.root = root
+        self.pid = os.getpid()
+        self._attached = {}
+        os.makedirs(root, exist_ok=True)
+        atexit.register(self.release_all)
+
+    def entry_path(self, key):
+        return path.join(self.root, re.sub(r'[^\w.-]', '_', key))
+
+    def get(self, key, build):
+        '''Attaches to the arrays of an entry, publishing them if needed.
+
+        Args:
+            key: Name of the entry.
+            build: Function returning a dict of arrays. Only called by the
+                first process to request the entry.
+
+        Returns:
+            dict: Read-only memory-mapped arrays.
+
+        '''
+        if key in self._attached:
+            return self._attached[key]
+
+        entry = self.entry_path(key)
+        with _Lock(entry):
+            if not path.isfile(path.join(entry, self._complete)):
+                self._publish(entry, build())
+            with open(path.join(entry, self._manifest)) as f:
+                names = json.load(f)
+            refs = path.join(entry, 'refs')
+            os.makedirs(refs, exist_ok=True)
+            open(path.join(refs, str(self.pid)), 'w').close()
+
+        arrays = dict((name, np.load(path.join(entry, name + '.npy'),
+                                     mmap_mode='r'))
+                      for name in names)
+        self._attached[key] = arrays
+        return arrays
+
+    def _publish(self, entry, arrays):
+        logger.info('Publishing {} to shared cache {}'
+                    .format(sorted(arrays.keys()), entry))
+        if path.isdir(entry):
+            # Left over from a process killed while publishing.
+            shutil.rmtree(entry)
+        tmp_entry = entry + '.tmp{}'.format(self.pid)
+        os.makedirs(tmp_entry)
+        for name, array in arrays.items():
+            np.save(path.join(tmp_entry, name + '.npy'), np.asarray(array))
+        with open(path.join(tmp_entry, self._manifest), 'w') as f:
+            json.dump(sorted(arrays.keys()), f)
+        open(path.join(tmp_entry, self._complete), 'w').close()
+        os.replace(tmp_entry, entry)
+
+    def n_refs(self, key):
+        '''Number of live processes attached to an entry.
+
+        '''
+        refs = path.join(self.entry_path(key), 'refs')
+        if not path.isdir(refs):
+            return 0
+        return len([p for p in os.listdir(refs) if _pid_alive(int(p))])
+
+    def release(self, key):
+        '''Detaches from an entry, removing it if no process is attached.
+
+        '''
+        if os.getpid() != self.pid or key not in self._attached:
+            return
+        del self._attached[key]
+
+        entry = self.entry_path(key)
+        refs = path.join(entry, 'refs')
+        with _Lock(entry):
+            for pid in os.listdir(refs):
+                if int(pid) == self.pid or not _pid_alive(int(pid)):
+                    os.remove(path.join(refs, pid))
+            if not os.listdir(refs):
+                logger.debug('Removing {} from shared cache'.format(entry))
+                shutil.rmtree(entry)
+
+    def release_all(self):
+        for key in list(self._attached.keys()):
+            self.release(key)
+
+
+def shared_arrays(key, build):
+    '''Gets arrays from the host-level cache.
+
+    Args:
+        key: Name of the entry.
+        build: Function returning a dict of arrays.
+
+    Returns:
+        dict: The arrays, from the cache if one is set, otherwise as built.
+
+    '''
+    if CACHE is None:
+        return build()
+    return CACHE.get(key, build)
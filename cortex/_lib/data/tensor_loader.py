@@ -0,0 +1,99 @@
+'''Loader for datasets that fit in memory as tensors.
+
+'''
+
+import logging
+import math
+
+import torch
+from torch.utils.data import DataLoader, TensorDataset
+
+__author__ = 'R Devon Hjelm'
+__author_email__ = 'erroneus@gmail.com'
+
+logger = logging.getLogger('cortex.data')
+
+
+def get_tensors(dataset):
+    '''Returns the tensors of a tensor-resident dataset.
+
+    Args:
+        dataset: A dataset.
+
+    Returns:
+        tuple: The tensors if `dataset` is a :class:`TensorDataset`,
+            otherwise None.
+
+    '''
+    if isinstance(dataset, TensorDataset):
+        return tuple(dataset.tensors)
+    return None
+
+
+def materialize(dataset, batch_size=1024, n_workers=0):
+    '''Decodes a whole dataset once into tensors.
+
+    Only use with deterministic transforms: random augmentations are frozen
+    to the draw made here.
+
+    Args:
+        dataset: A dataset whose samples are tuples of tensors or numbers.
+        batch_size: Batch size used while decoding.
+        n_workers: Number of workers used while decoding.
+
+    Returns:
+        tuple: One tensor per element of the samples.
+
+    '''
+    loader = DataLoader(dataset, batch_size=batch_size, shuffle=False,
+                        num_workers=n_workers)
+    batches = list(loader)
+    return tuple(torch.cat(t) for t in zip(*batches))
+
+
+class TensorLoader:
+    '''Serves batches from tensors that are resident on a device.
+
+    Replaces :class:`torch.utils.data.DataLoader` for in-memory datasets:
+    batches are gathered with one `index_select` per tensor from a shuffled
+    index, with no worker processes, collation or inter-process copies.
+
+    Args:
+        tensors: Tensors with the same size in the first dimension.
+        batch_size: Batch size.
+        shuffle: Shuffle the data each epoch.
+        device: Device on which the tensors and batches live.
+        sampler: Optional sampler with an `indices` method giving the order
+            of the samples. Overrides `shuffle`.
+
+    '''
+
+    def __init__(self, tensors, batch_size=1, shuffle=False, device=None,
+                 sampler=None):
+        sizes = set(t.size(0) for t in tensors)
+        if len(sizes) != 1:
+            raise ValueError('Tensors must have the same size in the first '
+                             'dimension. Got {}'.format(sizes))
+
+        self.device = torch.device(device or 'cpu')
+        self.tensors = tuple(t.to(self.device) for t in tensors)
+        self.dataset = TensorDataset(*self.tensors)
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.sampler = sampler
+
+    def __len__(self):
+        return int(math.ceil(len(self.dataset) / float(self.batch_size)))
+
+    def __iter__(self):
+        N = len(self.dataset)
+        if self.sampler is not None:
+            index = self.sampler.indices().to(self.device)
+        elif self.shuffle:
+            index = torch.randperm(N, device=self.device)
+        else:
+            index = torch.arange(N, device=self.device)
+
+        for i in range(0, len(index), self.batch_size):
+            idx = index[i:i + self.batch_size]
+            yield [t.index_select(0, idx) for t in self.tensors]
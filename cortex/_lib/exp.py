@@ -12,6 +12,7 @@ import yaml
 
 import torch
 
+from . import scheduler
 from .log_utils import set_file_logger
 
 __author__ = 'R Devon Hjelm'
@@ -91,7 +92,12 @@ def save(model, prefix=''):
         info=INFO,
         args=ARGS,
         out_dirs=OUT_DIRS,
-        summary=SUMMARY
+        summary=SUMMARY,
+        data=model.data.state_dict(),
+        training_nets=dict(model._training_nets),
+        optimizers=dict((k, op.state_dict())
+                        for k, op in model._optimizers.items()),
+        schedulers=scheduler.state_dict()
     )
 
     file_path = path.join(binary_dir, '{}.t7'.format(prefix))
@@ -2,10 +2,13 @@
 
 '''
 
+import contextlib
 import copy
 import logging
 import time
 
+import torch
+
 from . import data, exp, optimizer
 from .parsing import parse_docstring, parse_inputs, parse_kwargs
 from .handlers import (aliased, prefixed, NetworkHandler, LossHandler,
@@ -20,6 +23,8 @@ __author_email__ = 'erroneus@gmail.com'
 logger = logging.getLogger('cortex.models')
 
 MODEL_PLUGINS = {}
+_precisions = dict(fp32=None, bf16=torch.bfloat16)
+_memory_formats = dict(contiguous=None, channels_last=torch.channels_last)
 
 
 def register_model(plugin):
@@ -42,6 +47,48 @@ def register_model(plugin):
     MODEL_PLUGINS[plugin.__name__] = plugin()
 
 
+def trains(*keys):
+    '''Declares the networks a routine trains.
+
+    Otherwise they are found by running the routine and looking at which
+    losses it sets.
+
+    Args:
+        *keys: Names of the networks whose losses the routine sets.
+
+    Example:
+        ```
+        @trains('discriminator')
+        def routine(self, real, fake):
+            ...
+            self.losses.discriminator = loss
+        ```
+
+    '''
+    def decorator(fn):
+        fn.nets_trained = keys
+        return fn
+    return decorator
+
+
+def _to_float32(handler):
+    '''Casts the reduced precision tensors of a handler to fp32.
+
+    '''
+    for k, v in list(handler.items()):
+        if isinstance(v, (list, tuple)):
+            if any(_is_reduced(v_) for v_ in v):
+                handler[k] = type(v)(v_.float() if _is_reduced(v_) else v_
+                                     for v_ in v)
+        elif _is_reduced(v):
+            handler[k] = v.float()
+
+
+def _is_reduced(v):
+    return isinstance(v, torch.Tensor) and v.is_floating_point() \
+        and v.dtype != torch.float32
+
+
 def get_model(model_name):
     try:
         return MODEL_PLUGINS[model_name]
@@ -105,6 +152,12 @@ class ModelPluginBase(metaclass=PluginType):
     _optimizers = optimizer.OPTIMIZERS
 
     _training_nets = dict()
+    # Dtype the routines are autocast to, None for full precision. Shared
+    # by all models.
+    _autocast_dtype = None
+    # Names of the networks trained by the routine. Same as decorating the
+    # routine with `trains`.
+    nets_trained = None
 
     _all_nets = NetworkHandler(allow_overwrite=False)
     _all_losses = LossHandler(_all_nets, add_values=True)
@@ -128,6 +181,7 @@ class ModelPluginBase(metaclass=PluginType):
         self._train = False
         self._models = []
         self.name = self.__class__.__name__
+        self._path = self.name
 
         if contract:
             contract = self._check_contract(contract)
@@ -185,6 +239,11 @@ class ModelPluginBase(metaclass=PluginType):
     def _get_id(self, fn):
         '''Gets a unique identifier for a function.
 
+        The path of the model from the top-level model is used, as it is
+        unique and the same across runs, so the identifier can be saved with
+        the checkpoint. Names alone can be shared by submodels at different
+        levels.
+
         Args:
             fn: a callable.
 
@@ -192,7 +251,98 @@ class ModelPluginBase(metaclass=PluginType):
             An indetifier.
 
         '''
-        return fn
+        return self._path
+
+    def _set_path(self, path):
+        '''Sets the path of the model and of its submodels.
+
+        Args:
+            path: Attribute names from the top-level model, joined by `.`.
+
+        '''
+        self._path = path
+        for model in self._models:
+            model._set_path(path + '.' + model.name)
+
+    @staticmethod
+    def _set_precision(precision):
+        '''Sets the precision the routines run in.
+
+        Args:
+            precision: `fp32`, or `bf16` to run the routines under autocast.
+                The weights, and so the optimizer updates, stay in fp32.
+
+        '''
+        if precision not in _precisions:
+            raise ValueError('Precision `{}` not supported. Supported: {}'
+                             .format(precision, tuple(_precisions.keys())))
+        ModelPluginBase._autocast_dtype = _precisions[precision]
+
+    def _set_memory_format(self, memory_format):
+        '''Sets the memory format of the networks and image batches.
+
+        Args:
+            memory_format: `contiguous`, or `channels_last` to convert the
+                convolution weights and image batches to NHWC.
+
+        '''
+        if memory_format not in _memory_formats:
+            raise ValueError('Memory format `{}` not supported. Supported: {}'
+                             .format(memory_format,
+                                     tuple(_memory_formats.keys())))
+        memory_format = _memory_formats[memory_format]
+        self.data.set_memory_format(memory_format)
+        if memory_format is None:
+            return
+
+        for network in self._all_nets.values():
+            if isinstance(network, (list, tuple)):
+                for net in network:
+                    net.to(memory_format=memory_format)
+            else:
+                network.to(memory_format=memory_format)
+
+    def _autocast(self):
+        if self._autocast_dtype is None:
+            return contextlib.nullcontext()
+        return torch.autocast(device_type=torch.device(exp.DEVICE).type,
+                              dtype=self._autocast_dtype)
+
+    def _declared_training_nets(self):
+        '''Gets the networks declared as trained by the routine.
+
+        Returns:
+            list: Names of the networks, or None if not declared.
+
+        '''
+        keys = getattr(self._routine, 'nets_trained', None)
+        if keys is None:
+            keys = self.nets_trained
+        if keys is None:
+            return None
+        aliases = self.nets._aliases
+        return [aliases.get(k, k) for k in keys]
+
+    def _find_training_nets(self):
+        '''Gets the training nets of this model and its submodels without
+        running the routines.
+
+        Returns:
+            bool: True if the training nets of all the routines are known.
+
+        '''
+        known = True
+        fid = self._get_id(self._routine)
+        if fid not in self._training_nets:
+            declared = self._declared_training_nets()
+            if declared is None:
+                known = False
+            else:
+                self._training_nets[fid] = declared
+
+        for model in self._models:
+            known = model._find_training_nets() and known
+        return known
 
     @property
     def kwargs(self):
@@ -289,6 +439,7 @@ class ModelPluginBase(metaclass=PluginType):
                     self.help[k] = help[k]
             model._set_kwargs(self._kwargs)
             model.name = key
+            model._set_path(self._path + '.' + key)
 
             model._results = prefixed(
                 model._all_results, prefix=model.name)
@@ -424,15 +575,45 @@ class ModelPluginBase(metaclass=PluginType):
 
         '''
 
-        fn = self.routine
-        fn = self._wrap(fn)
+        self._routine = self.routine
+        fn = self._wrap(self.routine)
+
+        def prepare(training_nets):
+            for k in training_nets:
+                net = self.nets[k]
+
+                optimizer = self._optimizers.get(k)
+                if optimizer is not None:
+                    optimizer.zero_grad()
+
+                for p in net.parameters():
+                    p.requires_grad = k in training_nets
+                net.train()
 
         def wrapped(*args, **kwargs):
             fid = self._get_id(fn)
 
             if fid not in self._training_nets:
+                declared = self._declared_training_nets()
+                if declared is not None:
+                    self._training_nets[fid] = declared
+
+            training_nets = self._training_nets.get(fid)
+            if training_nets is None:
+                # The training nets are found from the losses this run sets.
                 losses_before = dict(kv for kv in self._all_losses.items())
-                fn(*args, **kwargs)
+            elif self._train:
+                prepare(training_nets)
+
+            start = time.time()
+            with self._autocast():
+                output = fn(*args, **kwargs)
+            if self._autocast_dtype is not None:
+                # Losses and results are gathered and reduced in fp32.
+                _to_float32(self.losses)
+                _to_float32(self.results)
+
+            if training_nets is None:
                 losses_after = dict(kv for kv in self._all_losses.items())
 
                 training_nets = []
@@ -441,36 +622,23 @@ class ModelPluginBase(metaclass=PluginType):
                     try:
                         if k not in losses_before:
                             training_nets.append(k)
-                        elif v != losses_before[k]:
+                        elif v is not losses_before[k]:
                             training_nets.append(k)
                     except TypeError:
                         training_nets.append(k)
                 self._training_nets[fid] = training_nets
-                for k in training_nets:
-                    self.losses.pop(k)
-            else:
-                training_nets = self._training_nets[fid]
 
-            if self._train:
-                for k in training_nets:
-                    net = self.nets[k]
+                # Gradients are only computed at the backward, so this
+                # can follow the forward.
+                if self._train:
+                    prepare(training_nets)
 
-                    optimizer = self._optimizers.get(k)
-                    if optimizer is not None:
-                        optimizer.zero_grad()
-
-                    for p in net.parameters():
-                        p.requires_grad = k in training_nets
-                    net.train()
-
-            start = time.time()
-            output = fn(*args, **kwargs)
             self._check_bad_values()
             end = time.time()
 
             update_dict_of_lists(self._epoch_results, **self.results)
             update_dict_of_lists(self._epoch_times,
-                                 **{self.name: end - start})
+                                 **{fid: end - start})
             losses = dict()
             for k, v in self.losses.items():
                 if isinstance(v, (tuple, list)):
@@ -536,7 +704,7 @@ class ModelPluginBase(metaclass=PluginType):
         def wrapped(epoch, data_mode=data_mode, use_pbar=True):
             self._reset_epoch()
             self.data.reset(data_mode, string=epoch_str.format(exp.NAME, epoch),
-                            make_pbar=use_pbar)
+                            make_pbar=use_pbar, epoch=epoch)
             fn()
 
             results = self._all_epoch_results
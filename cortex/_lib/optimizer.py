@@ -3,13 +3,16 @@
 '''
 
 from collections import defaultdict
+import inspect
 import logging
+import time
 
 import torch
 import torch.optim as optim
 import torch.backends.cudnn as cudnn
 
 from . import exp
+from . import scheduler as _scheduler
 
 
 __author__ = 'R Devon Hjelm'
@@ -17,6 +20,11 @@ __author_email__ = 'erroneus@gmail.com'
 
 logger = logging.getLogger('cortex.optimizer')
 OPTIMIZERS = {}
+JOINT_BACKWARD = False
+# Optimizer states of a reloaded checkpoint, loaded at setup.
+_reloaded_state = {}
+
+_impls = ('default', 'foreach', 'fused')
 
 _optimizer_defaults = dict(
     SGD=dict(),
@@ -24,16 +32,89 @@ _optimizer_defaults = dict(
 )
 
 
+def clip_params(params, bound):
+    '''Clamps parameters in place to [-bound, bound].
+
+    On GPU, uses multi-tensor kernels, one launch per op for the whole list.
+    On CPU these run per tensor, where a single clamp is cheaper than the
+    two passes they need.
+
+    Args:
+        params: List of parameters.
+        bound: Clipping bound.
+
+    '''
+    params = [p.data for p in params]
+    if not params:
+        return
+    if params[0].is_cuda and hasattr(torch, '_foreach_clamp_min_'):
+        torch._foreach_clamp_min_(params, -bound)
+        torch._foreach_clamp_max_(params, bound)
+    else:
+        for p in params:
+            p.clamp_(-bound, bound)
+
+
+def l1_decay_params(params, factor):
+    '''Shrinks parameters in place by their L1-normalized value.
+
+    Each parameter `p` becomes `p - factor * p / |p|_1`, computed with
+    multi-tensor kernels when available.
+
+    Args:
+        params: List of parameters.
+        factor: Decay factor.
+
+    '''
+    params = [p.data for p in params]
+    if not params:
+        return
+    if hasattr(torch, '_foreach_norm'):
+        norms = torch._foreach_norm(params, 1)
+        torch._foreach_clamp_min_(norms, 1e-12)
+        scales = torch._foreach_reciprocal(norms)
+        torch._foreach_mul_(scales, -factor)
+        torch._foreach_add_(scales, 1.)
+        torch._foreach_mul_(params, scales)
+    else:
+        for p in params:
+            p.mul_(1. - factor / p.norm(1).clamp(min=1e-12))
+
+
+def _after_step(optimizer):
+    for group in optimizer.param_groups:
+        if group['l1_decay']:
+            l1_decay_params(group['params'], group['l1_decay'])
+        if group['clipping']:
+            clip_params(group['params'], group['clipping'])
+    if optimizer.scheduler is not None and \
+            optimizer.scheduler.interval == 'step':
+        optimizer.scheduler.step()
+
+
 def wrap_optimizer(C):
     class Op(C):
-        def __init__(self, params, clipping=None, **kwargs):
+        def __init__(self, params, clipping=None, l1_decay=None,
+                     accumulate=1, **kwargs):
+            params = list(params)
             super().__init__(params, **kwargs)
 
             if clipping is not None and clipping < 0.0:
                 raise ValueError(
                     "Invalid clipping value: {}".format(clipping))
+            if l1_decay is not None and l1_decay < 0.0:
+                raise ValueError(
+                    "Invalid l1_decay value: {}".format(l1_decay))
+            if accumulate < 1:
+                raise ValueError(
+                    "Invalid accumulate value: {}".format(accumulate))
 
-            self.defaults.update(clipping=clipping)
+            self.defaults.update(clipping=clipping, l1_decay=l1_decay)
+            self.accumulate = accumulate
+            self.scheduler = None
+            self.step_time = 0.
+            self._n_accumulated = 0
+            self._accumulated = {}
 
             self.state = defaultdict(dict)
             self.param_groups = []
@@ -50,25 +131,204 @@ def wrap_optimizer(C):
         def step(self, closure=None):
             """Performs a single optimization step.
 
+            With `accumulate` > 1, the gradients are averaged over that many
+            calls and the update is only made on the last of them.
+
+            A scheduler stepped per iteration is stepped after each update.
+
+            The time taken is kept in `step_time`. On GPU, this is the time
+            spent launching the kernels, as it does not synchronize.
+
             Arguments:
                 closure (callable, optional): A closure that reevaluates the model
                     and returns the loss.
             """
+            start = time.time()
+            if self.accumulate > 1 and not self._accumulate_grads():
+                self.step_time = time.time() - start
+                return None
+
             loss = super().step(closure=closure)
+            _after_step(self)
+            self.step_time = time.time() - start
+            return loss
+
+        def _accumulate_grads(self):
+            '''Adds the gradients to the accumulated ones.
+
+            The gradients are accumulated apart from `.grad`, which is zeroed
+            before each routine and can receive gradients of other losses.
+
+            Returns:
+                bool: True if the gradients have been accumulated `accumulate`
+                    times, in which case `.grad` is set to their average.
 
+            '''
+            self._n_accumulated += 1
+            done = self._n_accumulated == self.accumulate
             for group in self.param_groups:
-                bound = group['clipping']
-                if bound:
-                    for p in group['params']:
-                        p.data.clamp_(-bound, bound)
-            return loss
+                for p in group['params']:
+                    if p.grad is None:
+                        continue
+                    acc = self._accumulated.get(p)
+                    if acc is None:
+                        acc = self._accumulated[p] = torch.zeros_like(p.grad)
+                    acc.add_(p.grad, alpha=1. / self.accumulate)
+            if done:
+                # Includes parameters without gradient in the last call.
+                for p, acc in self._accumulated.items():
+                    if p.grad is None:
+                        p.grad = acc.clone()
+                    else:
+                        p.grad.copy_(acc)
+                    acc.zero_()
+                self._n_accumulated = 0
+            return done
 
     return Op
 
 
+def _impl_options(op, impl):
+    '''Gets the options selecting an implementation of an optimizer.
+
+    Args:
+        op: Optimizer class.
+        impl: One of `default`, `foreach` or `fused`.
+
+    Returns:
+        dict: Options to pass to the optimizer.
+
+    '''
+    if impl not in _impls:
+        raise ValueError('Optimizer implementation `{}` not supported. '
+                         'Supported: {}'.format(impl, _impls))
+    if impl == 'default':
+        return {}
+
+    supported = inspect.signature(op.__init__).parameters
+    if impl == 'fused' and 'fused' not in supported:
+        logger.warning('{} has no fused implementation, using foreach.'
+                       .format(op.__name__))
+        impl = 'foreach'
+    if impl not in supported:
+        logger.warning('{} has no {} implementation, using the default.'
+                       .format(op.__name__, impl))
+        return {}
+    return {impl: True}
+
+
+def _build_optimizer(op, params, network_key, options):
+    try:
+        return op(params, **options)
+    except RuntimeError as e:
+        if not options.get('fused'):
+            raise
+        # Fused kernels are not available on every device.
+        logger.warning('Fused optimizer not available for {} ({}), '
+                       'using foreach.'.format(network_key, e))
+        options = dict(options, fused=False, foreach=True)
+        return op(params, **options)
+
+
+def load_state_dict(state):
+    '''Sets optimizer states to load when the optimizers are built.
+
+    '''
+    _reloaded_state.clear()
+    _reloaded_state.update(**state)
+
+
+def _load_state(optimizer, network_key):
+    '''Loads the reloaded state of an optimizer.
+
+    The moments and step counts come from the checkpoint, while the
+    hyperparameters, such as the learning rate, are kept as configured.
+
+    '''
+    if network_key not in _reloaded_state:
+        return
+    configured = [dict((k, v) for k, v in group.items() if k != 'params')
+                  for group in optimizer.param_groups]
+    try:
+        optimizer.load_state_dict(_reloaded_state[network_key])
+    except ValueError as e:
+        logger.warning('Could not reload optimizer state of {} ({}), '
+                       'starting from scratch.'.format(network_key, e))
+        return
+    for group, configured_group in zip(optimizer.param_groups, configured):
+        group.update(**configured_group)
+    logger.info('Reloaded optimizer state of {}'.format(network_key))
+
+
+def _graph(loss):
+    '''Traverses the autograd graph of a loss.
+
+    Returns:
+        tuple: Set of the intermediate nodes and set of the leaf tensors.
+
+    '''
+    nodes = set()
+    leaves = set()
+    stack = [loss.grad_fn]
+    while stack:
+        fn = stack.pop()
+        if fn is None or fn in nodes:
+            continue
+        nodes.add(fn)
+        variable = getattr(fn, 'variable', None)
+        if variable is not None:
+            # Leaves hold no buffers, so sharing them needs no retaining.
+            nodes.remove(fn)
+            leaves.add(variable)
+            continue
+        stack += [next_fn for next_fn, _ in fn.next_functions]
+    return nodes, leaves
+
+
+def backward(losses, optimizers=None, joint=None):
+    '''Backpropagates several losses, each followed by its optimizer step.
+
+    The graph of a loss is only retained if a later loss shares part of it,
+    so buffers are freed with their last use. With `joint`, losses whose
+    graphs reach disjoint sets of leaves are backpropagated in a single
+    pass before the steps, which gives the same gradients.
+
+    Args:
+        losses: List of scalar losses.
+        optimizers: List of the optimizer of each loss, or None.
+        joint: Backpropagate losses with disjoint leaves in a single pass.
+            Defaults to `--o.joint_backward`.
+
+    '''
+    joint = JOINT_BACKWARD if joint is None else joint
+    optimizers = optimizers or [None] * len(losses)
+    if len(losses) > 1:
+        graphs = [_graph(loss) for loss in losses]
+    else:
+        graphs = [(set(), set())]
+
+    if joint and len(losses) > 1:
+        leaves = [g[1] for g in graphs]
+        n_leaves = sum(len(leaf) for leaf in leaves)
+        if len(set().union(*leaves)) == n_leaves:
+            torch.autograd.backward(losses)
+            for optimizer in optimizers:
+                if optimizer is not None:
+                    optimizer.step()
+            return
+
+    for i, (loss, optimizer) in enumerate(zip(losses, optimizers)):
+        later_nodes = set().union(*(g[0] for g in graphs[i + 1:]))
+        loss.backward(retain_graph=not graphs[i][0].isdisjoint(later_nodes))
+        if optimizer is not None:
+            optimizer.step()
+
+
 def setup(model, optimizer='Adam', learning_rate=1.e-4,
-          weight_decay={}, clipping={}, optimizer_options={},
-          model_optimizer_options={}):
+          weight_decay={}, clipping={}, l1_decay={}, optimizer_options={},
+          model_optimizer_options={}, accumulate: int=1,
+          joint_backward: bool=False, impl: str='default', scheduler={},
+          scheduler_options={}):
     '''Optimizer entrypoint.
 
     Args:
@@ -76,16 +336,32 @@ def setup(model, optimizer='Adam', learning_rate=1.e-4,
         learning_rate: Learning rate.
         updates_per_routine: Updates per routine.
         clipping: If set, this is the clipping for each model.
+        l1_decay: If set, this is the L1 decay for specified model.
         weight_decay: If set, this is the weight decay for specified model.
         optimizer_options: Optimizer options.
         model_optimizer_options: Optimizer options for specified model.
+        accumulate: Number of steps over which gradients are averaged before
+            each update, for larger effective batch sizes.
+        joint_backward: Backpropagate losses of a step in a single pass when
+            they reach disjoint parameters.
+        impl: Implementation of the update. `foreach` uses multi-tensor
+            kernels and `fused` a single kernel per step, where the
+            optimizer has them. {default, foreach, fused}
+        scheduler: Learning rate scheduler for specified model.
+            {warmup, step, cosine, one_cycle, plateau}
+        scheduler_options: Scheduler options, e.g. `interval` (step or
+            epoch), `warmup`, `T_max`, or `key` for plateau. Options keyed by
+            a model only apply to that model.
 
     '''
 
+    global JOINT_BACKWARD
     OPTIMIZERS.clear()
+    JOINT_BACKWARD = joint_backward
     model_optimizer_options = model_optimizer_options or {}
     weight_decay = weight_decay or {}
     clipping = clipping or {}
+    l1_decay = l1_decay or {}
 
     # Set the optimizer options
     if len(optimizer_options) == 0:
@@ -121,14 +397,21 @@ def setup(model, optimizer='Adam', learning_rate=1.e-4,
                     torch.cuda.device_count()))
 
     model._reset_epoch()
-    model.data.reset(make_pbar=False, mode='test')
-    model.train_step(_init=True)
-    model.visualize(auto_input=True)
+    if not model._find_training_nets():
+        # Runs a step to find the networks trained by the routines.
+        model.data.reset(make_pbar=False, mode='test')
+        model.train_step(_init=True)
+        model.visualize(auto_input=True)
 
     training_nets = model._get_training_nets()
 
     logger.info('Setting up optimizers for {}'.format(set(training_nets)))
 
+    impl_options = _impl_options(op, impl)
+    # Wrapped once: wrapping again would apply clipping and accumulation
+    # several times per step.
+    op = wrap_optimizer(op)
+
     for network_key in set(training_nets):
         logger.debug('Building optimizer for {}'.format(network_key))
         network = model.nets[network_key]
@@ -161,22 +444,36 @@ def setup(model, optimizer='Adam', learning_rate=1.e-4,
         else:
             cl = clipping
 
+        if isinstance(l1_decay, dict):
+            l1 = l1_decay.get(network_key, None)
+        else:
+            l1 = l1_decay
+
         # Update the optimizer options
         optimizer_options_ = dict((k, v) for k, v in optimizer_options.items())
-        optimizer_options_.update(weight_decay=wd, clipping=cl, lr=eta)
+        optimizer_options_.update(weight_decay=wd, clipping=cl, l1_decay=l1,
+                                  lr=eta, accumulate=accumulate)
+        optimizer_options_.update(**impl_options)
 
         if network_key in model_optimizer_options.keys():
             optimizer_options_.update(**model_optimizer_options)
 
         # Create the optimizer
-        op = wrap_optimizer(op)
-
-        optimizer = op(params, **optimizer_options_)
+        optimizer = _build_optimizer(op, params, network_key,
+                                     optimizer_options_)
+        _load_state(optimizer, network_key)
         OPTIMIZERS[network_key] = optimizer
 
         logger.debug(
             'Training {} routine with {}'.format(
                 network_key, optimizer))
 
+    _reloaded_state.clear()
+
+    epochs = exp.ARGS['train'].get('epochs')
+    _scheduler.setup(OPTIMIZERS, scheduler=scheduler,
+                     scheduler_options=scheduler_options,
+                     epochs=epochs if isinstance(epochs, int) else None)
+
     if not exp.DEVICE == torch.device('cpu'):
         cudnn.benchmark = True
@@ -311,6 +311,14 @@ def parse_args(models, model=None):
             'setup', help='Setup cortex configuration.',
             description='Initializes or updates the `.cortex.yml` file.')
 
+        subparser = subparsers.add_parser(
+            'bench-data', help='Benchmark data loading.',
+            description='Times data loading without a model over loader '
+                        'settings and caches the fastest for this host.')
+        subparser.add_argument('--n_batches', type=int, default=50,
+                               help='Number of batches timed per setting.')
+        _parse_defaults('data', default_args['data'], subparser)
+
         for k, model in models.items():
             model_help, model_description = parse_header(model)
             subparser = subparsers.add_parser(
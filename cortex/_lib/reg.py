@@ -1,4 +1,5 @@
 from . import models
+from .optimizer import clip_params, l1_decay_params
 
 __author__ = 'Bradley Baker'
 __author_email__ = 'bbaker@mrn.org'
@@ -23,6 +24,12 @@ def init(clipping=None, weight_decay=None):
     L1_DECAY.update(**weight_decay)
 
 
+def _parameters(model):
+    if isinstance(model, (list, tuple)):
+        return [p for net in model for p in net.parameters()]
+    return list(model.parameters())
+
+
 def clip(key):
     '''
        called in train.py, clip weights
@@ -32,13 +39,7 @@ def clip(key):
     bound = CLIPPING[key]
     if key in models.MODEL_HANDLER:
         model = models.MODEL_HANDLER[key]
-        if isinstance(model, (list, tuple)):
-            for net in model:
-                for p in net.parameters():
-                    p.data.clamp_(-bound, bound)
-        else:
-            for p in model.parameters():
-                p.data.clamp_(-bound, bound)
+        clip_params(_parameters(model), bound)
 
 
 def l1_decay(key):
@@ -50,10 +51,4 @@ def l1_decay(key):
     factor = L1_DECAY[key]
     if key in models.MODEL_HANDLER:
         model = models.MODEL_HANDLER[key]
-        if isinstance(model, (list, tuple)):
-            for net in model:
-                for p in net.parameters():
-                    p.add(factor * (p / p.norm(1)))
-        else:
-            for p in model.parameters():
-                p.add(factor * (p / p.norm(1)))
+        l1_decay_params(_parameters(model), factor)
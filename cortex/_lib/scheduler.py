@@ -0,0 +1,241 @@
+'''Learning rate schedulers.
+
+Each trained network can have a scheduler, built on its optimizer. Schedulers
+stepped per iteration are stepped with their optimizer, the others by the
+main loop at the end of each epoch.
+
+'''
+
+import logging
+
+from torch.optim import lr_scheduler
+
+__author__ = 'R Devon Hjelm'
+__author_email__ = 'erroneus@gmail.com'
+
+logger = logging.getLogger('cortex.scheduler')
+
+SCHEDULERS = {}
+# Scheduler states of a reloaded checkpoint, loaded at setup.
+_reloaded_state = {}
+
+_scheduler_defaults = dict(
+    interval='epoch',
+    warmup=0,
+    T_max=None,
+    eta_min=0.,
+    step_size=30,
+    gamma=0.1,
+    max_lr=None,
+    key=None,
+    on='test',
+    mode='min',
+    factor=0.1,
+    patience=10
+)
+
+
+def _get_length(name, options, epochs):
+    length = options['T_max']
+    if length is None:
+        if options['interval'] != 'epoch' or not epochs:
+            raise ValueError('Scheduler `{}` stepped per {} needs `T_max`.'
+                             .format(name, options['interval']))
+        length = epochs
+    return length - options['warmup']
+
+
+def build(optimizer, name, options=None, epochs=None):
+    '''Builds a scheduler.
+
+    Args:
+        optimizer: Optimizer to schedule.
+        name: Type of scheduler.
+            {warmup, step, cosine, one_cycle, plateau}
+        options: Options of the scheduler, see `_scheduler_defaults`.
+            Lengths are in `interval`, either `step` or `epoch`.
+        epochs: Number of epochs, the default length of schedules stepped
+            per epoch.
+
+    Returns:
+        A scheduler, with its `interval`.
+
+    '''
+    options = options or {}
+    unknown = sorted(set(options) - set(_scheduler_defaults))
+    if unknown:
+        raise ValueError('Unknown scheduler options {}. Valid options: {}'
+                         .format(unknown, sorted(_scheduler_defaults)))
+    options_ = dict(_scheduler_defaults)
+    options_.update(**options)
+    options = options_
+    warmup = options['warmup']
+
+    if name == 'warmup':
+        if warmup <= 0:
+            raise ValueError('Scheduler `warmup` needs `warmup` > 0.')
+        n_warmup = warmup
+        scheduler = lr_scheduler.LambdaLR(
+            optimizer, lambda i: min(1., (i + 1) / n_warmup))
+        warmup = 0
+    elif name == 'step':
+        scheduler = lr_scheduler.StepLR(
+            optimizer, step_size=options['step_size'],
+            gamma=options['gamma'])
+    elif name == 'cosine':
+        scheduler = lr_scheduler.CosineAnnealingLR(
+            optimizer, T_max=_get_length(name, options, epochs),
+            eta_min=options['eta_min'])
+    elif name == 'one_cycle':
+        max_lr = options['max_lr'] or [
+            group['lr'] for group in optimizer.param_groups]
+        # Has its own warmup.
+        scheduler = lr_scheduler.OneCycleLR(
+            optimizer, max_lr=max_lr,
+            total_steps=_get_length(name, options, epochs) + warmup)
+        warmup = 0
+    elif name == 'plateau':
+        if options['key'] is None:
+            raise ValueError('Scheduler `plateau` needs the summary `key` '
+                             'to monitor.')
+        if warmup:
+            raise ValueError('Scheduler `plateau` does not support warmup.')
+        scheduler = lr_scheduler.ReduceLROnPlateau(
+            optimizer, mode=options['mode'], factor=options['factor'],
+            patience=options['patience'])
+        options['interval'] = 'epoch'
+    else:
+        raise NotImplementedError(
+            'Scheduler `{}` not supported. Supported: [warmup, step, cosine, '
+            'one_cycle, plateau]'.format(name))
+
+    if warmup:
+        warmup_scheduler = lr_scheduler.LinearLR(
+            optimizer, start_factor=1. / warmup, total_iters=warmup)
+        scheduler = lr_scheduler.SequentialLR(
+            optimizer, [warmup_scheduler, scheduler], milestones=[warmup])
+
+    if options['interval'] not in ('step', 'epoch'):
+        raise ValueError('Scheduler interval must be `step` or `epoch`. Got '
+                         '{}'.format(options['interval']))
+    if options['on'] not in ('train', 'test'):
+        raise ValueError('Scheduler `on` must be `train` or `test`. Got {}'
+                         .format(options['on']))
+    scheduler.interval = options['interval']
+    scheduler.key = options['key']
+    scheduler.on = options['on']
+    return scheduler
+
+
+def _load_state(scheduler, state):
+    scheduler.load_state_dict(state)
+    # Building the scheduler reset the learning rates to those of its
+    # first step.
+    if hasattr(scheduler, 'get_last_lr'):
+        for group, lr in zip(scheduler.optimizer.param_groups,
+                             scheduler.get_last_lr()):
+            group['lr'] = lr
+
+
+def setup(optimizers, scheduler=None, scheduler_options=None, epochs=None):
+    '''Builds the schedulers of the optimizers.
+
+    Args:
+        optimizers: Dictionary of optimizers, keyed by network.
+        scheduler: Type of scheduler, or dictionary of types keyed by
+            network.
+        scheduler_options: Options of the schedulers. Options keyed by a
+            network only apply to that network.
+        epochs: Number of epochs.
+
+    '''
+    SCHEDULERS.clear()
+    scheduler_options = scheduler_options or {}
+
+    networks = sorted(optimizers)
+    unknown = [k for k, v in scheduler_options.items()
+               if isinstance(v, dict) and k not in optimizers]
+    if isinstance(scheduler, dict):
+        unknown += [k for k in scheduler if k not in optimizers]
+    if unknown:
+        raise ValueError('Scheduler keys {} do not match any network. Valid '
+                         'networks: {}'.format(sorted(set(unknown)),
+                                               networks))
+    common_options = dict((k, v) for k, v in scheduler_options.items()
+                          if k not in optimizers)
+
+    for network_key, optimizer in optimizers.items():
+        if isinstance(scheduler, dict):
+            name = scheduler.get(network_key)
+        else:
+            name = scheduler
+        if not name:
+            continue
+
+        options = dict(common_options)
+        options.update(**scheduler_options.get(network_key, {}))
+        SCHEDULERS[network_key] = build(optimizer, name, options=options,
+                                        epochs=epochs)
+        if network_key in _reloaded_state:
+            _load_state(SCHEDULERS[network_key], _reloaded_state[network_key])
+        optimizer.scheduler = SCHEDULERS[network_key]
+        logger.info('Scheduling learning rate of {} with {} per {}'
+                    .format(network_key, name,
+                            SCHEDULERS[network_key].interval))
+    _reloaded_state.clear()
+
+
+def _flatten(results, prefix=''):
+    flattened = {}
+    for k, v in results.items():
+        if isinstance(v, dict):
+            flattened.update(**_flatten(v, prefix=prefix + k + '.'))
+        else:
+            flattened[prefix + k] = v
+    return flattened
+
+
+def step_epoch(train_results=None, test_results=None):
+    '''Steps the schedulers stepped per epoch.
+
+    Args:
+        train_results: Summary of the training epoch.
+        test_results: Summary of the evaluation epoch.
+
+    '''
+    results = dict(train=_flatten(train_results or {}),
+                   test=_flatten(test_results or {}))
+    for network_key, scheduler in SCHEDULERS.items():
+        if scheduler.interval != 'epoch':
+            continue
+        if isinstance(scheduler, lr_scheduler.ReduceLROnPlateau):
+            value = results[scheduler.on].get(scheduler.key)
+            if value is None:
+                logger.warning('Key `{}` not found in {} results, not '
+                               'stepping scheduler of {}.'
+                               .format(scheduler.key, scheduler.on,
+                                       network_key))
+                continue
+            scheduler.step(float(value))
+        else:
+            scheduler.step()
+
+
+def get_lrs():
+    '''Current learning rates of the scheduled networks.
+
+    '''
+    return dict((k, s.optimizer.param_groups[0]['lr'])
+                for k, s in SCHEDULERS.items())
+
+
+def state_dict():
+    return dict((k, s.state_dict()) for k, s in SCHEDULERS.items())
+
+
+def load_state_dict(state):
+    '''Sets scheduler states to load when the schedulers are built.
+
+    '''
+    _reloaded_state.clear()
+    _reloaded_state.update(**state)
@@ -9,7 +9,7 @@ import time
 
 import numpy as np
 
-from . import exp, viz
+from . import exp, scheduler, viz
 from .utils import convert_to_numpy, update_dict_of_lists
 from .viz import plot
 
@@ -62,8 +62,7 @@ def test_epoch(model, epoch, data_mode='test', use_pbar=True):
     model.eval_loop(epoch, data_mode=data_mode, use_pbar=use_pbar)
     results = summarize_results(model._all_epoch_results)
 
-    model.data.reset(make_pbar=False, mode='test')
-    model.data.next()
+    model.data.set_viz_batch(mode='test')
     model.visualize(auto_input=True)
     return results
 
@@ -76,7 +75,8 @@ def display_results(train_results, test_results, epoch, epochs, epoch_time,
 
     times = train_results.pop('times', None)
     if times:
-        time_strs = ['{}: {:.2f}'.format(k, v) for k, v in times.items()]
+        time_strs = ['{}: {:.2f}ms'.format(k, v * 1000)
+                     for k, v in times.items()]
         print('\tAvg update times: ' + ' | '.join(time_strs))
 
     train_losses = train_results.pop('losses')
@@ -186,7 +186,8 @@ def save_best(model, train_results, best, save_on_best, save_on_lowest):
 def main_loop(model, epochs=500, archive_every=10, save_on_best=None,
               save_on_lowest=None, save_on_highest=None, eval_during_train=True,
               train_mode='train', test_mode='test', eval_only=False,
-              pbar_off=False):
+              pbar_off=False, checkpoint_every: int=0,
+              precision: str='fp32', memory_format: str='contiguous'):
     '''
 
     Args:
@@ -200,11 +201,20 @@ def main_loop(model, epochs=500, archive_every=10, save_on_best=None,
         test_mode: Saves when lowest of this result is found.
         eval_only: Gives results over a training epoch.
         pbar_off: Turn off the progressbar.
+        checkpoint_every: Number of training steps between mid-epoch
+            checkpoints, from which `--autoreload` resumes at the same batch.
+            0 to only checkpoint at the end of epochs.
+        precision: Precision of the routines. `bf16` runs them under
+            autocast, with the weights kept in fp32. {fp32, bf16}
+        memory_format: Memory format of the networks and image batches.
+            {contiguous, channels_last}
 
     '''
     info = pprint.pformat(exp.ARGS)
 
     logger.info('Starting main loop.')
+    model._set_precision(precision)
+    model._set_memory_format(memory_format)
 
     if (viz.visualizer):
         viz.visualizer.text(info, env=exp.NAME, win='info')
@@ -224,6 +234,10 @@ def main_loop(model, epochs=500, archive_every=10, save_on_best=None,
     epoch = exp.INFO['epoch']
     first_epoch = epoch
 
+    model.data.set_checkpoint(checkpoint_every,
+                              lambda: exp.save(model, prefix='last'),
+                              mode=train_mode)
+
     while epoch < epochs:
         try:
             epoch = exp.INFO['epoch']
@@ -249,11 +263,17 @@ def main_loop(model, epochs=500, archive_every=10, save_on_best=None,
             update_dict_of_lists(exp.SUMMARY['test'], **test_results_)
             align_summaries(exp.SUMMARY['train'], exp.SUMMARY['test'])
 
+            scheduler.step_epoch(train_results_, test_results_)
+
             # Finishing up
             epoch_time = time.time() - start_time
             total_time += epoch_time
             display_results(train_results_, test_results_, epoch, epochs,
                             epoch_time, total_time)
+            lrs = scheduler.get_lrs()
+            if lrs:
+                print('\tLearning rates: ' + ' | '.join(
+                    '{}: {:.2e}'.format(k, v) for k, v in lrs.items()))
 
             if viz.visualizer:
                 plot(epoch, init=(epoch == first_epoch))
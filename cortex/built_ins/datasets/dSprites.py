@@ -4,29 +4,91 @@ Taken and adapted from https://github.com/Near32/PYTORCH_VAE
 
 '''
 
-
+import logging
+import os
 from os import path
+import shutil
 import urllib.request
+import zipfile
 
+import torch
 from torch.utils.data import Dataset
 import numpy as np
 from PIL import Image
 
-from . import logger
 
+logger = logging.getLogger('cortex.data.dSprites')
 
 DATASETS = ['dSprites']
 
 
+def extract_npz(npz_path, keys, out_dir=None):
+    '''Extracts arrays from an npz archive into uncompressed `.npy` files.
+
+    The members of an npz archive are themselves `.npy` files, so they are
+    streamed out of the archive without being decoded into memory. Each file
+    is written to a temporary name and moved into place once complete, so an
+    interrupted extraction is never mistaken for a finished one.
+
+    Args:
+        npz_path: Path to the npz archive.
+        keys: Names of the arrays to extract.
+        out_dir: Directory for the `.npy` files. Defaults to
+            `<npz_path without extension>_npy`.
+
+    Returns:
+        dict: Paths to the `.npy` file of each key.
+
+    '''
+    out_dir = out_dir or path.splitext(npz_path)[0] + '_npy'
+    if not path.isdir(out_dir):
+        os.makedirs(out_dir, exist_ok=True)
+
+    paths = dict((k, path.join(out_dir, k + '.npy')) for k in keys)
+    missing = [k for k, p in paths.items() if not path.isfile(p)]
+
+    if missing:
+        logger.info('Extracting {} from {} to {}'
+                    .format(missing, npz_path, out_dir))
+        with zipfile.ZipFile(npz_path) as archive:
+            for k in missing:
+                tmp_path = paths[k] + '.tmp'
+                with archive.open(k + '.npy') as f_in, \
+                        open(tmp_path, 'wb') as f_out:
+                    shutil.copyfileobj(f_in, f_out, length=1 << 24)
+                os.replace(tmp_path, paths[k])
+
+    return paths
+
+
 class dSprites(Dataset):
+    '''dSprites dataset.
+
+    The arrays are extracted once from the npz archive to uncompressed `.npy`
+    files and opened memory-mapped, so they are shared through the page cache
+    by all loader workers instead of being copied into each of them.
+
+    Args:
+        root (str): Path to the npz archive.
+        download (bool): Download the archive if not found at `root`.
+        transform (callable, optional): Transform applied to the image.
+        shuffle (bool): Shuffle the order of the samples.
+        pil_transform (bool): If True, `transform` expects PIL images. If
+            False, or if there is no transform, images are given as float
+            tensors of size 1 x 64 x 64.
+
+    '''
     _url = ('https://github.com/deepmind/dsprites-dataset/blob/master/'
             'dsprites_ndarray_co1sh3sc6or40x32y32_64x64.npz?raw=true')
+    _keys = ['imgs', 'latents_values', 'latents_classes']
 
-    def __init__(self, root, download=True, transform=None, shuffle=False):
+    def __init__(self, root, download=True, transform=None, shuffle=False,
+                 pil_transform=True):
         if not root:
             raise ValueError('Dataset path not provided')
         self.root = root
         self.transform = transform
+        self.pil_transform = pil_transform
 
         if download:
             if path.isfile(root):
@@ -35,28 +97,35 @@ class dSprites(Dataset):
                 urllib.request.urlretrieve(self._url, root)
 
         # Load dataset
-        dataset_zip = np.load(self.root)
-        logger.debug('Keys in the dataset:', dataset_zip.keys())
-        self.imgs = dataset_zip['imgs']
-        self.latents_values = dataset_zip['latents_values']
-        self.latents_classes = dataset_zip['latents_classes']
+        paths = extract_npz(self.root, self._keys)
+        self.imgs = np.load(paths['imgs'], mmap_mode='r')
+        self.latents_values = np.load(paths['latents_values'], mmap_mode='r')
+        self.latents_classes = np.load(paths['latents_classes'],
+                                       mmap_mode='r')
         logger.info('Dataset loaded : OK.')
 
         if shuffle:
             self.idx = np.random.permutation(len(self))
-            self.imgs = self.imgs[self.idx]
-            self.latents_classes = self.latents_classes[self.idx]
-            self.latents_values = self.latents_values[self.idx]
+        else:
+            self.idx = None
 
     def __len__(self):
         return len(self.imgs)
 
     def __getitem__(self, idx):
-        image = Image.fromarray(self.imgs[idx])
-        latent = self.latents_values[idx]
-
-        if self.transform is not None:
-            image = self.transform(image)
+        if self.idx is not None:
+            idx = self.idx[idx]
+
+        img = self.imgs[idx]
+        latent = np.array(self.latents_values[idx])
+
+        if self.transform is not None and self.pil_transform:
+            image = self.transform(Image.fromarray(img))
+        else:
+            image = torch.from_numpy(np.array(img, dtype='float32'))
+            image = image.unsqueeze(0)
+            if self.transform is not None:
+                image = self.transform(image)
 
         sample = (image, latent)
 
@@ -2,22 +2,68 @@
 
 '''
 
+import io
 from os import path
 
+from PIL import Image
+from torch.utils.data import Dataset
 import torchvision
+from torchvision.datasets.folder import IMG_EXTENSIONS
 from torchvision.transforms import transforms
 
+from cortex._lib.data.local_copy import PackedFiles
 from cortex.plugins import DatasetPlugin, register_data
 from cortex.built_ins.datasets.utils import build_transforms
 
 
+class PackedImageFolder(Dataset):
+    '''Image folder dataset read from a pack of its files.
+
+    Classes are the top-level directories of the packed folder, as with
+    :class:`torchvision.datasets.ImageFolder`.
+
+    Args:
+        root: Path to the pack.
+        transform: Transform applied to the images.
+
+    '''
+
+    def __init__(self, root, transform=None):
+        self.root = root
+        self.transform = transform
+        self.files = PackedFiles(root)
+
+        names = [n for n in self.files.names()
+                 if n.lower().endswith(IMG_EXTENSIONS) and
+                 len(n.split('/')) > 1]
+        self.classes = sorted(set(n.split('/')[0] for n in names))
+        self.class_to_idx = dict((c, i) for i, c in enumerate(self.classes))
+        self.samples = [(n, self.class_to_idx[n.split('/')[0]])
+                        for n in names]
+
+    def __len__(self):
+        return len(self.samples)
+
+    def __getitem__(self, index):
+        name, target = self.samples[index]
+        img = Image.open(io.BytesIO(self.files.read(name))).convert('RGB')
+        if self.transform is not None:
+            img = self.transform(img)
+        return img, target
+
+
 class ImageFolder(DatasetPlugin):
     sources = ['tiny-imagenet-200', 'imagenet']
 
     def handle(self, source, copy_to_local=False, normalize=True,
-               tanh_normalization=False, **transform_args):
+               tanh_normalization=False, packed=False, **transform_args):
 
-        Dataset = self.make_indexing(torchvision.datasets.ImageFolder)
+        if packed and not copy_to_local:
+            raise ValueError('`packed` requires `copy_to_local`')
+        if packed:
+            Dataset = self.make_indexing(PackedImageFolder)
+        else:
+            Dataset = self.make_indexing(torchvision.datasets.ImageFolder)
         data_path = self.get_path(source)
 
         if isinstance(data_path, dict):
@@ -31,8 +77,8 @@ class ImageFolder(DatasetPlugin):
             test_path = path.join(data_path, 'val')
 
         if copy_to_local:
-            train_path = self.copy_to_local_path(train_path)
-            test_path = self.copy_to_local_path(test_path)
+            train_path = self.copy_to_local_path(train_path, pack=packed)
+            test_path = self.copy_to_local_path(test_path, pack=packed)
 
         if normalize and isinstance(normalize, bool):
             if tanh_normalization:
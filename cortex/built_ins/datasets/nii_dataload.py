@@ -32,6 +32,7 @@
 
 import torch.utils.data as data
 
+import hashlib
 import os
 import os.path
 import numpy as np
@@ -86,12 +87,32 @@ def nii_loader(path):
 
     """
     img = nib.load(path)
-    data = img.get_data()
+    # `dataobj` keeps the on-disk dtype (usually float32), whereas
+    # `get_fdata` would upcast every volume to float64.
+    data = np.asanyarray(img.dataobj)
     # hdr = img.header
 
     return data
 
 
+def load_mask(mask):
+    """Loads and validates a binary mask.
+
+    Args:
+        mask: Path to a 3D nifti mask.
+
+    Returns:
+        tuple: Mask shape and flat indices of the voxels in the mask.
+
+    """
+    mskD = nii_loader(mask)
+    if not np.all(np.logical_or(mskD == 0, mskD == 1)):
+        raise ValueError("Mask has incorrect values.")
+
+    msk_idx = np.flatnonzero(mskD.reshape(-1) == 1)
+    return mskD.shape, msk_idx
+
+
 class ImageFolder(data.Dataset):
     '''
     Args:
@@ -99,12 +120,17 @@ class ImageFolder(data.Dataset):
         patterns (list): list of regex patterns
         loader (callable, optional): A function to load an image given its
         path.
+        mask (string, optional): Path to a binary mask used to vectorize the
+        space/voxel dimension.
+        cache_dir (string, optional): If set with a mask, masked volumes are
+        saved here on first access and memory-mapped on later epochs.
 
      Attributes:
         imgs (list): List of (image path, class_index) tuples
     '''
 
-    def __init__(self, root, loader=nii_loader, patterns=None, mask=None):
+    def __init__(self, root, loader=nii_loader, patterns=None, mask=None,
+                 cache_dir=None):
         imgs = make_dataset(root, patterns)
 
         if len(imgs) == 0:
@@ -121,6 +147,18 @@ class ImageFolder(data.Dataset):
 
         self.loader = loader
         self.mask = mask
+        self.cache_dir = cache_dir
+
+        if mask:
+            self.mask_shape, self.mask_idx = load_mask(mask)
+            self._mask_key = hashlib.md5(
+                os.path.abspath(mask).encode() +
+                str(self.mask_shape).encode() +
+                self.mask_idx.tobytes()).hexdigest()
+            if cache_dir and not os.path.isdir(cache_dir):
+                os.makedirs(cache_dir, exist_ok=True)
+        else:
+            self.mask_shape, self.mask_idx = None, None
 
     def maskData(self, data):
         """
@@ -131,30 +169,39 @@ class ImageFolder(data.Dataset):
         Returns:
 
         """
-
-        msk = nib.load(self.mask)
-        mskD = msk.get_data()
-        if not np.all(np.bitwise_or(mskD == 0, mskD == 1)):
-            raise ValueError("Mask has incorrect values.")
-        # nVox = np.sum(mskD.flatten())
-        if data.shape[0:3] != mskD.shape:
-            raise ValueError((data.shape, mskD.shape))
-
-        msk_f = mskD.flatten()
-        msk_idx = np.where(msk_f == 1)[0]
+        if data.shape[0:3] != self.mask_shape:
+            raise ValueError((data.shape, self.mask_shape))
 
         if len(data.shape) == 3:
-            data_masked = data.flatten()[msk_idx]
+            data_masked = data.reshape(-1)[self.mask_idx]
 
         if len(data.shape) == 4:
-            data = np.transpose(data, (3, 0, 1, 2))
-            data_masked = np.zeros((data.shape[0], int(mskD.sum())))
-            for i, x in enumerate(data):
-                data_masked[i] = x.flatten()[msk_idx]
+            # Gather all time points at once: (voxels, time) -> (time, voxels)
+            data_masked = data.reshape(-1, data.shape[3])[self.mask_idx].T
+
+        return np.ascontiguousarray(data_masked)
+
+    def _cache_path(self, path):
+        # A changed mask or a rewritten volume gets a new cache entry.
+        stat = os.stat(path)
+        key = '{}|{}|{}|{}'.format(os.path.abspath(path), stat.st_size,
+                                   stat.st_mtime_ns, self._mask_key)
+        key = hashlib.md5(key.encode()).hexdigest()
+        return os.path.join(self.cache_dir, key + '.npy')
+
+    def _load_masked(self, path):
+        if self.cache_dir is None:
+            return self.maskData(self.loader(path))
 
-        img = data_masked
+        cache_path = self._cache_path(path)
+        if not os.path.isfile(cache_path):
+            img = self.maskData(self.loader(path))
+            tmp_path = cache_path + '.{}.tmp'.format(os.getpid())
+            with open(tmp_path, 'wb') as f:
+                np.save(f, img)
+            os.replace(tmp_path, cache_path)
 
-        return np.array(img)
+        return np.load(cache_path, mmap_mode='r')
 
     '''
         Gives us a tuple from the array at (index) of: (image, label)
@@ -170,9 +217,10 @@ class ImageFolder(data.Dataset):
             class.
         """
         path, label = self.imgs[index]
-        img = self.loader(path)
         if self.mask:
-            img = self.maskData(img)
+            img = self._load_masked(path)
+        else:
+            img = self.loader(path)
 
         return np.array(img), label
 
@@ -9,7 +9,7 @@ import torchvision
 from torchvision.transforms import transforms
 
 from cortex.plugins import DatasetPlugin, register_plugin
-from .utils import build_transforms
+from .utils import build_batch_transforms, build_transforms
 
 
 class TorchvisionDatasetPlugin(DatasetPlugin):
@@ -18,6 +18,7 @@ class TorchvisionDatasetPlugin(DatasetPlugin):
         'FashionMNIST', 'ImageFolder', 'LSUN', 'LSUNClass', 'MNIST',
         'PhotoTour', 'SEMEION', 'STL10', 'SVHN'
     ]
+    _in_memory_sources = ['MNIST', 'FashionMNIST', 'SEMEION']
 
     def _handle_LSUN(self, Dataset, data_path, transform=None, **kwargs):
         train_set = Dataset(
@@ -89,10 +90,21 @@ class TorchvisionDatasetPlugin(DatasetPlugin):
             data_path, train=False, transform=transform, download=True)
         return train_set, test_set
 
+    def _share_data(self, key, dataset):
+        '''Moves the decoded images of a dataset to the shared cache.
+
+        '''
+        data = getattr(dataset, 'data', None)
+        if isinstance(data, np.ndarray):
+            key = '{}_{}'.format(key, len(data))
+            dataset.data = self.shared_arrays(
+                key, lambda: dict(data=data))['data']
+
     def handle(self, source, copy_to_local=False, normalize=True,
                train_samples=None, test_samples=None,
                labeled_only=False, stl_center_crop=False,
-               stl_resize_only=False, stl_no_resize=False, **transform_args):
+               stl_resize_only=False, stl_no_resize=False,
+               batch_transforms=False, **transform_args):
 
         Dataset = getattr(torchvision.datasets, source)
         Dataset = self.make_indexing(Dataset)
@@ -119,7 +131,18 @@ class TorchvisionDatasetPlugin(DatasetPlugin):
         else:
             scale = None
 
-        transform = build_transforms(normalize=normalize, **transform_args)
+        if batch_transforms:
+            if source == 'STL10':
+                raise ValueError('`batch_transforms` not supported for {}'
+                                 .format(source))
+            # Only decoding is done per sample, the rest runs on batches.
+            transform = transforms.ToTensor()
+            batch_transform = build_batch_transforms(normalize=normalize,
+                                                     **transform_args)
+            self.set_batch_transform(batch_transform)
+        else:
+            transform = build_transforms(normalize=normalize, **transform_args)
+            batch_transform = None
 
         if source == 'LSUN':
             handler = self._handle_LSUN
@@ -135,6 +158,9 @@ class TorchvisionDatasetPlugin(DatasetPlugin):
                                       stl_center_crop=stl_center_crop,
                                       stl_resize_only=stl_resize_only,
                                       stl_no_resize=stl_no_resize)
+        self._share_data(source + '_train', train_set)
+        self._share_data(source + '_test', test_set)
+
         if train_samples is not None:
             train_set.train_data = train_set.train_data[:train_samples]
             train_set.train_labels = train_set.train_labels[:train_samples]
@@ -142,8 +168,12 @@ class TorchvisionDatasetPlugin(DatasetPlugin):
             test_set.test_data = test_set.test_data[:test_samples]
             test_set.test_labels = test_set.test_labels[:test_samples]
 
+        image = train_set[0][0]
+        if batch_transform is not None:
+            image = batch_transform(image.unsqueeze(0))[0]
+        dim_c, dim_x, dim_y = image.size()
+
         if source in ('SVHN', 'STL10'):
-            dim_c, dim_x, dim_y = train_set[0][0].size()
             uniques = np.unique(train_set.labels).tolist()
             try:
                 uniques.remove(-1)
@@ -151,8 +181,6 @@ class TorchvisionDatasetPlugin(DatasetPlugin):
                 pass
             dim_l = len(uniques)
         else:
-            dim_c, dim_x, dim_y = train_set[0][0].size()
-
             labels = train_set.train_labels
             if not isinstance(labels, list):
                 labels = labels.numpy()
@@ -169,5 +197,12 @@ class TorchvisionDatasetPlugin(DatasetPlugin):
         if scale is not None:
             self.set_scale(scale)
 
+        random_transforms = ('random_crop', 'flip', 'random_resize_crop',
+                             'random_sized_crop')
+        if (source in self._in_memory_sources and
+                (batch_transforms or
+                 not any(transform_args.get(k) for k in random_transforms))):
+            self.set_in_memory()
+
 
 register_plugin(TorchvisionDatasetPlugin)
@@ -4,6 +4,9 @@ Extra functions for build-in datasets
 
 import torchvision.transforms as transforms
 
+from cortex.built_ins.transforms import batch as batch_transforms
+from cortex.built_ins.transforms.sobel import BatchSobel, Sobel
+
 
 def build_transforms(normalize=True, center_crop=None, image_size=None,
                      random_crop=None, flip=None, random_resize_crop=None,
@@ -49,5 +52,62 @@ def build_transforms(normalize=True, center_crop=None, image_size=None,
             transform_.append(normalize)
         else:
             transform_.append(transforms.Normalize(*normalize))
+
+    if use_sobel:
+        transform_.append(Sobel())
+
     transform = transforms.Compose(transform_)
     return transform
+
+
+def build_batch_transforms(normalize=True, center_crop=None, image_size=None,
+                           random_crop=None, flip=None,
+                           random_resize_crop=None, random_sized_crop=None,
+                           use_sobel=False):
+    """Builds the batch counterpart of `build_transforms`.
+
+    The transforms run on collated `N x C x H x W` batches, so the images of
+    the dataset must already be tensors of a common size (e.g., with only
+    `ToTensor` as the per-sample transform).
+
+    Args:
+        normalize:
+        center_crop:
+        image_size:
+        random_crop:
+        flip:
+        random_resize_crop:
+        random_sized_crop:
+        use_sobel:
+
+    Returns:
+
+    """
+    transform_ = []
+
+    if random_resize_crop:
+        transform_.append(
+            batch_transforms.RandomResizedCrop(random_resize_crop))
+    elif random_crop:
+        transform_.append(batch_transforms.RandomCrop(random_crop))
+    elif center_crop:
+        transform_.append(batch_transforms.CenterCrop(center_crop))
+    elif random_sized_crop:
+        transform_.append(
+            batch_transforms.RandomResizedCrop(random_sized_crop))
+
+    if image_size:
+        transform_.append(batch_transforms.Resize(image_size))
+
+    if flip:
+        transform_.append(batch_transforms.RandomHorizontalFlip())
+
+    if normalize:
+        if isinstance(normalize, transforms.Normalize):
+            normalize = (normalize.mean, normalize.std)
+        transform_.append(batch_transforms.Normalize(*normalize))
+
+    if use_sobel:
+        transform_.append(BatchSobel())
+
+    return batch_transforms.Compose(transform_)
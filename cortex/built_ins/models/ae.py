@@ -4,7 +4,7 @@
 
 import torch.nn.functional as F
 
-from cortex.plugins import ModelPlugin, register_plugin
+from cortex.plugins import ModelPlugin, register_plugin, trains
 from cortex.built_ins.models.image_coders import ImageEncoder, ImageDecoder
 from cortex.built_ins.networks.ae_network import AENetwork
 
@@ -39,6 +39,7 @@ class Autoencoder(ModelPlugin):
         ae = AENetwork(encoder, decoder)
         self.nets.ae = ae
 
+    @trains('ae')
     def routine(self, inputs, targets, ae_criterion=F.mse_loss):
         '''
 
@@ -7,9 +7,8 @@ Currently noise encoder is not implemented.
 __author__ = 'R Devon Hjelm and Samuel Lavoie'
 __author_email__ = 'erroneus@gmail.com'
 
-from cortex.plugins import register_plugin, ModelPlugin
-from cortex.built_ins.models.gan import (
-    get_positive_expectation, get_negative_expectation, GradientPenalty)
+from cortex.plugins import register_plugin, ModelPlugin, trains
+from cortex.built_ins.models.gan import get_expectations, GradientPenalty
 from cortex.built_ins.models.vae import ImageDecoder, ImageEncoder
 from cortex.built_ins.networks.fully_connected import FullyConnectedNet
 
@@ -58,6 +57,7 @@ class BidirectionalModel(ModelPlugin):
         self.decoder.build()
         self.encoder.build()
 
+    @trains('decoder', 'encoder')
     def routine(self, inputs, Z, measure=None):
         decoder = self.nets.decoder
         encoder = self.nets.encoder
@@ -108,6 +108,7 @@ class ALIDiscriminator(ModelPlugin):
 
         self.nets.discriminator = discriminator
 
+    @trains('discriminator')
     def routine(self, X_real, X_fake, Z_real, Z_fake, measure='GAN'):
         '''
 
@@ -136,8 +137,7 @@ class ALIDiscriminator(ModelPlugin):
         P_samples = discriminator(X_P, Z_P)
         Q_samples = discriminator(X_Q, Z_Q)
 
-        E_pos = get_positive_expectation(P_samples, measure)
-        E_neg = get_negative_expectation(Q_samples, measure)
+        E_pos, E_neg = get_expectations(P_samples, Q_samples, measure)
 
         return E_pos, E_neg, P_samples, Q_samples
 
@@ -3,7 +3,7 @@
 '''
 
 
-from cortex.plugins import (register_plugin, ModelPlugin)
+from cortex.plugins import (register_plugin, ModelPlugin, trains)
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
@@ -34,6 +34,7 @@ class SimpleClassifier(ModelPlugin):
         classifier = FullyConnectedNet(dim_in, dim_out=dim_l, **classifier_args)
         self.nets.classifier = classifier
 
+    @trains('classifier')
     def routine(self, inputs, targets,
                 criterion=nn.CrossEntropyLoss(reduce=False)):
         '''
@@ -98,6 +99,7 @@ class SimpleAttributeClassifier(SimpleClassifier):
         classifier = FullyConnectedNet(dim_in, dim_out=dim_a, **classifier_args)
         self.nets.classifier = classifier
 
+    @trains('classifier')
     def routine(self, inputs, attributes):
         classifier = self.nets.classifier
         outputs = classifier(inputs, nonlinearity='sigmoid')
@@ -5,12 +5,12 @@
 import math
 
 from cortex.built_ins.networks.fully_connected import FullyConnectedNet
-from cortex.plugins import register_plugin, ModelPlugin
+from cortex.plugins import register_plugin, ModelPlugin, trains
 import torch
 from torch import autograd
 import torch.nn.functional as F
 
-from .utils import log_sum_exp, update_decoder_args, update_encoder_args
+from .utils import update_decoder_args, update_encoder_args
 
 
 def raise_measure_error(measure):
@@ -20,27 +20,53 @@ def raise_measure_error(measure):
                                                            supported_measures))
 
 
-def get_positive_expectation(p_samples, measure, average=True):
-    log_2 = math.log(2.)
+class Measure:
+    '''Positive and negative expectations of an f-divergence.
 
-    if measure == 'GAN':
-        Ep = - F.softplus(-p_samples)
-    elif measure == 'JSD':
-        Ep = log_2 - F.softplus(- p_samples)
-    elif measure == 'X2':
-        Ep = p_samples ** 2
-    elif measure == 'KL':
-        Ep = p_samples + 1.
-    elif measure == 'RKL':
-        Ep = -torch.exp(-p_samples)
-    elif measure == 'DV':
-        Ep = p_samples
-    elif measure == 'H2':
-        Ep = 1. - torch.exp(-p_samples)
-    elif measure == 'W1':
-        Ep = p_samples
-    else:
+    Args:
+        positive: Function of the positive samples.
+        negative: Function of the negative samples.
+
+    '''
+
+    def __init__(self, positive, negative):
+        self.positive = positive
+        self.negative = negative
+
+    def expectations(self, p_samples, q_samples):
+        '''Computes the averaged positive and negative expectations.
+
+        '''
+        return (self.positive(p_samples).mean(),
+                self.negative(q_samples).mean())
+
+
+_log_2 = math.log(2.)
+
+# -softplus(-x) is logsigmoid(x) and softplus(-x) + x is softplus(x).
+MEASURES = dict(
+    GAN=Measure(F.logsigmoid, F.softplus),
+    JSD=Measure(lambda p: _log_2 + F.logsigmoid(p),
+                lambda q: F.softplus(q) - _log_2),
+    X2=Measure(lambda p: p ** 2,
+               lambda q: -0.5 * (q.abs() + 1.) ** 2),
+    KL=Measure(lambda p: p + 1., torch.exp),
+    RKL=Measure(lambda p: -torch.exp(-p), lambda q: q - 1.),
+    DV=Measure(lambda p: p,
+               lambda q: torch.logsumexp(q, 0) - math.log(q.size(0))),
+    H2=Measure(lambda p: 1. - torch.exp(-p), lambda q: torch.exp(q) - 1.),
+    W1=Measure(lambda p: p, lambda q: q)
+)
+
+
+def get_measure(measure):
+    if measure not in MEASURES:
         raise_measure_error(measure)
+    return MEASURES[measure]
+
+
+def get_positive_expectation(p_samples, measure, average=True):
+    Ep = get_measure(measure).positive(p_samples)
 
     if average:
         return Ep.mean()
@@ -49,26 +75,7 @@ def get_positive_expectation(p_samples, measure, average=True):
 
 
 def get_negative_expectation(q_samples, measure, average=True):
-    log_2 = math.log(2.)
-
-    if measure == 'GAN':
-        Eq = F.softplus(-q_samples) + q_samples
-    elif measure == 'JSD':
-        Eq = F.softplus(-q_samples) + q_samples - log_2
-    elif measure == 'X2':
-        Eq = -0.5 * ((torch.sqrt(q_samples ** 2) + 1.) ** 2)
-    elif measure == 'KL':
-        Eq = torch.exp(q_samples)
-    elif measure == 'RKL':
-        Eq = q_samples - 1.
-    elif measure == 'DV':
-        Eq = log_sum_exp(q_samples, 0) - math.log(q_samples.size(0))
-    elif measure == 'H2':
-        Eq = torch.exp(q_samples) - 1.
-    elif measure == 'W1':
-        Eq = q_samples
-    else:
-        raise_measure_error(measure)
+    Eq = get_measure(measure).negative(q_samples)
 
     if average:
         return Eq.mean()
@@ -76,6 +83,13 @@ def get_negative_expectation(q_samples, measure, average=True):
         return Eq
 
 
+def get_expectations(p_samples, q_samples, measure):
+    '''Computes the averaged positive and negative expectations.
+
+    '''
+    return get_measure(measure).expectations(p_samples, q_samples)
+
+
 def get_boundary(samples, measure):
     if measure in ('GAN', 'JSD', 'KL', 'RKL', 'H2', 'DV'):
         b = samples ** 2
@@ -115,6 +129,7 @@ def generator_loss(q_samples, measure, loss_type=None):
 
 class GradientPenalty(ModelPlugin):
 
+    @trains('network')
     def routine(self, inputs, penalty_type: str='contractive',
                 penalty_amount: float=0.5):
         """
@@ -206,6 +221,7 @@ class Discriminator(ModelPlugin):
         discriminator = Encoder(x_shape, dim_out=1, **discriminator_args)
         self.nets.discriminator = discriminator
 
+    @trains('discriminator')
     def routine(self, real, fake, measure: str='GAN'):
         """
 
@@ -231,8 +247,7 @@ class Discriminator(ModelPlugin):
         P_samples = discriminator(X_P)
         Q_samples = discriminator(X_Q)
 
-        E_pos = get_positive_expectation(P_samples, measure)
-        E_neg = get_negative_expectation(Q_samples, measure)
+        E_pos, E_neg = get_expectations(P_samples, Q_samples, measure)
 
         return E_pos, E_neg, P_samples, Q_samples
 
@@ -288,6 +303,7 @@ class Generator(ModelPlugin):
 
         self.nets.generator = generator
 
+    @trains('generator')
     def routine(self, Z, measure: str=None, loss_type: str='non-saturating'):
         """
 
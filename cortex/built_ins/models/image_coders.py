@@ -1,5 +1,7 @@
-from cortex.plugins import ModelPlugin
-from cortex.built_ins.models.utils import update_encoder_args, update_decoder_args, ms_ssim
+from cortex.plugins import ModelPlugin, trains
+from cortex.built_ins.models.utils import (
+    update_encoder_args, update_decoder_args, metric_due, ms_ssim)
+import torch
 import torch.nn.functional as F
 
 
@@ -41,11 +43,21 @@ class ImageDecoder(ModelPlugin):
         decoder = Decoder(x_shape, dim_in=dim_in, **decoder_args)
         self.nets.decoder = decoder
 
-    def routine(self, inputs, Z, decoder_crit=F.mse_loss):
+    @trains('decoder')
+    def routine(self, inputs, Z, decoder_crit=F.mse_loss, ms_ssim_interval=1):
+        '''
+
+        Args:
+            decoder_crit: Reconstruction criterion.
+            ms_ssim_interval: Training steps between computations of
+                MS-SSIM. 0 to only compute it in evaluation.
+
+        '''
         X = self.decode(Z)
         self.losses.decoder = decoder_crit(X, inputs) / inputs.size(0)
-        msssim = ms_ssim(inputs, X)
-        self.results.ms_ssim = msssim.item()
+        if metric_due(self, ms_ssim_interval):
+            with torch.no_grad():
+                self.results.ms_ssim = ms_ssim(inputs, X).item()
 
     def decode(self, Z):
         return self.nets.decoder(Z)
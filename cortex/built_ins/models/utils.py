@@ -3,10 +3,10 @@
 '''
 
 import logging
-import math
 
 from sklearn import svm
 import torch
+import torch.nn.functional as F
 
 
 logger = logging.getLogger('cortex.arch' + __name__)
@@ -18,20 +18,82 @@ def log_sum_exp(x, axis=None):
     return y
 
 
+def _remove_diagonal(correlations):
+    return correlations - torch.eye(correlations.size(0),
+                                    device=correlations.device,
+                                    dtype=correlations.dtype)
+
+
 def cross_correlation(X, remove_diagonal=False):
+    '''Cross correlation of the dimensions of a batch.
+
+    Args:
+        X: Batch of vectors.
+        remove_diagonal: Subtract the identity.
+
+    '''
     X_s = X / X.std(0)
     X_m = X_s - X_s.mean(0)
     b, dim = X_m.size()
-    correlations = (X_m.unsqueeze(2).expand(b, dim, dim) *
-                    X_m.unsqueeze(1).expand(b, dim, dim)).sum(0) / float(b)
+    correlations = X_m.t().mm(X_m) / float(b)
     if remove_diagonal:
-        Id = torch.eye(dim)
-        Id = torch.autograd.Variable(Id.cuda(), requires_grad=False)
-        correlations -= Id
+        correlations = _remove_diagonal(correlations)
 
     return correlations
 
 
+class CrossCorrelation:
+    '''Cross correlation of the dimensions of vectors seen over batches.
+
+    Accumulates the sums of the vectors and of their outer products, so that
+    the correlation over e.g. an epoch does not need all its vectors.
+    Equivalent to `cross_correlation` of all the vectors.
+
+    '''
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.n = 0
+        self.sum = None
+        self.sum_outer = None
+
+    def update(self, X):
+        '''Adds a batch of vectors.
+
+        '''
+        X = X.detach().double()
+        if self.sum is None:
+            self.sum = X.sum(0)
+            self.sum_outer = X.t().mm(X)
+        else:
+            self.sum += X.sum(0)
+            self.sum_outer += X.t().mm(X)
+        self.n += X.size(0)
+
+    def compute(self, remove_diagonal=False):
+        '''Cross correlation of the vectors added since the last reset.
+
+        Args:
+            remove_diagonal: Subtract the identity.
+
+        '''
+        if self.n < 2:
+            raise ValueError('Cross correlation needs at least 2 vectors, '
+                             'got {}'.format(self.n))
+        mean = self.sum / self.n
+        covariance = self.sum_outer / self.n - mean.unsqueeze(1) * mean
+        # Normalized by the unbiased standard deviations, as
+        # `cross_correlation`.
+        std = (covariance.diagonal() * self.n / (self.n - 1)).sqrt()
+        correlations = covariance / (std.unsqueeze(1) * std)
+        if remove_diagonal:
+            correlations = _remove_diagonal(correlations)
+
+        return correlations.float()
+
+
 def perform_svc(X, Y, clf=None):
     if clf is None:
         clf = svm.LinearSVC()
@@ -42,53 +104,151 @@ def perform_svc(X, Y, clf=None):
     return clf, Y_hat
 
 
-def ms_ssim(X_a, X_b, window_size=11, size_average=True, C1=0.01**2, C2=0.03**2):
-    '''
-    Taken from Po-Hsun-Su/pytorch-ssim
-    '''
+# Gaussian windows of `_ssim`, keyed by channels, size, sigma, device and
+# dtype.
+_windows = {}
 
-    channel = X_a.size(1)
+# Weights of the scales of MS-SSIM, from Wang et al. (2003).
+_ms_ssim_weights = (0.0448, 0.2856, 0.3001, 0.2363, 0.1333)
 
-    def gaussian(sigma=1.5):
-        gauss = torch.Tensor(
-            [math.exp(-(x - window_size // 2) **
-                      2 / float(2 * sigma ** 2)) for x in range(window_size)])
-        return gauss / gauss.sum()
 
-    def create_window():
-        _1D_window = gaussian(window_size).unsqueeze(1)
-        _2D_window = _1D_window.mm(
-            _1D_window.t()).float().unsqueeze(0).unsqueeze(0)
-        window = torch.Tensor(
-            _2D_window.expand(channel, 1, window_size,
-                              window_size).contiguous())
-        return window.cuda()
+def _gaussian_window(channels, size, sigma, device, dtype):
+    key = (channels, size, sigma, device, dtype)
+    if key not in _windows:
+        x = torch.arange(size, device=device, dtype=dtype) - size // 2
+        gauss = torch.exp(-x ** 2 / (2 * sigma ** 2))
+        gauss = gauss / gauss.sum()
+        window = torch.outer(gauss, gauss)
+        _windows[key] = window.expand(channels, 1, size, size).contiguous()
+    return _windows[key]
 
-    window = create_window()
 
-    mu1 = torch.nn.functional.conv2d(X_a, window,
-                                     padding=window_size // 2, groups=channel)
-    mu2 = torch.nn.functional.conv2d(X_b, window,
-                                     padding=window_size // 2, groups=channel)
+def _ssim(X_a, X_b, window_size, sigma, C1, C2):
+    '''Computes the SSIM and contrast-structure maps.
+
+    The local moments of both images are computed by one grouped
+    convolution.
+
+    '''
+    channels = X_a.size(1)
+    window = _gaussian_window(5 * channels, window_size, sigma, X_a.device,
+                              X_a.dtype)
+    maps = torch.cat([X_a, X_b, X_a * X_a, X_b * X_b, X_a * X_b], 1)
+    moments = F.conv2d(maps, window, padding=window_size // 2,
+                       groups=5 * channels)
+    mu1, mu2, m11, m22, m12 = moments.chunk(5, 1)
 
     mu1_sq = mu1.pow(2)
     mu2_sq = mu2.pow(2)
     mu1_mu2 = mu1 * mu2
+    sigma1_sq = m11 - mu1_sq
+    sigma2_sq = m22 - mu2_sq
+    sigma12 = m12 - mu1_mu2
+
+    cs_map = (2 * sigma12 + C2) / (sigma1_sq + sigma2_sq + C2)
+    ssim_map = (2 * mu1_mu2 + C1) / (mu1_sq + mu2_sq + C1) * cs_map
+    return ssim_map, cs_map
+
+
+def _float32(X_a, X_b):
+    dtype = torch.promote_types(torch.promote_types(X_a.dtype, X_b.dtype),
+                                torch.float32)
+    return X_a.to(dtype), X_b.to(dtype)
 
-    sigma1_sq = torch.nn.functional.conv2d(
-        X_a * X_a, window, padding=window_size // 2, groups=channel) - mu1_sq
-    sigma2_sq = torch.nn.functional.conv2d(
-        X_b * X_b, window, padding=window_size // 2, groups=channel) - mu2_sq
-    sigma12 = torch.nn.functional.conv2d(
-        X_a * X_b, window, padding=window_size // 2, groups=channel) - mu1_mu2
 
-    ssim_map = (((2 * mu1_mu2 + C1) * (2 * sigma12 + C2)) /
-                ((mu1_sq + mu2_sq + C1) * (sigma1_sq + sigma2_sq + C2)))
+def ssim(X_a, X_b, window_size=11, sigma=1.5, size_average=True,
+         C1=0.01**2, C2=0.03**2):
+    '''Structural similarity.
+
+    Adapted from Po-Hsun-Su/pytorch-ssim
+
+    Args:
+        X_a: Batch of images.
+        X_b: Batch of images.
+        window_size: Size of the Gaussian window.
+        sigma: Standard deviation of the Gaussian window.
+        size_average: Average over the batch, instead of per image.
+        C1: Stabilizing constant of the luminance.
+        C2: Stabilizing constant of the contrast.
+
+    '''
+    with torch.autocast(device_type=X_a.device.type, enabled=False):
+        X_a, X_b = _float32(X_a, X_b)
+        ssim_map, _ = _ssim(X_a, X_b, window_size, sigma, C1, C2)
+        value = ssim_map.flatten(1).mean(1)
 
     if size_average:
-        return ssim_map.mean()
-    else:
-        return ssim_map.mean(1).mean(1).mean(1)
+        return value.mean()
+    return value
+
+
+def ms_ssim(X_a, X_b, window_size=11, sigma=1.5, size_average=True,
+            C1=0.01**2, C2=0.03**2, weights=None):
+    '''Multi-scale structural similarity.
+
+    Contrast and structure are compared at each scale, halving the
+    resolution between scales, and luminance at the coarsest one.
+
+    Args:
+        X_a: Batch of images.
+        X_b: Batch of images.
+        window_size: Size of the Gaussian window.
+        sigma: Standard deviation of the Gaussian window.
+        size_average: Average over the batch, instead of per image.
+        C1: Stabilizing constant of the luminance.
+        C2: Stabilizing constant of the contrast.
+        weights: Weights of the scales. Defaults to the weights of
+            Wang et al. (2003) of the scales at which the images are at
+            least `window_size` wide, normalized.
+
+    '''
+    if weights is None:
+        n_scales = 1
+        size = min(X_a.size()[2:])
+        while (n_scales < len(_ms_ssim_weights) and
+               size // 2 >= window_size):
+            size //= 2
+            n_scales += 1
+        weights = _ms_ssim_weights[:n_scales]
+        weights = [w / sum(weights) for w in weights]
+
+    with torch.autocast(device_type=X_a.device.type, enabled=False):
+        X_a, X_b = _float32(X_a, X_b)
+        values = []
+        for i in range(len(weights)):
+            ssim_map, cs_map = _ssim(X_a, X_b, window_size, sigma, C1, C2)
+            if i < len(weights) - 1:
+                values.append(cs_map.flatten(1).mean(1))
+                X_a = F.avg_pool2d(X_a, 2)
+                X_b = F.avg_pool2d(X_b, 2)
+            else:
+                values.append(ssim_map.flatten(1).mean(1))
+
+        # Negative similarities have no fractional powers.
+        values = torch.stack(values, 1).clamp(min=0)
+        weights = torch.tensor(weights, device=values.device,
+                               dtype=values.dtype)
+        value = values.pow(weights).prod(1)
+
+    if size_average:
+        return value.mean()
+    return value
+
+
+def metric_due(model, interval=1):
+    '''Whether a model computes its metrics at the current step.
+
+    Metrics are computed at every evaluation step.
+
+    Args:
+        model: Model plugin.
+        interval: Number of training steps between computations. With 0,
+            metrics are only computed in evaluation.
+
+    '''
+    if not model._train:
+        return True
+    return interval > 0 and (model.data.u - 1) % interval == 0
 
 
 resnet_encoder_args_ = dict(dim_h=64, batch_norm=True, f_size=3, n_steps=3)
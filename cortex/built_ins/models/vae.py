@@ -6,11 +6,10 @@ import logging
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
-from torch.autograd import Variable
 
-from cortex.built_ins.models.utils import ms_ssim
+from cortex.built_ins.models.utils import metric_due, ms_ssim
 from cortex.built_ins.models.image_coders import ImageDecoder, ImageEncoder
-from cortex.plugins import ModelPlugin, register_plugin
+from cortex.plugins import ModelPlugin, register_plugin, trains
 
 
 __author__ = 'R Devon Hjelm and Samuel Lavoie'
@@ -50,8 +49,7 @@ class VAENetwork(nn.Module):
 
     def reparametrize(self, mu, std):
         if self.training:
-            esp = Variable(
-                std.data.new(std.size()).normal_(), requires_grad=False).cuda()
+            esp = torch.randn_like(std)
             return mu + std * esp
         else:
             return mu
@@ -107,13 +105,16 @@ class VAE(ModelPlugin):
         vae = VAENetwork(encoder, decoder, dim_out=dim_encoder_out, dim_z=dim_z)
         self.nets.vae = vae
 
+    @trains('vae')
     def routine(self, inputs, targets, Z, vae_criterion=F.mse_loss,
-                beta_kld=1.):
+                beta_kld=1., ms_ssim_interval=1):
         '''
 
         Args:
             vae_criterion: Reconstruction criterion.
             beta_kld: Beta scaling for KL term in lower-bound.
+            ms_ssim_interval: Training steps between computations of
+                MS-SSIM. 0 to only compute it in evaluation.
 
         '''
 
@@ -134,10 +135,11 @@ class VAE(ModelPlugin):
         kl = (0.5 * (vae.std**2 + vae.mu**2 - 2. * torch.log(vae.std) -
                      1.).sum(1).mean())
 
-        msssim = ms_ssim(inputs, outputs)
-
         self.losses.vae = (r_loss + beta_kld * kl)
-        self.results.update(KL_divergence=kl.item(), ms_ssim=msssim.item())
+        self.results.update(KL_divergence=kl.item())
+        if metric_due(self, ms_ssim_interval):
+            with torch.no_grad():
+                self.results.ms_ssim = ms_ssim(inputs, outputs).item()
 
     def visualize(self, inputs, targets, Z):
         vae = self.nets.vae
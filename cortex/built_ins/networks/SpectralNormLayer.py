@@ -10,41 +10,123 @@ def l2normalize(v, esp=1e-8):
     return v / (v.norm() + esp)
 
 
-def sn_weight(weight, u, height, n_power_iterations):
-    weight.requires_grad_(False)
-    for _ in range(n_power_iterations):
-        v = l2normalize(torch.mv(weight.view(height, -1).t(), u))
-        u = l2normalize(torch.mv(weight.view(height, -1), v))
+class WarmStart:
+    '''Schedule of power iterations that warms up the singular vectors.
 
-    weight.requires_grad_(True)
-    sigma = u.dot(weight.view(height, -1).mv(v))
-    return torch.div(weight, sigma), u
+    Args:
+        n_init: Number of iterations of the first updates, from random
+            vectors.
+        n: Number of iterations of the later updates.
+        n_warmup: Number of updates using `n_init` iterations.
 
+    '''
 
-class SNConv2d(nn.Conv2d):
-    def __init__(self, *args, n_power_iterations=1, **kwargs):
-        super(SNConv2d, self).__init__(*args, **kwargs)
+    def __init__(self, n_init=10, n=1, n_warmup=1):
+        self.n_init = n_init
+        self.n = n
+        self.n_warmup = n_warmup
+
+    def __call__(self, n_updates):
+        return self.n_init if n_updates < self.n_warmup else self.n
+
+
+class SpectralNorm:
+    '''Spectral normalization of the weight of a layer.
+
+    The normalized weight is computed once per change of the weight, that is
+    once per optimizer step, and shared by all forwards until then. It is
+    recomputed after a backward through it, which frees its graph. Power
+    iteration does not run in eval mode, where the singular vectors of the
+    last update are used.
+
+    '''
+
+    def init_spectral_norm(self, n_power_iterations):
+        '''
+        Args:
+            n_power_iterations: Number of power iterations per update, or a
+                function of the number of updates so far, e.g.
+                :class:`WarmStart`.
+
+        '''
         self.n_power_iterations = n_power_iterations
         self.height = self.weight.shape[0]
         self.register_buffer(
             'u', l2normalize(self.weight.new_empty(self.height).normal_(0, 1)))
+        self.register_buffer('_v', None, persistent=False)
+
+    def _power_iteration(self):
+        n_updates = getattr(self, '_n_updates', 0)
+        n_power_iterations = self.n_power_iterations
+        if callable(n_power_iterations):
+            n_power_iterations = n_power_iterations(n_updates)
+        v = getattr(self, '_v', None)
+        if v is None:
+            n_power_iterations = max(n_power_iterations, 1)
+
+        with torch.no_grad():
+            weight = self.weight.reshape(self.height, -1)
+            u = self.u
+            for _ in range(n_power_iterations):
+                v = l2normalize(torch.mv(weight.t(), u))
+                u = l2normalize(torch.mv(weight, v))
+            self.u.copy_(u)
+        self._v = v
+        self._n_updates = n_updates + 1
+
+    def _normalize(self):
+        # Cloned so that later updates do not modify saved tensors.
+        u = self.u.clone()
+        v = self._v.clone()
+        sigma = u.dot(self.weight.reshape(self.height, -1).mv(v))
+        return torch.div(self.weight, sigma)
+
+    def _release(self, grad):
+        self._w_sn = (None, None)
+
+    def normalized_weight(self):
+        version = (self.weight._version, self.weight.data_ptr())
+        if getattr(self, '_v', None) is None or (
+                self.training and
+                version != getattr(self, '_sn_version', None)):
+            self._power_iteration()
+            self._sn_version = version
+
+        requires_grad = torch.is_grad_enabled() and self.weight.requires_grad
+        key = (version, self.u._version, requires_grad)
+        w_sn, w_sn_key = getattr(self, '_w_sn', (None, None))
+        if w_sn is None or w_sn_key != key:
+            with torch.set_grad_enabled(requires_grad):
+                w_sn = self._normalize()
+            if requires_grad:
+                w_sn.register_hook(self._release)
+            self._w_sn = (w_sn, key)
+        return w_sn
+
+    def _apply(self, fn, *args, **kwargs):
+        self._w_sn = (None, None)
+        return super()._apply(fn, *args, **kwargs)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop('_w_sn', None)
+        return state
+
+
+class SNConv2d(SpectralNorm, nn.Conv2d):
+    def __init__(self, *args, n_power_iterations=1, **kwargs):
+        super(SNConv2d, self).__init__(*args, **kwargs)
+        self.init_spectral_norm(n_power_iterations)
 
     def forward(self, input):
-        w_sn, self.u = sn_weight(self.weight, self.u, self.height,
-                                 self.n_power_iterations)
-        return F.conv2d(input, w_sn, self.bias, self.stride,
-                        self.padding, self.dilation, self.groups)
+        return F.conv2d(input, self.normalized_weight(), self.bias,
+                        self.stride, self.padding, self.dilation, self.groups)
 
 
-class SNLinear(nn.Linear):
+class SNLinear(SpectralNorm, nn.Linear):
     def __init__(self, *args, n_power_iterations=1, **kwargs):
         super(SNLinear, self).__init__(*args, **kwargs)
-        self.n_power_iterations = n_power_iterations
-        self.height = self.weight.shape[0]
-        self.register_buffer(
-            'u', l2normalize(self.weight.new(self.height).normal_(0, 1)))
+        self.init_spectral_norm(n_power_iterations)
 
     def forward(self, input):
-        w_sn, self.u = sn_weight(
-            self.weight, self.u, self.height, self.n_power_iterations)
-        return F.linear(input, w_sn, self.bias)
+        return F.linear(input, self.normalized_weight(), self.bias)
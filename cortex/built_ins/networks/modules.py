@@ -6,12 +6,18 @@ import torch.nn as nn
 
 
 class View(nn.Module):
+    '''Reshapes the input.
+
+    Reshaping copies inputs whose memory layout does not allow a view, such
+    as channels_last feature maps being flattened.
+
+    '''
     def __init__(self, *shape):
         super(View, self).__init__()
         self.shape = shape
 
     def forward(self, input):
-        return input.view(*self.shape)
+        return input.reshape(*self.shape)
 
 
 class Pipeline(nn.Module):
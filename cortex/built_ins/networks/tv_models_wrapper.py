@@ -27,5 +27,5 @@ class AlexNet(models.AlexNet):
 
     def forward(self, x):
         x = self.features(x)
-        x = x.view(x.size()[0], -1)
+        x = x.reshape(x.size()[0], -1)
         return self.fc(x)
@@ -0,0 +1,176 @@
+'''Module for batch transformations
+
+These act on whole `N x C x H x W` batches of tensors with per-sample random
+parameters, so augmentation runs as a few vectorized tensor ops after
+collation instead of once per image in the loader workers.
+
+'''
+
+import math
+import numbers
+
+import torch
+import torch.nn.functional as F
+
+
+def _pair(size):
+    if isinstance(size, numbers.Number):
+        return (int(size), int(size))
+    return tuple(size)
+
+
+def crop(X, top, left, size):
+    '''Crops each image of a batch at its own offset.
+
+    Args:
+        X: Batch of images.
+        top: Row offset of each crop.
+        left: Column offset of each crop.
+        size: (height, width) of the crops.
+
+    Returns:
+        torch.Tensor: Batch of cropped images.
+
+    '''
+    N, C = X.size()[:2]
+    h, w = size
+    device = X.device
+
+    rows = top.view(N, 1) + torch.arange(h, device=device).view(1, h)
+    cols = left.view(N, 1) + torch.arange(w, device=device).view(1, w)
+
+    n = torch.arange(N, device=device).view(N, 1, 1, 1)
+    c = torch.arange(C, device=device).view(1, C, 1, 1)
+    return X[n, c, rows.view(N, 1, h, 1), cols.view(N, 1, 1, w)]
+
+
+class Compose(object):
+    def __init__(self, transforms):
+        self.transforms = transforms
+
+    def __call__(self, X):
+        for t in self.transforms:
+            X = t(X)
+        return X
+
+    def __repr__(self):
+        return '{}({})'.format(self.__class__.__name__, self.transforms)
+
+
+class RandomCrop(object):
+    def __init__(self, size, padding=0):
+        self.size = _pair(size)
+        self.padding = padding
+
+    def __call__(self, X):
+        if self.padding:
+            X = F.pad(X, (self.padding,) * 4)
+        N, _, H, W = X.size()
+        h, w = self.size
+        top = torch.randint(0, H - h + 1, (N,), device=X.device)
+        left = torch.randint(0, W - w + 1, (N,), device=X.device)
+        return crop(X, top, left, self.size)
+
+    def __repr__(self):
+        return '{}(size={})'.format(self.__class__.__name__, self.size)
+
+
+class CenterCrop(object):
+    def __init__(self, size):
+        self.size = _pair(size)
+
+    def __call__(self, X):
+        H, W = X.size()[2:]
+        h, w = self.size
+        top = (H - h) // 2
+        left = (W - w) // 2
+        return X[:, :, top:top + h, left:left + w]
+
+    def __repr__(self):
+        return '{}(size={})'.format(self.__class__.__name__, self.size)
+
+
+class RandomHorizontalFlip(object):
+    def __init__(self, p=0.5):
+        self.p = p
+
+    def __call__(self, X):
+        flip = torch.rand(X.size(0), device=X.device) < self.p
+        return torch.where(flip.view(-1, 1, 1, 1), X.flip(3), X)
+
+    def __repr__(self):
+        return '{}(p={})'.format(self.__class__.__name__, self.p)
+
+
+class Resize(object):
+    def __init__(self, size, mode='bilinear'):
+        self.size = _pair(size)
+        self.mode = mode
+
+    def __call__(self, X):
+        if tuple(X.size()[2:]) == self.size:
+            return X
+        return F.interpolate(X, size=self.size, mode=self.mode,
+                             align_corners=False)
+
+    def __repr__(self):
+        return '{}(size={})'.format(self.__class__.__name__, self.size)
+
+
+class RandomResizedCrop(object):
+    '''Crops a random area and aspect ratio of each image and resizes it.
+
+    All crops are resampled in a single `grid_sample` call.
+
+    '''
+
+    def __init__(self, size, scale=(0.08, 1.0), ratio=(3. / 4., 4. / 3.)):
+        self.size = _pair(size)
+        self.scale = scale
+        self.ratio = ratio
+
+    def __call__(self, X):
+        N, C = X.size()[:2]
+        H, W = X.size()[2:]
+        device = X.device
+
+        area = torch.empty(N, device=device).uniform_(*self.scale)
+        log_ratio = torch.empty(N, device=device).uniform_(
+            math.log(self.ratio[0]), math.log(self.ratio[1]))
+        ratio = torch.exp(log_ratio)
+
+        # Width and height of the crops relative to the image.
+        w = torch.sqrt(area * ratio * H / W).clamp(max=1.)
+        h = torch.sqrt(area / ratio * W / H).clamp(max=1.)
+
+        # Centers in normalized [-1, 1] coordinates.
+        cx = (torch.rand(N, device=device) * 2. - 1.) * (1. - w)
+        cy = (torch.rand(N, device=device) * 2. - 1.) * (1. - h)
+
+        theta = torch.zeros(N, 2, 3, device=device, dtype=X.dtype)
+        theta[:, 0, 0] = w
+        theta[:, 0, 2] = cx
+        theta[:, 1, 1] = h
+        theta[:, 1, 2] = cy
+
+        grid = F.affine_grid(theta, (N, C) + self.size, align_corners=False)
+        return F.grid_sample(X, grid, mode='bilinear', align_corners=False)
+
+    def __repr__(self):
+        return '{}(size={})'.format(self.__class__.__name__, self.size)
+
+
+class Normalize(object):
+    def __init__(self, mean, std):
+        self.mean = torch.tensor(mean).view(1, -1, 1, 1)
+        self.std = torch.tensor(std).view(1, -1, 1, 1)
+
+    def __call__(self, X):
+        mean = self.mean.to(X.device, X.dtype)
+        std = self.std.to(X.device, X.dtype)
+        return (X - mean) / std
+
+    def __repr__(self):
+        return '{}(mean={}, std={})'.format(
+            self.__class__.__name__, self.mean.view(-1).tolist(),
+            self.std.view(-1).tolist())
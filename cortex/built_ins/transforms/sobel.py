@@ -3,6 +3,7 @@
 '''
 
 import torch
+from torch import nn
 import torch.nn.functional as F
 
 
@@ -25,3 +26,37 @@ class Sobel(object):
 
     def __repr__(self):
         return self.__class__.__name__ + '()'
+
+
+class BatchSobel(nn.Module):
+    '''Sobel transformation of whole batches.
+
+    All channels of an `N x C x H x W` batch are filtered with a single
+    grouped convolution using a stacked x / y kernel. Can be used as a batch
+    transform or as a layer of a network.
+
+    '''
+
+    def __init__(self):
+        super(BatchSobel, self).__init__()
+        kernel = torch.FloatTensor(
+            [[[-1, 0, 1], [-2, 0, 2], [-1, 0, 1]],
+             [[1, 2, 1], [0, 0, 0], [-1, -2, -1]]]).unsqueeze(1)
+        self.register_buffer('kernel', kernel)
+        self._kernels = {}
+
+    def _get_kernel(self, channels, device, dtype):
+        key = (channels, device, dtype)
+        kernel = self._kernels.get(key)
+        if kernel is None:
+            kernel = self.kernel.to(device=device, dtype=dtype)
+            kernel = kernel.repeat(channels, 1, 1, 1)
+            self._kernels[key] = kernel
+        return kernel
+
+    def forward(self, X):
+        N, C, H, W = X.size()
+        kernel = self._get_kernel(C, X.device, X.dtype)
+        g = F.conv2d(X, kernel, stride=1, padding=1, groups=C)
+        g = g.view(N, C, 2, H, W)
+        return torch.sqrt(g.pow(2).sum(2))
@@ -5,8 +5,8 @@
 
 import logging
 
-from cortex._lib import (config, data, exp, optimizer, setup_cortex,
-                         setup_experiment, train)
+from cortex._lib import (config, data, exp, optimizer, run_bench_data,
+                         setup_cortex, setup_experiment, train)
 from cortex._lib.utils import print_section
 
 __author__ = 'R Devon Hjelm'
@@ -28,6 +28,10 @@ def run(model=None):
             # Performs setup only.
             config.setup()
             exit(0)
+        elif args.command == 'bench-data':
+            config.set_config()
+            run_bench_data(args)
+            exit(0)
         else:
             config.set_config()
             print_section('EXPERIMENT')
@@ -2,13 +2,16 @@
 
 import logging
 from os import path
-import shutil
 
 from torch.utils.data import Dataset
 
 from cortex._lib.config import CONFIG, _config_name
 from cortex._lib.data import DatasetPluginBase, register as register_data
-from cortex._lib.models import ModelPluginBase, register_model
+from cortex._lib.data import local_copy
+from cortex._lib.data.shared_cache import shared_arrays
+from cortex._lib.models import ModelPluginBase, register_model, trains
+from cortex._lib.optimizer import backward
+from cortex._lib.utils import update_dict_of_lists
 
 __author__ = 'R Devon Hjelm'
 __author_email__ = 'erroneus@gmail.com'
@@ -16,7 +19,8 @@ __author_email__ = 'erroneus@gmail.com'
 __all__ = [
     'DatasetPlugin',
     'ModelPlugin',
-    'register_plugin']
+    'register_plugin',
+    'trains']
 
 logger = logging.getLogger('cortex.plugins')
 
@@ -30,14 +34,26 @@ class DatasetPlugin(DatasetPluginBase):
     """
     sources = []
 
-    def copy_to_local_path(self, from_path: str) -> str:
+    def copy_to_local_path(self, from_path: str, n_threads: int=8,
+                           checksum: bool=False, pack: bool=False) -> str:
         """ Copies data to a local path.
 
         Path is set in the .cortex.yml file. This can be set up through
         `cortex setup`.
 
+        Files are copied in parallel and the copy is only reused once
+        complete; an interrupted copy is resumed.
+
         Args:
             from_path: The path to the data to be copied.
+            n_threads: Number of files copied concurrently.
+            checksum: Verify the copied files with their md5 hash instead of
+                their size and modification time.
+            pack: Pack the files of a directory into a single file, to be
+                read with :class:`cortex._lib.data.local_copy.PackedFiles`.
+
+        Returns:
+            str: The local path.
 
         """
         if from_path.endswith('/'):
@@ -49,22 +65,47 @@ class DatasetPlugin(DatasetPluginBase):
             raise KeyError(
                 '`{}` not found in {} data_paths'
                 .format(local_path, _config_name))
+        if pack:
+            basename += '.pack'
         to_path = path.join(local_path, basename)
-        if (not path.exists(to_path)) and path.exists(from_path):
 
+        if not local_copy.is_complete(to_path) and path.exists(from_path):
             logger.info('Copying dataset {} from {} to {} directory.... '
                         '(This may take time)'
                         .format(self.__class__.__name__, from_path, to_path))
-
-            if path.isdir(from_path):
-                shutil.copytree(from_path, to_path)
+            if pack:
+                local_copy.pack_files(from_path, to_path, n_threads=n_threads)
             else:
-                shutil.copy(from_path, local_path)
-
-            logger.info('Finished copying.')
+                local_copy.copy_files(from_path, to_path, n_threads=n_threads,
+                                      checksum=checksum)
 
         return to_path
 
+    def shared_arrays(self, key: str, build) -> dict:
+        """Gets arrays shared between the cortex processes of the host.
+
+        With `--d.shared_cache`, the arrays are built by the first process to
+        ask for them and published to a host-level cache, and every process
+        attaches to them read-only. Otherwise they are built in process.
+
+        Args:
+            key: Name of the arrays in the cache.
+            build: Function returning a dict of numpy arrays.
+
+        Returns:
+            dict: The arrays.
+
+        Example:
+            ```
+            arrays = self.shared_arrays(
+                'MyData_train', lambda: dict(images=load_images(path)))
+            train_set = MyDataset(arrays['images'])
+            ```
+
+        """
+        return shared_arrays('{}_{}'.format(self.__class__.__name__, key),
+                             build)
+
     def add_dataset(self, mode: str, dataset: Dataset):
         """Adds a dataset to the plugin.
 
@@ -115,6 +156,43 @@ class DatasetPlugin(DatasetPluginBase):
         """
         self._dataloader_class = dataloader_class
 
+    def set_in_memory(self, in_memory: bool=True):
+        """Marks the datasets of this plugin as fitting in memory.
+
+        The datasets are decoded once into tensors on the device and batches
+        are served from there, without :class:`torch.utils.data.DataLoader`
+        workers. :class:`torch.utils.data.TensorDataset` datasets are served
+        this way without setting this.
+
+        Notes:
+            Random transforms are only drawn once, so this should only be used
+            with deterministic transforms. Ignored if a dataloader class is
+            set.
+
+        Args:
+            in_memory: Whether the datasets should be held in memory.
+
+        """
+        self._in_memory = in_memory
+
+    def set_batch_transform(self, transform, mode: str=None,
+                            input_name: str='images'):
+        """Sets a transform applied to whole batches after collation.
+
+        The transform runs on the device the batch is sent to, on the
+        collated tensor (e.g., `N x C x H x W` images). See
+        :mod:`cortex.built_ins.transforms.batch` for vectorized
+        augmentations.
+
+        Args:
+            transform: Callable taking and returning a batch tensor.
+            mode: Data mode (e.g., `train`) the transform applies to. If
+                None, it applies to all modes.
+            input_name: Name of the input to transform.
+
+        """
+        self._batch_transforms.append((mode, input_name, transform))
+
     def get_path(self, source: str):
         """Get's the path to a source.
 
@@ -218,11 +296,14 @@ class ModelPlugin(ModelPluginBase):
             '`build` is not implemented for model class {}'
             .format(self.__class__.__name__))
 
+    @trains()
     def routine(self, *args, **kwargs):
         """Derives losses and results.
 
         The the model is to train something, this needs to be
-        overridden.
+        overridden. The networks it trains can be declared with
+        :func:`trains` or the `nets_trained` attribute, otherwise they are
+        found by running it.
 
         Args:
             *args: Inputs to be passed to the function.
@@ -268,20 +349,32 @@ class ModelPlugin(ModelPluginBase):
     def optimizer_step(self):
         """Makes a step of the optimizers for which losses are defined.
 
+        The time of each step is added to the epoch times as
+        `<network>_step`.
+
         This can be overridden to change the behavior of the optimizer.
 
         """
-        keys = self.losses.keys()
-
-        for i, k in enumerate(keys):
+        losses = []
+        optimizers = []
+        keys = []
+        for k in list(self.losses.keys()):
             loss = self.losses.pop(k)
-            loss.backward(retain_graph=(i < len(keys)))
+            if isinstance(loss, (list, tuple)):
+                loss = sum(loss)
+            losses.append(loss)
             #  TODO(Devon): Is this a good idea?
             key = self.nets._aliases.get(k, k)
+            keys.append(key)
+            optimizers.append(self._optimizers.get(key))
+
+        backward(losses, optimizers)
 
-            optimizer = self._optimizers.get(key)
-            if optimizer is not None:
-                optimizer.step()
+        # Only optimizers set up by cortex are timed.
+        times = dict(('{}_step'.format(k), op.step_time)
+                     for k, op in zip(keys, optimizers)
+                     if hasattr(op, 'step_time'))
+        update_dict_of_lists(self._epoch_times, **times)
 
     def train_loop(self):
         """The training loop.
@@ -0,0 +1,63 @@
+'''Benchmarks multi-tensor weight clipping and L1 decay against per-parameter
+loops.
+
+Usage: python scripts/benchmark_clipping.py [n_layers] [width] [device]
+
+'''
+
+import sys
+import time
+
+import torch
+
+from cortex._lib.optimizer import clip_params, l1_decay_params
+
+
+def clip_loop(params, bound):
+    for p in params:
+        p.data.clamp_(-bound, bound)
+
+
+def l1_decay_loop(params, factor):
+    for p in params:
+        p.data.mul_(1. - factor / p.norm(1).clamp(min=1e-12))
+
+
+def benchmark(fn, params, arg, device, repeats=100):
+    fn(params, arg)
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+    start = time.time()
+    for _ in range(repeats):
+        fn(params, arg)
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+    return (time.time() - start) / repeats
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    n_layers = int(args[0]) if len(args) > 0 else 32
+    width = int(args[1]) if len(args) > 1 else 256
+    device = torch.device(args[2] if len(args) > 2 else 'cpu')
+
+    # Weights and biases of a stack of linear layers, as in a discriminator.
+    params = []
+    for _ in range(n_layers):
+        params += [torch.randn(width, width, device=device),
+                   torch.randn(width, device=device)]
+
+    for name, loop, foreach, arg in (
+            ('Clipping', clip_loop, clip_params, 0.01),
+            ('L1 decay', l1_decay_loop, l1_decay_params, 1e-4)):
+        p_loop = [p.clone() for p in params]
+        p_foreach = [p.clone() for p in params]
+        loop(p_loop, arg)
+        foreach(p_foreach, arg)
+        assert all(torch.allclose(a, b) for a, b in zip(p_loop, p_foreach))
+
+        t_loop = benchmark(loop, p_loop, arg, device)
+        t_foreach = benchmark(foreach, p_foreach, arg, device)
+        print('{} of {} tensors on {}'.format(name, len(params), device))
+        print('Loop: {:.3f} ms | Foreach: {:.3f} ms | Speedup: {:.1f}x'
+              .format(t_loop * 1000, t_foreach * 1000, t_loop / t_foreach))
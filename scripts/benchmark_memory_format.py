@@ -0,0 +1,68 @@
+'''Benchmarks the built-in convolutional networks in the channels_last memory
+format against the default contiguous one.
+
+Times a forward and backward pass of each network in both layouts.
+
+Usage: python scripts/benchmark_memory_format.py [batch_size] [size] [device]
+
+'''
+
+import sys
+import time
+
+import torch
+
+from cortex.built_ins.networks.conv_decoders import SimpleConvDecoder
+from cortex.built_ins.networks.convnets import SimpleConvEncoder
+from cortex.built_ins.networks.resnets import ResDecoder, ResEncoder
+
+
+def benchmark(net, X, device, repeats=10):
+    def step():
+        net.zero_grad()
+        net(X).sum().backward()
+
+    step()
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+    start = time.time()
+    for _ in range(repeats):
+        step()
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+    return (time.time() - start) / repeats
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    N = int(args[0]) if len(args) > 0 else 64
+    S = int(args[1]) if len(args) > 1 else 32
+    device = torch.device(args[2] if len(args) > 2 else 'cpu')
+    shape = (S, S, 3)
+    dim_z = 64
+
+    images = torch.randn(N, 3, S, S, device=device)
+    latents = torch.randn(N, dim_z, device=device)
+    networks = (
+        ('SimpleConvEncoder', SimpleConvEncoder(shape, dim_out=dim_z), images),
+        ('SimpleConvDecoder', SimpleConvDecoder(shape, dim_in=dim_z),
+         latents),
+        ('ResEncoder', ResEncoder(shape, dim_out=dim_z), images),
+        ('ResDecoder', ResDecoder(shape, dim_in=dim_z), latents))
+
+    print('Batch {}x3x{}x{} on {}'.format(N, S, S, device))
+    for name, net, X in networks:
+        net.to(device)
+        t_contiguous = benchmark(net, X, device)
+        Y = net(X)
+
+        net.to(memory_format=torch.channels_last)
+        if X.dim() == 4:
+            X = X.contiguous(memory_format=torch.channels_last)
+        t_channels_last = benchmark(net, X, device)
+        assert torch.allclose(Y, net(X), atol=1e-4)
+
+        print('{}: contiguous {:.2f} ms | channels_last {:.2f} ms | '
+              'Speedup: {:.2f}x'.format(name, t_contiguous * 1000,
+                                        t_channels_last * 1000,
+                                        t_contiguous / t_channels_last))
@@ -0,0 +1,82 @@
+'''Benchmarks bf16 autocast against fp32 training of the built-in models.
+
+Each model is trained for the same steps on the same synthetic images in both
+precisions, from the same initialization. Reports the throughput and how far
+the bf16 loss curve strays from the fp32 one.
+
+Usage: python scripts/benchmark_precision.py [n_steps] [batch_size] [size]
+
+'''
+
+import sys
+import time
+
+import torch
+from torch.utils.data import TensorDataset
+
+from cortex._lib import data, optimizer
+from cortex.built_ins.models.ae import Autoencoder
+from cortex.built_ins.models.classifier import ImageClassification
+from cortex.built_ins.models.vae import VAE
+from cortex.plugins import DatasetPlugin, ModelPlugin
+
+
+class Synthetic(DatasetPlugin):
+    sources = ['synthetic']
+
+
+def setup_data(n_steps, batch_size, size, n_labels=10):
+    N = n_steps * batch_size
+    X = torch.rand(N, 3, size, size) * 2 - 1
+    Y = torch.randint(n_labels, (N,))
+
+    plugin = Synthetic()
+    plugin.add_dataset('train', TensorDataset(X, Y))
+    plugin.add_dataset('test', TensorDataset(X[:batch_size], Y[:batch_size]))
+    plugin.set_input_names(['images', 'targets'])
+    plugin.set_dims(x=size, y=size, c=3, labels=n_labels)
+
+    handler = data.DATA_HANDLER
+    handler.set_batch_size(batch_size)
+    handler.set_seed(0)
+    handler.add_dataset('synthetic', plugin, n_workers=0)
+    handler.set_inputs(inputs='images', targets='targets')
+
+
+def train(Model, precision, n_steps):
+    ModelPlugin._reset_class()
+    torch.manual_seed(0)
+    model = Model()
+    model.build()
+    optimizer.setup(model, optimizer='Adam', learning_rate=1e-4)
+    model._set_precision(precision)
+
+    model._reset_epoch()
+    model.data.reset('train', make_pbar=False, epoch=0)
+    model.train_step()  # Warmup.
+    start = time.time()
+    for _ in range(n_steps - 1):
+        model.train_step()
+    elapsed = time.time() - start
+    model._set_precision('fp32')
+
+    losses = model._all_epoch_losses
+    losses = [sum(v) for v in zip(*losses.values())]
+    return (n_steps - 1) / elapsed, losses
+
+
+if __name__ == '__main__':
+    args = [int(a) for a in sys.argv[1:]]
+    n_steps, batch_size, size = args + [20, 64, 32][len(args):]
+    setup_data(n_steps, batch_size, size)
+
+    for Model in (ImageClassification, Autoencoder, VAE):
+        fp32_rate, fp32_losses = train(Model, 'fp32', n_steps)
+        bf16_rate, bf16_losses = train(Model, 'bf16', n_steps)
+        deviation = max(abs(a - b) / max(abs(a), 1e-8)
+                        for a, b in zip(fp32_losses, bf16_losses))
+        print('{}: fp32 {:.1f} steps/s | bf16 {:.1f} steps/s | Speedup: '
+              '{:.2f}x | Loss {:.4g} / {:.4g} | Max relative loss deviation: '
+              '{:.2%}'.format(Model.__name__, fp32_rate, bf16_rate,
+                              bf16_rate / fp32_rate, fp32_losses[-1],
+                              bf16_losses[-1], deviation))
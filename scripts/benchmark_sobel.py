@@ -0,0 +1,40 @@
+'''Benchmarks the batched Sobel transform against the per-image one.
+
+Usage: python scripts/benchmark_sobel.py [batch_size] [channels] [size]
+
+'''
+
+import sys
+import time
+
+import torch
+
+from cortex.built_ins.transforms.sobel import BatchSobel, Sobel
+
+
+def benchmark(fn, X, repeats=10):
+    fn(X)
+    start = time.time()
+    for _ in range(repeats):
+        fn(X)
+    return (time.time() - start) / repeats
+
+
+if __name__ == '__main__':
+    args = [int(a) for a in sys.argv[1:]]
+    N, C, S = args + [128, 3, 32][len(args):]
+    X = torch.randn(N, C, S, S)
+
+    sobel = Sobel()
+    batch_sobel = BatchSobel()
+
+    def per_image(X):
+        return torch.stack([sobel(x) for x in X])
+
+    assert torch.allclose(per_image(X), batch_sobel(X), atol=1e-5)
+
+    t_image = benchmark(per_image, X)
+    t_batch = benchmark(batch_sobel, X)
+    print('Batch {}x{}x{}x{}'.format(N, C, S, S))
+    print('Per image: {:.2f} ms | Batched: {:.2f} ms | Speedup: {:.1f}x'
+          .format(t_image * 1000, t_batch * 1000, t_image / t_batch))
@@ -0,0 +1,79 @@
+'''Benchmarks the spectral normalized layers, which normalize their weight once
+per optimizer step, against normalizing it on every forward.
+
+Each step scores real and fake samples, as the discriminator of a GAN does,
+then evaluates the network once without gradient.
+
+Usage: python scripts/benchmark_spectral_norm.py [batch_size] [size] [device]
+
+'''
+
+import sys
+import time
+
+import torch
+import torch.nn.functional as F
+
+from cortex.built_ins.networks import SpectralNormLayer
+from cortex.built_ins.networks.resnets import ResEncoder
+from cortex.built_ins.networks.SpectralNormLayer import l2normalize
+
+
+def forward_per_call(self, input):
+    '''Normalizes the weight with power iteration on every forward.
+
+    '''
+    weight = self.weight.reshape(self.height, -1)
+    with torch.no_grad():
+        u = self.u
+        for _ in range(self.n_power_iterations):
+            v = l2normalize(torch.mv(weight.t(), u))
+            u = l2normalize(torch.mv(weight, v))
+        self.u = u
+    sigma = u.dot(weight.mv(v))
+    return F.conv2d(input, self.weight / sigma, self.bias, self.stride,
+                    self.padding, self.dilation, self.groups)
+
+
+def benchmark(net, X, device, repeats=10):
+    op = torch.optim.SGD(net.parameters(), lr=1e-4)
+
+    def step():
+        op.zero_grad()
+        (net(X).mean() - net(X.flip(0)).mean()).backward()
+        op.step()
+        with torch.no_grad():
+            net(X)
+
+    step()
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+    start = time.time()
+    for _ in range(repeats):
+        step()
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+    return (time.time() - start) / repeats
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    N = int(args[0]) if len(args) > 0 else 64
+    S = int(args[1]) if len(args) > 1 else 32
+    device = torch.device(args[2] if len(args) > 2 else 'cpu')
+    X = torch.randn(N, 3, S, S, device=device)
+
+    torch.manual_seed(0)
+    net = ResEncoder((S, S, 3), dim_out=1, spectral_norm=True).to(device)
+    t_cached = benchmark(net, X, device)
+
+    forward = SpectralNormLayer.SNConv2d.forward
+    SpectralNormLayer.SNConv2d.forward = forward_per_call
+    torch.manual_seed(0)
+    net = ResEncoder((S, S, 3), dim_out=1, spectral_norm=True).to(device)
+    t_per_call = benchmark(net, X, device)
+    SpectralNormLayer.SNConv2d.forward = forward
+
+    print('Batch {}x3x{}x{} on {}: per forward {:.2f} ms | per step {:.2f} ms '
+          '| Speedup: {:.2f}x'.format(N, S, S, device, t_per_call * 1000,
+                                      t_cached * 1000, t_per_call / t_cached))
@@ -0,0 +1,62 @@
+'''Tests the dSprites dataset.
+
+'''
+
+import os
+
+import numpy as np
+import torch
+
+from cortex.built_ins.datasets.dSprites import dSprites
+
+
+def make_npz(tmpdir, N=20):
+    imgs = (np.random.rand(N, 64, 64) > 0.5).astype('uint8')
+    latents_values = np.random.rand(N, 6)
+    latents_classes = np.random.randint(0, 3, size=(N, 6))
+    root = str(tmpdir.join('dsprites.npz'))
+    np.savez_compressed(root, imgs=imgs, latents_values=latents_values,
+                        latents_classes=latents_classes)
+    return root, imgs, latents_values
+
+
+def test_memory_mapped(tmpdir):
+    root, imgs, latents_values = make_npz(tmpdir)
+    dataset = dSprites(root, download=False)
+
+    assert isinstance(dataset.imgs, np.memmap)
+    assert os.path.isfile(str(tmpdir.join('dsprites_npy', 'imgs.npy')))
+    assert len(dataset) == len(imgs)
+
+    image, latent = dataset[3]
+    assert isinstance(image, torch.Tensor)
+    assert image.size() == (1, 64, 64)
+    assert np.allclose(image.numpy()[0], imgs[3])
+    assert np.allclose(latent, latents_values[3])
+
+    # Reuses the extracted files.
+    dataset = dSprites(root, download=False)
+    assert np.allclose(dataset[3][0].numpy()[0], imgs[3])
+
+
+def test_shuffle(tmpdir):
+    root, imgs, latents_values = make_npz(tmpdir)
+    dataset = dSprites(root, download=False, shuffle=True)
+
+    assert sorted(dataset.idx.tolist()) == list(range(len(imgs)))
+    for i in range(len(dataset)):
+        image, latent = dataset[i]
+        j = dataset.idx[i]
+        assert np.allclose(image.numpy()[0], imgs[j])
+        assert np.allclose(latent, latents_values[j])
+
+
+def test_pil_transform(tmpdir):
+    root, imgs, _ = make_npz(tmpdir)
+    dataset = dSprites(root, download=False,
+                       transform=lambda image: image.size)
+    assert dataset[0][0] == (64, 64)
+
+    dataset = dSprites(root, download=False, pil_transform=False,
+                       transform=lambda image: image * 2)
+    assert np.allclose(dataset[0][0].numpy()[0], imgs[0] * 2)
@@ -0,0 +1,28 @@
+'''Tests the packed image folder.
+
+'''
+
+import numpy as np
+from PIL import Image
+
+from cortex._lib.data.local_copy import pack_files
+from cortex.built_ins.datasets.imagenet import PackedImageFolder
+
+
+def test_packed_image_folder(tmpdir):
+    src = tmpdir.mkdir('train')
+    for c in ('cat', 'dog'):
+        d = src.mkdir(c)
+        for i in range(2):
+            img = np.full((4, 4, 3), i * 50, dtype=np.uint8)
+            Image.fromarray(img).save(str(d.join('{}.png'.format(i))))
+    src.join('README').write('not an image')
+
+    pack = pack_files(str(src), str(tmpdir.join('train.pack')))
+    dataset = PackedImageFolder(pack, transform=np.asarray)
+
+    assert dataset.classes == ['cat', 'dog']
+    assert len(dataset) == 4
+    img, target = dataset[3]
+    assert target == 1
+    assert img.shape == (4, 4, 3) and (img == 50).all()
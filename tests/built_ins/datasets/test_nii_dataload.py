@@ -0,0 +1,79 @@
+'''Tests the neuroimaging dataset.
+
+'''
+
+import os
+
+import nibabel as nib
+import numpy as np
+
+from cortex.built_ins.datasets.nii_dataload import ImageFolder
+
+
+def save_nii(data, path):
+    nib.save(nib.Nifti1Image(data, np.eye(4)), path)
+
+
+def make_folder(tmpdir, shape):
+    root = tmpdir.mkdir('data')
+    volumes = []
+    for c in ('0', '1'):
+        class_dir = root.mkdir(c)
+        for i in range(2):
+            data = np.random.rand(*shape).astype('float32')
+            save_nii(data, str(class_dir.join('{}.nii'.format(i))))
+            volumes.append(data)
+
+    mask = (np.random.rand(*shape[:3]) > 0.5).astype('float32')
+    mask_path = str(tmpdir.join('mask.nii'))
+    save_nii(mask, mask_path)
+
+    return str(root), mask, mask_path
+
+
+def test_mask_3d(tmpdir):
+    root, mask, mask_path = make_folder(tmpdir, (4, 5, 6))
+    dataset = ImageFolder(root, mask=mask_path)
+
+    for i, (path, _) in enumerate(dataset.imgs):
+        img = np.asanyarray(nib.load(path).dataobj)
+        masked, _ = dataset[i]
+        assert masked.dtype == np.float32
+        assert np.allclose(masked, img[mask == 1])
+
+
+def test_mask_4d(tmpdir):
+    root, mask, mask_path = make_folder(tmpdir, (4, 5, 6, 3))
+    cache_dir = str(tmpdir.join('cache'))
+    dataset = ImageFolder(root, mask=mask_path, cache_dir=cache_dir)
+
+    for i, (path, _) in enumerate(dataset.imgs):
+        img = np.asanyarray(nib.load(path).dataobj)
+        expected = np.stack([img[..., t][mask == 1] for t in range(3)])
+        masked, _ = dataset[i]
+        assert masked.shape == (3, int(mask.sum()))
+        assert np.allclose(masked, expected)
+
+    assert len(os.listdir(cache_dir)) == len(dataset)
+    path = dataset.imgs[0][0]
+    assert np.allclose(dataset[0][0], dataset.maskData(dataset.loader(path)))
+
+
+def test_cache_invalidation(tmpdir):
+    root, mask, mask_path = make_folder(tmpdir, (4, 5, 6))
+    cache_dir = str(tmpdir.join('cache'))
+    dataset = ImageFolder(root, mask=mask_path, cache_dir=cache_dir)
+    path = dataset.imgs[0][0]
+    dataset[0]
+
+    # A rewritten volume.
+    data = np.random.rand(4, 5, 6).astype('float32')
+    save_nii(data, path)
+    os.utime(path, ns=(0, 10 ** 9))
+    assert np.allclose(dataset[0][0], data[mask == 1])
+
+    # A changed mask.
+    mask = 1 - mask
+    save_nii(mask, mask_path)
+    dataset = ImageFolder(root, mask=mask_path, cache_dir=cache_dir)
+    assert np.allclose(dataset[0][0], data[mask == 1])
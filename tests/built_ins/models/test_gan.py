@@ -0,0 +1,87 @@
+'''Tests the f-divergence measures of the GANs.
+
+'''
+
+import math
+
+import pytest
+import torch
+import torch.nn.functional as F
+
+from cortex.built_ins.models import gan
+from cortex.built_ins.models.utils import log_sum_exp
+
+MEASURES = ['GAN', 'JSD', 'X2', 'KL', 'RKL', 'DV', 'H2', 'W1']
+
+
+def _reference_positive(p_samples, measure):
+    log_2 = math.log(2.)
+    return dict(
+        GAN=lambda: - F.softplus(-p_samples),
+        JSD=lambda: log_2 - F.softplus(- p_samples),
+        X2=lambda: p_samples ** 2,
+        KL=lambda: p_samples + 1.,
+        RKL=lambda: -torch.exp(-p_samples),
+        DV=lambda: p_samples,
+        H2=lambda: 1. - torch.exp(-p_samples),
+        W1=lambda: p_samples)[measure]()
+
+
+def _reference_negative(q_samples, measure):
+    log_2 = math.log(2.)
+    return dict(
+        GAN=lambda: F.softplus(-q_samples) + q_samples,
+        JSD=lambda: F.softplus(-q_samples) + q_samples - log_2,
+        X2=lambda: -0.5 * ((torch.sqrt(q_samples ** 2) + 1.) ** 2),
+        KL=lambda: torch.exp(q_samples),
+        RKL=lambda: q_samples - 1.,
+        DV=lambda: (log_sum_exp(q_samples, 0) -
+                    math.log(q_samples.size(0))),
+        H2=lambda: torch.exp(q_samples) - 1.,
+        W1=lambda: q_samples)[measure]()
+
+
+@pytest.mark.parametrize('measure', MEASURES)
+def test_expectations(measure):
+    torch.manual_seed(0)
+    P_samples = torch.randn(16, 1) * 3
+    Q_samples = torch.randn(12, 1) * 3
+
+    Ep = _reference_positive(P_samples, measure)
+    Eq = _reference_negative(Q_samples, measure)
+    assert torch.allclose(
+        gan.get_positive_expectation(P_samples, measure, average=False), Ep,
+        atol=1e-5)
+    assert torch.allclose(
+        gan.get_negative_expectation(Q_samples, measure, average=False), Eq,
+        atol=1e-5)
+    assert gan.get_positive_expectation(P_samples, measure).item() == \
+        pytest.approx(Ep.mean().item(), abs=1e-5)
+
+    P_samples.requires_grad_()
+    Q_samples.requires_grad_()
+    E_pos, E_neg = gan.get_expectations(P_samples, Q_samples, measure)
+    assert E_pos.item() == pytest.approx(Ep.mean().item(), abs=1e-5)
+    assert E_neg.item() == pytest.approx(Eq.mean().item(), abs=1e-5)
+
+    (E_pos - E_neg).backward()
+    P_grad, Q_grad = P_samples.grad, Q_samples.grad
+    P_samples.grad = Q_samples.grad = None
+    (_reference_positive(P_samples, measure).mean() -
+     _reference_negative(Q_samples, measure).mean()).backward()
+    assert torch.allclose(P_grad, P_samples.grad, atol=1e-5)
+    assert torch.allclose(Q_grad, Q_samples.grad, atol=1e-5)
+
+
+def test_stability():
+    samples = torch.tensor([-200., 200.])
+    for measure in ('GAN', 'JSD'):
+        E_pos, E_neg = gan.get_expectations(samples, samples, measure)
+        assert torch.isfinite(E_pos) and torch.isfinite(E_neg)
+
+
+def test_unknown_measure():
+    with pytest.raises(NotImplementedError):
+        gan.get_measure('TV')
+    with pytest.raises(NotImplementedError):
+        gan.get_positive_expectation(torch.zeros(1), 'TV')
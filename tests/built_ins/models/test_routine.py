@@ -2,9 +2,11 @@
 
 '''
 
+import pytest
+import torch
 import torch.optim as optim
 
-from cortex.plugins import ModelPlugin
+from cortex.plugins import ModelPlugin, trains
 
 
 def test_routine(model_class, arguments, data_class):
@@ -110,3 +112,127 @@ def test_routine_with_submodels_2(model_class_with_submodel_2, data_class):
     model.train_step()
     model.train_step()
     model.train_step()
+
+
+def test_routine_runs_once(model_class, data_class):
+    ModelPlugin._reset_class()
+
+    class CountingModel(model_class):
+        n_calls = 0
+
+        def routine(self, A):
+            CountingModel.n_calls += 1
+            super().routine(A)
+
+    model = CountingModel(contract=dict(inputs=dict(A='test')))
+    model._data = data_class(17)
+    model.build()
+
+    assert not model._find_training_nets()
+    model.train_step()
+    assert CountingModel.n_calls == 1
+    assert model._get_training_nets() == ['net']
+    assert len(list(model._all_epoch_losses.values())[0]) == 1
+
+
+def test_routine_declared(model_class, data_class):
+    ModelPlugin._reset_class()
+
+    class DeclaredModel(model_class):
+
+        @trains('net')
+        def routine(self, A):
+            super().routine(A)
+
+    model = DeclaredModel(
+        contract=dict(inputs=dict(A='test'), nets=dict(net='net2')))
+    model._data = data_class(17)
+    model.build()
+
+    # Known, with aliases resolved, without running the routine.
+    assert model._find_training_nets()
+    assert model._get_training_nets() == ['net2']
+
+    ModelPlugin._reset_class()
+    model_class.nets_trained = ('net',)
+    model = model_class(contract=dict(inputs=dict(A='test')))
+    assert model._find_training_nets()
+    assert model._get_training_nets() == ['net']
+
+
+def test_routine_submodels_undeclared(model_with_submodel):
+    model = model_with_submodel
+    model.build()
+
+    # The submodel's routine is not declared, so it has to be run.
+    assert not model._find_training_nets()
+
+
+def test_routine_bf16(model_class, data_class):
+    ModelPlugin._reset_class()
+
+    class BF16Model(model_class):
+        dtypes = []
+
+        def routine(self, A):
+            output = self.nets.net(A)
+            BF16Model.dtypes.append(output.dtype)
+            self.losses.net = output.sum()
+            self.results.output = output.sum()
+
+    model = BF16Model(contract=dict(inputs=dict(A='test')))
+    model._data = data_class(17)
+    model.build()
+    model._optimizers = dict(
+        net=optim.SGD(model.nets.net.parameters(), lr=0.0001))
+
+    with pytest.raises(ValueError):
+        model._set_precision('fp8')
+
+    model._set_precision('bf16')
+    try:
+        model.train_step()
+        model.routine(auto_input=True)
+    finally:
+        model._set_precision('fp32')
+
+    assert BF16Model.dtypes == [torch.bfloat16] * 2
+    # Gathered in fp32, and the weights are kept in fp32.
+    assert model.losses['net'].dtype == torch.float32
+    assert model.results['output'].dtype == torch.float32
+    model.losses.pop('net')
+    for p in model.nets.net.parameters():
+        assert p.dtype == torch.float32
+
+    model.train_step()
+    assert BF16Model.dtypes[-1] == torch.float32
+
+
+def test_routine_nested_ids():
+    ModelPlugin._reset_class()
+
+    class Leaf(ModelPlugin):
+
+        @trains('net')
+        def routine(self):
+            pass
+
+    class Middle(ModelPlugin):
+        def __init__(self):
+            super().__init__()
+            self.encoder = Leaf(contract=dict(nets=dict(net='net_b')))
+
+    class Top(ModelPlugin):
+        def __init__(self):
+            super().__init__()
+            self.encoder = Leaf(contract=dict(nets=dict(net='net_a')))
+            self.coder = Middle()
+
+    model = Top()
+    # Submodels with the same name at different levels have their own ids.
+    assert model.encoder._get_id(None) == 'Top.encoder'
+    assert model.coder.encoder._get_id(None) == 'Top.coder.encoder'
+
+    assert model._find_training_nets()
+    assert model._training_nets['Top.encoder'] == ['net_a']
+    assert model._training_nets['Top.coder.encoder'] == ['net_b']
@@ -0,0 +1,119 @@
+'''Tests the model utilities.
+
+'''
+
+from types import SimpleNamespace
+
+import pytest
+import torch
+import torch.nn.functional as F
+
+from cortex.built_ins.models import utils
+
+
+def _reference_ssim(X_a, X_b, window_size=11, sigma=1.5, C1=0.01**2,
+                    C2=0.03**2):
+    channel = X_a.size(1)
+    x = torch.arange(window_size, dtype=X_a.dtype) - window_size // 2
+    gauss = torch.exp(-x ** 2 / (2 * sigma ** 2))
+    gauss = (gauss / gauss.sum()).unsqueeze(1)
+    window = gauss.mm(gauss.t()).expand(
+        channel, 1, window_size, window_size).contiguous()
+
+    def conv(X):
+        return F.conv2d(X, window, padding=window_size // 2, groups=channel)
+
+    mu1 = conv(X_a)
+    mu2 = conv(X_b)
+    sigma1_sq = conv(X_a * X_a) - mu1 ** 2
+    sigma2_sq = conv(X_b * X_b) - mu2 ** 2
+    sigma12 = conv(X_a * X_b) - mu1 * mu2
+    ssim_map = (((2 * mu1 * mu2 + C1) * (2 * sigma12 + C2)) /
+                ((mu1 ** 2 + mu2 ** 2 + C1) * (sigma1_sq + sigma2_sq + C2)))
+    return ssim_map.mean()
+
+
+def test_ssim():
+    torch.manual_seed(0)
+    X_a = torch.rand(4, 3, 32, 32)
+    X_b = (X_a + 0.1 * torch.randn_like(X_a)).clamp(0, 1)
+
+    assert utils.ssim(X_a, X_b).item() == pytest.approx(
+        _reference_ssim(X_a, X_b).item(), abs=1e-5)
+    assert utils.ssim(X_a, X_a).item() == pytest.approx(1., abs=1e-5)
+    assert utils.ssim(X_a, X_b, size_average=False).size() == (4,)
+
+    # The window is built once per configuration.
+    n_windows = len(utils._windows)
+    utils.ssim(X_b, X_a)
+    assert len(utils._windows) == n_windows
+    utils.ssim(X_a.double(), X_b.double())
+    assert len(utils._windows) == n_windows + 1
+
+
+def test_ms_ssim():
+    torch.manual_seed(0)
+    X_a = torch.rand(4, 1, 64, 64)
+    X_b = (X_a + 0.1 * torch.randn_like(X_a)).clamp(0, 1)
+
+    assert utils.ms_ssim(X_a, X_a).item() == pytest.approx(1., abs=1e-5)
+    value = utils.ms_ssim(X_a, X_b)
+    assert 0. < value.item() < 1.
+    assert utils.ms_ssim(X_a, X_b, size_average=False).size() == (4,)
+
+    # A single scale is SSIM.
+    assert utils.ms_ssim(X_a, X_b, weights=[1.]).item() == pytest.approx(
+        utils.ssim(X_a, X_b).item(), abs=1e-5)
+
+    # Noise mostly affects the finest scale.
+    assert value.item() > utils.ssim(X_a, X_b).item()
+
+    with torch.autocast(device_type='cpu', dtype=torch.bfloat16):
+        bf16_value = utils.ms_ssim(X_a, X_b.bfloat16())
+    assert bf16_value.dtype == torch.float32
+    assert bf16_value.item() == pytest.approx(value.item(), abs=1e-2)
+
+
+def test_metric_due():
+    model = SimpleNamespace(_train=True, data=SimpleNamespace(u=1))
+    assert utils.metric_due(model, 3)
+    assert not utils.metric_due(model, 0)
+    model.data.u = 2
+    assert not utils.metric_due(model, 3)
+    assert utils.metric_due(model)
+    model.data.u = 4
+    assert utils.metric_due(model, 3)
+
+    model._train = False
+    assert utils.metric_due(model, 0)
+
+
+def _reference_cross_correlation(X):
+    X_s = X / X.std(0)
+    X_m = X_s - X_s.mean(0)
+    b, dim = X_m.size()
+    return (X_m.unsqueeze(2).expand(b, dim, dim) *
+            X_m.unsqueeze(1).expand(b, dim, dim)).sum(0) / float(b)
+
+
+def test_cross_correlation():
+    torch.manual_seed(0)
+    X = torch.randn(64, 10)
+    X[:, 1] += X[:, 0]
+    reference = _reference_cross_correlation(X)
+
+    assert torch.allclose(utils.cross_correlation(X), reference, atol=1e-5)
+    assert torch.allclose(
+        utils.cross_correlation(X, remove_diagonal=True),
+        reference - torch.eye(10), atol=1e-5)
+
+    accumulator = utils.CrossCorrelation()
+    for X_ in X.split(10):
+        accumulator.update(X_ * 10 + 3)
+    assert torch.allclose(accumulator.compute(), reference, atol=1e-5)
+    assert torch.allclose(accumulator.compute(remove_diagonal=True),
+                          reference - torch.eye(10), atol=1e-5)
+
+    accumulator.reset()
+    with pytest.raises(ValueError):
+        accumulator.compute()
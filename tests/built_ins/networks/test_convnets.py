@@ -198,3 +198,17 @@ def test_simple_conv_encoder_forward(simple_conv_encoder_image_classification,
     assert input_dim == 4
     assert output_dim == 2
     assert not equivalent
+
+
+def test_channels_last(simple_conv_encoder_image_classification):
+    encoder = simple_conv_encoder_image_classification.eval()
+    X = torch.randn(4, 3, 32, 32)
+    Y = encoder(X)
+
+    encoder.to(memory_format=torch.channels_last)
+    X = X.contiguous(memory_format=torch.channels_last)
+    assert torch.allclose(encoder(X), Y, atol=1e-5)
+
+    # Flattening a channels_last map cannot be a view.
+    view = View(-1, 3 * 32 * 32)
+    assert torch.equal(view(X), X.contiguous().view(-1, 3 * 32 * 32))
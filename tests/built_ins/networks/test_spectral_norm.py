@@ -0,0 +1,68 @@
+'''Tests the spectral normalized layers.
+
+'''
+
+import copy
+import io
+
+import torch
+
+from cortex.built_ins.networks.SpectralNormLayer import (
+    SNConv2d, SNLinear, WarmStart)
+
+
+def test_normalized_weight():
+    torch.manual_seed(0)
+    layer = SNLinear(8, 4, n_power_iterations=WarmStart(n_init=50))
+    op = torch.optim.SGD(layer.parameters(), lr=0.1)
+    X = torch.randn(5, 8)
+
+    # Shared by the forwards of one step.
+    w_sn = layer.normalized_weight()
+    assert layer.normalized_weight() is w_sn
+    assert layer._n_updates == 1
+    sigma = torch.linalg.matrix_norm(w_sn.detach(), ord=2)
+    assert torch.allclose(sigma, torch.tensor(1.), atol=1e-4)
+
+    # Backward frees the graph, so the weight is recomputed.
+    layer(X).sum().backward()
+    layer(X).sum().backward()
+    assert layer._n_updates == 1
+
+    op.step()
+    assert layer.normalized_weight() is not w_sn
+    assert layer._n_updates == 2
+    assert layer.weight.grad is not None
+
+
+def test_eval():
+    torch.manual_seed(0)
+    layer = SNConv2d(3, 4, 3)
+    X = torch.randn(2, 3, 8, 8)
+    layer(X)
+    u = layer.u.clone()
+
+    layer.eval()
+    with torch.no_grad():
+        layer.weight.mul_(2.)
+        Y = layer(X)
+        assert torch.equal(layer(X), Y)
+        assert layer.normalized_weight() is layer.normalized_weight()
+        assert not layer.normalized_weight().requires_grad
+    assert torch.equal(layer.u, u)
+    assert layer._n_updates == 1
+
+    layer.train()
+    layer(X)
+    assert layer._n_updates == 2
+    assert not torch.equal(layer.u, u)
+
+
+def test_serialization():
+    layer = SNLinear(8, 4)
+    layer(torch.randn(5, 8))
+
+    buffer = io.BytesIO()
+    torch.save(layer, buffer)
+    copy.deepcopy(layer)
+    assert set(layer.state_dict().keys()) == set(['weight', 'bias', 'u'])
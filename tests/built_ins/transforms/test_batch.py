@@ -0,0 +1,67 @@
+'''Tests the batch transformations.
+
+'''
+
+import torch
+
+from cortex.built_ins.datasets.utils import build_batch_transforms
+from cortex.built_ins.transforms import batch
+
+
+def test_crop():
+    X = torch.randn(6, 3, 10, 12)
+    top = torch.tensor([0, 1, 2, 3, 4, 2])
+    left = torch.tensor([5, 4, 3, 2, 1, 0])
+
+    Y = batch.crop(X, top, left, (6, 7))
+    assert Y.size() == (6, 3, 6, 7)
+    for i in range(6):
+        t, l_ = top[i].item(), left[i].item()
+        assert torch.equal(Y[i], X[i, :, t:t + 6, l_:l_ + 7])
+
+
+def test_random_crop():
+    X = torch.randn(16, 3, 8, 8)
+    Y = batch.RandomCrop(8, padding=2)(X)
+    assert Y.size() == X.size()
+
+    Y = batch.RandomCrop((5, 6))(X)
+    assert Y.size() == (16, 3, 5, 6)
+
+
+def test_flip():
+    X = torch.randn(64, 2, 4, 5)
+    Y = batch.RandomHorizontalFlip()(X)
+
+    flipped = 0
+    for x, y in zip(X, Y):
+        if torch.equal(x, y.flip(2)) and not torch.equal(x, y):
+            flipped += 1
+        else:
+            assert torch.equal(x, y)
+    assert 0 < flipped < 64
+
+
+def test_random_resized_crop():
+    X = torch.randn(8, 3, 32, 32)
+    Y = batch.RandomResizedCrop(16)(X)
+    assert Y.size() == (8, 3, 16, 16)
+
+    # Full scale crops with no aspect ratio change are a plain resize.
+    Y = batch.RandomResizedCrop(32, scale=(1., 1.), ratio=(1., 1.))(X)
+    assert torch.allclose(Y, X, atol=1e-5)
+
+
+def test_build_batch_transforms():
+    X = torch.rand(4, 3, 32, 32)
+    transform = build_batch_transforms(
+        normalize=[(0.5, 0.5, 0.5), (0.5, 0.5, 0.5)], random_crop=28,
+        image_size=16, flip=True)
+
+    Y = transform(X)
+    assert Y.size() == (4, 3, 16, 16)
+    assert Y.min() >= -1 and Y.max() <= 1
+
+    transform = build_batch_transforms(
+        normalize=[(0.5, 0.5, 0.5), (0.5, 0.5, 0.5)])
+    assert torch.allclose(transform(X), X * 2 - 1)
@@ -0,0 +1,20 @@
+'''Tests the Sobel transformations.
+
+'''
+
+import torch
+
+from cortex.built_ins.transforms.sobel import BatchSobel, Sobel
+
+
+def test_batch_sobel():
+    X = torch.randn(5, 3, 9, 11)
+    sobel = Sobel()
+    batch_sobel = BatchSobel()
+
+    expected = torch.stack([sobel(x) for x in X])
+    assert torch.allclose(batch_sobel(X), expected, atol=1e-5)
+
+    X = X.double()
+    assert batch_sobel(X).dtype == torch.float64
+    assert len(batch_sobel._kernels) == 2
@@ -0,0 +1,351 @@
+'''Tests the data handler.
+
+'''
+
+import sys
+
+import torch
+from torch.utils.data import Dataset, TensorDataset
+
+from cortex._lib import data, models, run_bench_data
+from cortex._lib.data import bench, DataHandler
+from cortex._lib.parsing import parse_args
+from cortex._lib.data.tensor_loader import TensorLoader
+from cortex.plugins import DatasetPlugin
+
+
+class ListDataset(Dataset):
+    def __init__(self, N):
+        self.data = torch.arange(N * 2).float().view(N, 2)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, index):
+        return self.data[index], index
+
+
+def make_plugin(train_set, test_set, in_memory=False, source='test'):
+    class Plugin(DatasetPlugin):
+        sources = [source]
+
+    plugin = Plugin()
+    plugin.add_dataset('train', train_set)
+    plugin.add_dataset('test', test_set)
+    plugin.set_input_names(['inputs', 'index'])
+    plugin.set_in_memory(in_memory)
+    return plugin
+
+
+def make_handler(plugin, batch_size=8, seed=None, **kwargs):
+    handler = DataHandler()
+    handler.set_batch_size(batch_size)
+    handler.set_seed(seed)
+    handler.add_dataset('test', plugin, **kwargs)
+    return handler
+
+
+def epoch(handler, mode='train', n=None):
+    handler.reset(mode, make_pbar=False, epoch=n)
+    batches = []
+    try:
+        while True:
+            batches.append(handler.next())
+    except StopIteration:
+        pass
+    return batches
+
+
+def test_tensor_loader():
+    X = torch.arange(20).float()
+    loader = TensorLoader((X, X * 2), batch_size=6, shuffle=True)
+
+    assert len(loader) == 4
+    batches = list(loader)
+    assert [b[0].size(0) for b in batches] == [6, 6, 6, 2]
+
+    x = torch.cat([b[0] for b in batches])
+    assert sorted(x.tolist()) == X.tolist()
+    assert torch.equal(torch.cat([b[1] for b in batches]), x * 2)
+
+
+def test_tensor_dataset_fast_path():
+    X = torch.randn(30, 3)
+    index = torch.arange(30)
+    plugin = make_plugin(TensorDataset(X, index), TensorDataset(X, index))
+    handler = make_handler(plugin, n_workers=2)
+
+    assert isinstance(handler.loaders['test']['train'], TensorLoader)
+
+    batches = epoch(handler)
+    assert len(batches) == 4
+    idx = torch.cat([b['index'] for b in batches])
+    assert sorted(idx.tolist()) == list(range(30))
+    assert torch.equal(torch.cat([b['inputs'] for b in batches]), X[idx])
+
+
+def test_in_memory_flag():
+    plugin = make_plugin(ListDataset(20), ListDataset(12), in_memory=True)
+    handler = make_handler(plugin, n_workers=0, shuffle=False)
+
+    assert isinstance(handler.loaders['test']['test'], TensorLoader)
+
+    batches = epoch(handler, mode='test')
+    assert torch.equal(torch.cat([b['inputs'] for b in batches]),
+                       ListDataset(12).data)
+
+
+def test_batch_transform():
+    plugin = make_plugin(ListDataset(20), ListDataset(12))
+    plugin.set_batch_transform(lambda x: -x, mode='train', input_name='inputs')
+    handler = make_handler(plugin, n_workers=0, shuffle=False)
+
+    batches = epoch(handler, mode='train')
+    assert torch.equal(batches[0]['inputs'], -ListDataset(20).data[:8])
+
+    batches = epoch(handler, mode='test')
+    assert torch.equal(batches[0]['inputs'], ListDataset(12).data[:8])
+
+
+def test_dataloader_path():
+    plugin = make_plugin(ListDataset(20), ListDataset(12))
+    handler = make_handler(plugin, n_workers=0)
+
+    assert isinstance(handler.loaders['test']['train'],
+                      torch.utils.data.DataLoader)
+    assert len(epoch(handler)) == 3
+
+
+def test_persistent_workers():
+    plugin = make_plugin(ListDataset(20), ListDataset(12))
+    handler = make_handler(plugin, n_workers=1, seed=1)
+    loader = handler.loaders['test']['train']
+    assert loader.persistent_workers
+
+    first = epoch(handler, n=0)
+    workers = loader._iterator
+    epoch(handler, mode='test')
+    second = epoch(handler, n=1)
+
+    assert loader._iterator is workers
+    for batches in (first, second):
+        idx = torch.cat([b['index'] for b in batches])
+        assert sorted(idx.tolist()) == list(range(20))
+    assert [b['index'].tolist() for b in first] != \
+        [b['index'].tolist() for b in second]
+
+
+def test_viz_batch():
+    for in_memory in (False, True):
+        plugin = make_plugin(ListDataset(20), ListDataset(12),
+                             in_memory=in_memory)
+        handler = make_handler(plugin, n_workers=0)
+        viz = handler.set_viz_batch()
+        assert handler.batch is viz
+        assert handler.mode == 'test'
+        assert torch.equal(viz['inputs'], ListDataset(12).data[:8])
+        assert viz['index'].tolist() == list(range(8))
+        assert handler._iterators == {}
+
+
+def test_resume():
+    for in_memory in (False, True):
+        plugin = make_plugin(ListDataset(20), ListDataset(12),
+                             in_memory=in_memory)
+        handler = make_handler(plugin, n_workers=0, seed=3)
+        batches = epoch(handler, n=5)
+        assert [b['index'].tolist() for b in batches] != \
+            [b['index'].tolist() for b in epoch(handler, n=6)]
+
+        handler.reset('train', make_pbar=False, epoch=5)
+        handler.next()
+        handler.next()
+        state = handler.state_dict()
+        assert state['u'] == 1
+
+        handler = make_handler(plugin, n_workers=0, seed=4)
+        handler.load_state_dict(state)
+        handler.set_seed(None)
+        epoch(handler, mode='test')
+        resumed = epoch(handler, n=5)
+        assert [b['index'].tolist() for b in resumed] == \
+            [b['index'].tolist() for b in batches[1:]]
+
+
+def test_resume_completed_epoch():
+    plugin = make_plugin(ListDataset(20), ListDataset(12))
+    handler = make_handler(plugin, n_workers=0, seed=3)
+    epoch(handler, n=2)
+    # Saved at the end of an epoch, as the `last` checkpoint.
+    state = handler.state_dict()
+    assert state['mode'] is None and state['u'] == 0
+    epoch(handler, mode='test')
+    state = handler.state_dict()
+    assert state['mode'] is None and state['u'] == 0
+
+    # Older checkpoints saved the position of the completed test epoch.
+    for state in (state, dict(state, mode='test', u=2)):
+        handler = make_handler(plugin, n_workers=0)
+        handler.load_state_dict(state)
+        assert len(epoch(handler, n=2)) == 3
+        assert len(epoch(handler, mode='test')) == 2
+
+
+def test_checkpoint_every():
+    plugin = make_plugin(ListDataset(40), ListDataset(12))
+    handler = make_handler(plugin, batch_size=4, n_workers=0)
+
+    saved = []
+    handler.set_checkpoint(3, lambda: saved.append(handler.state_dict()['u']))
+    epoch(handler, n=0)
+    epoch(handler, mode='test')
+
+    assert saved == [3, 6, 9]
+
+
+def make_multi_source_handler(policy, shuffle=False):
+    handler = DataHandler()
+    handler.set_batch_size(8)
+    handler.set_seed(0)
+    handler.set_multi_source(policy)
+    for source, N in (('a', 20), ('b', 44)):
+        plugin = make_plugin(ListDataset(N), ListDataset(N), source=source)
+        handler.add_dataset(source, plugin, n_workers=0, shuffle=shuffle)
+    return handler
+
+
+def _indices(batches):
+    return [dict((k, v['index'].tolist()) for k, v in batch.items())
+            for batch in batches]
+
+
+def test_multi_source_shortest():
+    handler = make_multi_source_handler('shortest')
+
+    first = epoch(handler, n=0)
+    second = epoch(handler, n=1)
+    assert len(first) == len(second) == 3
+
+    # The longer source carries over to the next epoch.
+    b = torch.cat([batch['b']['index'] for batch in first + second])
+    assert b.tolist() == list(range(44))
+    a = torch.cat([batch['a']['index'] for batch in second])
+    assert a.tolist() == list(range(20))
+
+
+def test_multi_source_cycle():
+    handler = make_multi_source_handler('cycle')
+
+    batches = epoch(handler, n=0)
+    assert len(batches) == 6
+
+    a = torch.cat([batch['a']['index'] for batch in batches])
+    assert a.tolist() == list(range(20)) * 2
+
+
+def test_multi_source_proportional():
+    handler = make_multi_source_handler('proportional')
+
+    batches = epoch(handler, n=0)
+    assert len(batches) == 9
+    assert sum('a' in batch for batch in batches) == 3
+    assert sum('b' in batch for batch in batches) == 6
+    for batch in batches:
+        assert len(batch) == 1
+
+
+def test_bench(tmpdir):
+    plugin = make_plugin(ListDataset(40), ListDataset(12))
+    cache_path = str(tmpdir.join('bench.json'))
+    grid = dict(n_workers=(0, 1), prefetch=(2, 4), pin_memory=(False,))
+
+    best = bench.run('test', plugin, batch_size=8, n_batches=3, grid=grid,
+                     cache_path=cache_path)
+    results = bench.load_cache(cache_path).popitem()[1]['results']
+    # Prefetching is not swept without workers.
+    assert len(results) == 3
+    assert results[0]['samples_per_sec'] >= results[-1]['samples_per_sec']
+    assert best['samples_per_sec'] > 0
+
+    tuned = bench.get_tuned('test', 8, cache_path=cache_path)
+    assert tuned == dict((k, best[k]) for k in
+                         ('n_workers', 'prefetch', 'pin_memory'))
+    assert bench.get_tuned('test', 16, cache_path=cache_path) is None
+
+
+def test_bench_cli(tmpdir, monkeypatch):
+    class Plugin(DatasetPlugin):
+        sources = ['bench_cli']
+
+        def handle(self, source, copy_to_local=False, normalize=True):
+            self.add_dataset('train', TensorDataset(torch.rand(40, 2),
+                                                    torch.arange(40)))
+            self.set_input_names(['inputs', 'index'])
+
+    plugin = Plugin()
+    monkeypatch.setitem(data._PLUGINS, 'bench_cli', plugin)
+    monkeypatch.setattr(bench, 'CACHE_PATH', str(tmpdir.join('bench.json')))
+    # Unset arguments, such as the dict `data_args`, are parsed as None.
+    monkeypatch.setattr(sys, 'argv', ['cortex', 'bench-data', '--d.source',
+                                      'bench_cli', '--d.batch_size', '8',
+                                      '--n_batches', '2'])
+
+    args = parse_args(models.MODEL_PLUGINS)
+    assert args.command == 'bench-data'
+    assert getattr(args, 'data.data_args') is None
+    best = run_bench_data(args)
+    assert best['samples_per_sec'] > 0
+    assert bench.get_tuned('bench_cli', 8) is not None
+
+
+def test_noise_follows_batch_size():
+    plugin = make_plugin(ListDataset(20), ListDataset(12))
+    handler = make_handler(plugin, n_workers=0)
+    handler.add_noise('Z', dist='normal', size=3)
+
+    batches = epoch(handler)
+    assert [b['Z'].size() for b in batches] == [(8, 3), (8, 3), (4, 3)]
+
+    # A batch size set after the noise is added is served too.
+    handler.batch_size['train'] = 16
+    handler.loaders['test']['train'] = torch.utils.data.DataLoader(
+        ListDataset(20), batch_size=16)
+    batches = epoch(handler)
+    assert [b['Z'].size() for b in batches] == [(16, 3), (4, 3)]
+
+
+def test_memory_format():
+    images = torch.randn(12, 3, 4, 4)
+    plugin = make_plugin(TensorDataset(images, torch.arange(12)),
+                         TensorDataset(images, torch.arange(12)))
+    handler = make_handler(plugin, n_workers=0)
+    handler.set_memory_format(torch.channels_last)
+
+    batch = epoch(handler)[0]
+    assert batch['inputs'].is_contiguous(memory_format=torch.channels_last)
+    assert torch.equal(batch['inputs'], images[batch['index']])
+
+
+def test_multi_source_resume():
+    for policy in ('proportional', 'shortest', 'cycle'):
+        handler = make_multi_source_handler(policy, shuffle=True)
+        for n in range(2):
+            epoch(handler, n=n)
+        batches = epoch(handler, n=2)
+
+        # Interrupted after 2 batches of the third epoch.
+        handler = make_multi_source_handler(policy, shuffle=True)
+        saved = []
+        handler.set_checkpoint(2, lambda: saved.append(handler.state_dict()))
+        for n in range(2):
+            epoch(handler, n=n)
+        handler.reset('train', make_pbar=False, epoch=2)
+        for _ in range(3):
+            handler.next()
+        state = saved[-1]
+        assert state['epoch'] == 2 and state['u'] == 2
+
+        handler = make_multi_source_handler(policy, shuffle=True)
+        handler.load_state_dict(state)
+        resumed = epoch(handler, n=2)
+        assert _indices(resumed) == _indices(batches[2:])
@@ -0,0 +1,133 @@
+'''Tests staging of datasets to a local path.
+
+'''
+
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+
+import pytest
+
+from cortex._lib.data import local_copy
+
+
+def make_tree(root):
+    for i in range(5):
+        d = root.mkdir('class{}'.format(i))
+        for j in range(3):
+            d.join('{}.bin'.format(j)).write_binary(bytes([i, j]) * (j + 1))
+
+
+def test_copy_files(tmpdir):
+    src = tmpdir.mkdir('src')
+    make_tree(src)
+    dst = str(tmpdir.join('local', 'src'))
+
+    local_copy.copy_files(str(src), dst, n_threads=3)
+    assert local_copy.is_complete(dst)
+    assert local_copy.build_manifest(dst) == local_copy.build_manifest(
+        str(src))
+
+    # Simulate a copy killed part-way: no marker and a truncated file.
+    os.remove(local_copy.marker_path(dst))
+    truncated = os.path.join(dst, 'class1', '2.bin')
+    with open(truncated, 'wb') as f:
+        f.write(b'x')
+    untouched = os.path.join(dst, 'class0', '0.bin')
+    mtime_ns = os.stat(untouched).st_mtime_ns
+    assert not local_copy.is_complete(dst)
+
+    local_copy.copy_files(str(src), dst, checksum=True)
+    assert local_copy.is_complete(dst)
+    assert open(truncated, 'rb').read() == bytes([1, 2]) * 3
+    assert os.stat(untouched).st_mtime_ns == mtime_ns
+
+
+def test_copy_files_checksum(tmpdir, monkeypatch):
+    src = tmpdir.mkdir('src')
+    make_tree(src)
+    dst = str(tmpdir.join('local', 'src'))
+    copy_hashed = local_copy._copy_hashed
+    copied = []
+
+    def interrupted(src_file, dst_file):
+        if 'class3' in src_file:
+            raise KeyboardInterrupt
+        return copy_hashed(src_file, dst_file)
+
+    # Files copied before the interruption keep their hashes.
+    monkeypatch.setattr(local_copy, '_copy_hashed', interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        local_copy.copy_files(str(src), dst, n_threads=1, checksum=True)
+    assert not local_copy.is_complete(dst)
+    partial = local_copy._partial_path(dst)
+    assert os.path.join('class0', '0.bin') in json.load(open(partial))
+
+    # Corrupt a copied file without changing its size or modification time,
+    # and leave a corrupted partial copy.
+    corrupted = os.path.join(dst, 'class0', '1.bin')
+    stat = os.stat(corrupted)
+    with open(corrupted, 'wb') as f:
+        f.write(b'xxxx')
+    os.utime(corrupted, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    with open(os.path.join(dst, 'class3', '0.bin.part'), 'wb') as f:
+        f.write(b'x')
+
+    def recorded(src_file, dst_file):
+        copied.append(os.path.relpath(src_file, str(src)))
+        return copy_hashed(src_file, dst_file)
+
+    monkeypatch.setattr(local_copy, '_copy_hashed', recorded)
+    local_copy.copy_files(str(src), dst, n_threads=1, checksum=True)
+    assert local_copy.is_complete(dst)
+    assert not os.path.exists(partial)
+    assert open(corrupted, 'rb').read() == bytes([0, 1]) * 2
+    assert os.path.join('class0', '1.bin') in copied
+    assert os.path.join('class0', '0.bin') not in copied
+    assert open(os.path.join(dst, 'class3', '0.bin'), 'rb').read() == \
+        bytes([3, 0])
+    manifest = json.load(open(local_copy.marker_path(dst)))
+    assert len(manifest) == 15
+    assert all(len(entry) == 3 for entry in manifest.values())
+
+    # A file corrupted as it is written is not moved into place.
+    def corrupting(src_file, dst_file):
+        md5 = copy_hashed(src_file, dst_file)
+        with open(dst_file, 'ab') as f:
+            f.write(b'x')
+        return md5
+
+    monkeypatch.setattr(local_copy, '_copy_hashed', corrupting)
+    with pytest.raises(IOError):
+        local_copy.copy_files(str(src), str(tmpdir.join('other')),
+                              checksum=True)
+
+
+def test_pack_files(tmpdir):
+    src = tmpdir.mkdir('src')
+    make_tree(src)
+    pack = str(tmpdir.join('src.pack'))
+
+    local_copy.pack_files(str(src), pack)
+    assert local_copy.is_complete(pack)
+
+    files = local_copy.PackedFiles(pack)
+    assert len(files.names()) == 15
+    assert files.read(os.path.join('class3', '1.bin')) == bytes([3, 1]) * 2
+
+
+def test_bounded_map():
+    started = []
+    consumed = []
+
+    def fn(i):
+        started.append(i)
+        return i
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        for result in local_copy._bounded_map(executor, fn, range(20), 4):
+            # Calls are only submitted within the window of results not yet
+            # consumed.
+            assert len(started) - len(consumed) <= 4
+            consumed.append(result)
+    assert consumed == list(range(20))
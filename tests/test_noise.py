@@ -0,0 +1,60 @@
+'''Tests noise variables.
+
+'''
+
+import pytest
+import torch
+
+from cortex._lib.data.noise import _dist_dict, get_noise_var, NoiseSampler
+
+
+@pytest.mark.parametrize('dist', sorted(_dist_dict.keys()))
+def test_noise_var(dist):
+    var = get_noise_var(dist, (7, 3))
+    assert var.sample().size() == (7, 3)
+
+    sampler = NoiseSampler(dist, 3)
+    assert sampler.sample(5).size() == (5, 3)
+
+
+def test_noise_var_params():
+    var = get_noise_var('normal', (1000, 2), loc=[0., 10.], scale=0.1)
+    mean = var.sample().mean(0)
+    assert abs(mean[0]) < 0.1 and abs(mean[1] - 10.) < 0.1
+
+    var = get_noise_var('categorical', (4,), probs=[0., 0., 1.])
+    assert (var.sample() == 2).all()
+
+    with pytest.raises(NotImplementedError):
+        get_noise_var('foo', (4,))
+
+
+def test_noise_sampler():
+    sampler = NoiseSampler('uniform', 4, low=2., high=3.)
+    x = sampler.sample(16)
+    assert x.size() == (16, 4)
+    assert ((x >= 2.) & (x < 3.)).all()
+    assert sampler.sample(5).size() == (5, 4)
+    assert sampler.sample(32).size() == (32, 4)
+
+    sampler = NoiseSampler('normal', (2, 3), loc=1., scale=1e-6)
+    x = sampler.sample(3)
+    assert x.size() == (3, 2, 3)
+    assert torch.allclose(x, torch.ones_like(x))
+
+    # Counts failures, as the distribution does.
+    x = NoiseSampler('geometric', 1, probs=0.5).sample(1000)
+    assert x.min() == 0. and abs(x.mean() - 1.) < 0.2
+
+
+@pytest.mark.parametrize('dist', ['normal', 'categorical'])
+def test_noise_sampler_fresh(dist):
+    sampler = NoiseSampler(dist, 8)
+
+    # A kept sample is not overwritten by later draws.
+    x = sampler.sample(16)
+    x_ = x.clone()
+    y = sampler.sample(16)
+    sampler.sample(4)
+    assert torch.equal(x, x_)
+    assert not torch.equal(x, y)
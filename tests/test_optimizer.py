@@ -5,6 +5,8 @@
 import copy
 
 import numpy as np
+import pytest
+import torch
 
 from cortex._lib import optimizer
 
@@ -38,6 +40,37 @@ def test_clipping(model_with_submodel, clip=0.0001):
         assert -p.min() <= clip
 
 
+def test_clip_params():
+    params = [torch.randn(5, 3), torch.randn(7)]
+    expected = [p.clamp(-0.5, 0.5) for p in params]
+    optimizer.clip_params(params, 0.5)
+    for p, e in zip(params, expected):
+        assert torch.equal(p, e)
+
+
+def test_l1_decay(model_with_submodel):
+    params = [torch.randn(5, 3), torch.randn(7)]
+    expected = [p - 0.1 * p / p.norm(1) for p in params]
+    optimizer.l1_decay_params(params, 0.1)
+    for p, e in zip(params, expected):
+        assert torch.allclose(p, e)
+
+    model = model_with_submodel
+    model.build()
+    optimizer.setup(model, l1_decay=dict(net=0.1), optimizer='SGD',
+                    learning_rate=0.)
+    model.train_step()
+
+    net = [p.detach().clone() for p in model.nets.net.parameters()]
+    net2 = [p.detach().clone() for p in model.nets.net2.parameters()]
+    optimizer.OPTIMIZERS['net'].step()
+    optimizer.OPTIMIZERS['net2'].step()
+    for p, p_ in zip(model.nets.net.parameters(), net):
+        assert torch.allclose(p, p_ - 0.1 * p_ / p_.norm(1))
+    for p, p_ in zip(model.nets.net2.parameters(), net2):
+        assert torch.equal(p, p_)
+
+
 def test_gradient(model_with_submodel):
     model = model_with_submodel
     model.build()
@@ -67,3 +100,155 @@ def test_gradient(model_with_submodel):
         p2 = p2.data.numpy()
         g = g.data.numpy()
         assert np.allclose(p1, p2 - g)
+
+
+def test_accumulate():
+    net = torch.nn.Linear(3, 2)
+    p0 = copy.deepcopy(list(net.parameters()))
+    op = optimizer.wrap_optimizer(torch.optim.SGD)(
+        net.parameters(), lr=1.0, accumulate=2)
+
+    grads = []
+    for i in range(2):
+        grad = [torch.randn_like(p) for p in net.parameters()]
+        grads.append(grad)
+        for p, g in zip(net.parameters(), grad):
+            p.grad = g.clone()
+        op.step()
+        if i == 0:
+            # No update before `accumulate` steps.
+            for p, p_ in zip(net.parameters(), p0):
+                assert torch.equal(p, p_)
+
+    for p, p_, g1, g2 in zip(net.parameters(), p0, *grads):
+        assert torch.allclose(p, p_ - (g1 + g2) / 2)
+
+
+def test_accumulate_missing_grad():
+    net1 = torch.nn.Linear(3, 2)
+    net2 = torch.nn.Linear(3, 2)
+    op = optimizer.wrap_optimizer(torch.optim.SGD)(
+        list(net1.parameters()) + list(net2.parameters()), lr=1.0,
+        accumulate=2)
+
+    def step(nets):
+        grads = []
+        for net in (net1, net2):
+            for p in net.parameters():
+                grad = torch.randn_like(p)
+                p.grad = grad.clone() if net in nets else None
+                grads.append(grad)
+        op.step()
+        return grads
+
+    # `net2` gets no gradient on the last call of the first window.
+    p0 = copy.deepcopy(list(net2.parameters()))
+    grads = step((net1, net2))[2:]
+    step((net1,))
+    for p, p_, g in zip(net2.parameters(), p0, grads):
+        assert torch.allclose(p, p_ - g / 2)
+
+    # Nothing carries over to the next window.
+    p0 = copy.deepcopy(list(net2.parameters()))
+    step((net1,))
+    grads = step((net1, net2))[2:]
+    for p, p_, g in zip(net2.parameters(), p0, grads):
+        assert torch.allclose(p, p_ - g / 2)
+
+
+def test_accumulate_train_step(model_with_submodel):
+    model = model_with_submodel
+    model.build()
+
+    optimizer.setup(model, learning_rate=1.0, optimizer='SGD', accumulate=2)
+    parameters = copy.deepcopy(list(model.nets.net.parameters()))
+
+    model.train_step()
+    for p1, p2 in zip(model.nets.net.parameters(), parameters):
+        assert torch.equal(p1, p2)
+
+    model.train_step()
+    assert not all(torch.equal(p1, p2) for p1, p2 in
+                   zip(model.nets.net.parameters(), parameters))
+
+
+def test_backward_retain():
+    net1 = torch.nn.Linear(3, 2)
+    net2 = torch.nn.Linear(2, 1)
+    X = torch.randn(4, 3)
+
+    # The second loss shares the output of `net1` with the first.
+    h = net1(X).tanh()
+    losses = [h.sum(), net2(h).sum()]
+    optimizer.backward(losses)
+    with pytest.raises(RuntimeError):
+        losses[1].backward()
+
+    # Independent losses: no graph is retained.
+    losses = [net1(X).tanh().sum(), net2(X[:, :2]).tanh().sum()]
+    optimizer.backward(losses)
+    with pytest.raises(RuntimeError):
+        losses[0].backward()
+
+
+def test_joint_backward():
+    net1 = torch.nn.Linear(3, 2)
+    net2 = torch.nn.Linear(3, 2)
+    X = torch.randn(4, 3)
+
+    def grads(joint):
+        for p in list(net1.parameters()) + list(net2.parameters()):
+            p.grad = None
+        h = X.exp()
+        optimizer.backward([net1(h).tanh().sum(), net2(h).sigmoid().sum()],
+                           joint=joint)
+        return [p.grad.clone()
+                for p in list(net1.parameters()) + list(net2.parameters())]
+
+    for g1, g2 in zip(grads(False), grads(True)):
+        assert torch.allclose(g1, g2)
+
+
+def test_impl(model_with_submodel):
+    model = model_with_submodel
+    model.build()
+
+    optimizer.setup(model, optimizer='Adam', impl='fused')
+    assert optimizer.OPTIMIZERS['net'].defaults['fused']
+
+    # RMSprop has no fused implementation.
+    optimizer.setup(model, optimizer='RMSprop', impl='fused',
+                    optimizer_options=dict(alpha=0.9))
+    assert optimizer.OPTIMIZERS['net'].defaults['foreach']
+
+    with pytest.raises(ValueError):
+        optimizer.setup(model, impl='vectorized')
+
+    optimizer.setup(model, optimizer='SGD', impl='foreach')
+    assert optimizer.OPTIMIZERS['net'].defaults['foreach']
+    model._reset_epoch()
+    model.train_step()
+    times = model._all_epoch_times
+    assert len(times['net_step']) == 1 and len(times['net2_step']) == 1
+
+
+def test_reload_state(model_with_submodel):
+    model = model_with_submodel
+    model.build()
+
+    optimizer.setup(model, optimizer='Adam', learning_rate=0.01)
+    model.train_step()
+    state = dict((k, op.state_dict())
+                 for k, op in optimizer.OPTIMIZERS.items())
+    exp_avg = optimizer.OPTIMIZERS['net'].state_dict()['state'][0]['exp_avg']
+
+    optimizer.load_state_dict(state)
+    optimizer.setup(model, optimizer='Adam', learning_rate=0.001)
+    op = optimizer.OPTIMIZERS['net']
+    assert torch.equal(op.state_dict()['state'][0]['exp_avg'], exp_avg)
+    # Hyperparameters are as configured.
+    assert op.param_groups[0]['lr'] == 0.001
+
+    # Only loaded once, and checkpoints without states are fine.
+    optimizer.setup(model, optimizer='Adam')
+    assert len(optimizer.OPTIMIZERS['net'].state) == 0
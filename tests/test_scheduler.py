@@ -0,0 +1,114 @@
+'''Tests the learning rate schedulers.
+
+'''
+
+import pytest
+import torch
+
+from cortex._lib import optimizer, scheduler
+
+
+def _optimizer(lr=1.):
+    op = optimizer.wrap_optimizer(torch.optim.SGD)
+    return op([torch.nn.Parameter(torch.zeros(3))], lr=lr)
+
+
+def _lr(op):
+    return op.param_groups[0]['lr']
+
+
+def test_build():
+    op = _optimizer()
+    s = scheduler.build(op, 'warmup', dict(warmup=4, interval='step'))
+    lrs = []
+    for _ in range(5):
+        lrs.append(_lr(op))
+        op.step()
+        s.step()
+    assert lrs == [0.25, 0.5, 0.75, 1., 1.]
+
+    op = _optimizer()
+    s = scheduler.build(op, 'cosine', dict(warmup=2), epochs=12)
+    for _ in range(2):
+        op.step()
+        s.step()
+    assert _lr(op) == pytest.approx(1.)
+    for _ in range(10):
+        op.step()
+        s.step()
+    assert _lr(op) == pytest.approx(0.)
+
+    op = _optimizer()
+    s = scheduler.build(op, 'step', dict(step_size=2, gamma=0.5))
+    for _ in range(4):
+        op.step()
+        s.step()
+    assert _lr(op) == pytest.approx(0.25)
+
+    with pytest.raises(ValueError):
+        scheduler.build(_optimizer(), 'cosine', dict(interval='step'))
+    with pytest.raises(ValueError):
+        scheduler.build(_optimizer(), 'plateau')
+    with pytest.raises(NotImplementedError):
+        scheduler.build(_optimizer(), 'exponential')
+    with pytest.raises(ValueError, match='on'):
+        scheduler.build(_optimizer(), 'plateau', dict(key='loss', on='val'))
+    with pytest.raises(ValueError, match='step_size'):
+        scheduler.build(_optimizer(), 'step', dict(stepsize=2))
+
+
+def test_setup_and_step(model_with_submodel):
+    model = model_with_submodel
+    model.build()
+
+    optimizer.setup(
+        model, optimizer='SGD', learning_rate=1.,
+        scheduler=dict(net='one_cycle', net2='plateau'),
+        scheduler_options=dict(
+            interval='step', T_max=10,
+            net2=dict(key='losses.net2', factor=0.5, patience=0)))
+
+    assert set(scheduler.SCHEDULERS.keys()) == set(['net', 'net2'])
+    assert scheduler.SCHEDULERS['net'].interval == 'step'
+    assert scheduler.SCHEDULERS['net2'].interval == 'epoch'
+
+    # Stepped with the optimizer.
+    lr = _lr(optimizer.OPTIMIZERS['net'])
+    model.train_step()
+    assert _lr(optimizer.OPTIMIZERS['net']) > lr
+
+    scheduler.step_epoch(test_results=dict(losses=dict(net2=1.)))
+    scheduler.step_epoch(test_results=dict(losses=dict(net2=2.)))
+    assert _lr(optimizer.OPTIMIZERS['net2']) == pytest.approx(0.5)
+
+
+def test_state(model_with_submodel):
+    model = model_with_submodel
+    model.build()
+
+    optimizer.setup(model, optimizer='SGD', learning_rate=1.,
+                    scheduler='step', scheduler_options=dict(step_size=1))
+    scheduler.step_epoch()
+    scheduler.step_epoch()
+    state = scheduler.state_dict()
+
+    scheduler.load_state_dict(state)
+    optimizer.setup(model, optimizer='SGD', learning_rate=1.,
+                    scheduler='step', scheduler_options=dict(step_size=1))
+    assert scheduler.SCHEDULERS['net'].last_epoch == 2
+    assert _lr(optimizer.OPTIMIZERS['net']) == pytest.approx(0.01)
+    scheduler.step_epoch()
+    assert scheduler.SCHEDULERS['net'].last_epoch == 3
+
+
+def test_setup_unknown_keys(model_with_submodel):
+    model = model_with_submodel
+    model.build()
+
+    with pytest.raises(ValueError, match='net2'):
+        optimizer.setup(model, optimizer='SGD', learning_rate=1.,
+                        scheduler='step',
+                        scheduler_options=dict(net3=dict(step_size=1)))
+    with pytest.raises(ValueError, match='net2'):
+        optimizer.setup(model, optimizer='SGD', learning_rate=1.,
+                        scheduler=dict(net='step', net3='step'))
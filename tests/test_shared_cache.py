@@ -0,0 +1,54 @@
+'''Tests the host-level shared array cache.
+
+'''
+
+import multiprocessing
+import os
+
+import numpy as np
+
+from cortex._lib.data.shared_cache import SharedArrayCache
+
+
+def _attach(root, queue):
+    cache = SharedArrayCache(root)
+    built = []
+    arrays = cache.get('data', lambda: built.append(1) or {})
+    queue.put((built, arrays['x'].sum().item(), cache.n_refs('data')))
+    cache.release('data')
+
+
+def test_shared_cache(tmpdir):
+    root = str(tmpdir.join('cache'))
+    cache = SharedArrayCache(root)
+    x = np.arange(12).reshape(3, 4)
+
+    arrays = cache.get('data', lambda: dict(x=x, y=x * 2))
+    assert isinstance(arrays['x'], np.memmap)
+    assert not arrays['x'].flags.writeable
+    assert np.array_equal(arrays['y'], x * 2)
+    assert cache.n_refs('data') == 1
+
+    ctx = multiprocessing.get_context('fork')
+    queue = ctx.Queue()
+    p = ctx.Process(target=_attach, args=(root, queue))
+    p.start()
+    built, total, n_refs = queue.get(timeout=10)
+    p.join()
+    assert built == [] and total == x.sum() and n_refs == 2
+    assert cache.n_refs('data') == 1
+
+    cache.release('data')
+    assert not os.path.exists(cache.entry_path('data'))
+
+
+def test_stale_refs(tmpdir):
+    cache = SharedArrayCache(str(tmpdir))
+    cache.get('data', lambda: dict(x=np.zeros(3)))
+    refs = os.path.join(cache.entry_path('data'), 'refs')
+    # A process that died without detaching.
+    open(os.path.join(refs, str(2 ** 22 + 1)), 'w').close()
+    assert cache.n_refs('data') == 1
+
+    cache.release('data')
+    assert not os.path.exists(cache.entry_path('data'))